@@ -0,0 +1,134 @@
+import os
+import logging
+from typing import List, Optional
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+# Sessions smaller than this are searched exactly
+LOCAL_ANN_MIN_VECTORS = int(os.getenv("LOCAL_ANN_MIN_VECTORS", 20000))
+# Number of coarse clusters (0 picks about 2 * sqrt(n))
+LOCAL_ANN_NLIST = int(os.getenv("LOCAL_ANN_NLIST", 0))
+# Number of clusters scanned per query: higher means better recall, slower queries
+LOCAL_ANN_NPROBE = int(os.getenv("LOCAL_ANN_NPROBE", 16))
+
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLES_PER_CLUSTER = 32
+# Retrain once the index has grown this many times beyond its training size
+RETRAIN_GROWTH_FACTOR = 4
+
+def default_nlist(count: int) -> int:
+    """Pick the number of clusters for a collection of count vectors"""
+    if LOCAL_ANN_NLIST > 0:
+        return LOCAL_ANN_NLIST
+    return int(max(1, min(count // 39, 2 * np.sqrt(count))))
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    nlist: int,
+    iterations: int = KMEANS_ITERATIONS,
+    seed: int = 0
+) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity and return unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLES_PER_CLUSTER)
+    sample = vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+
+        # Re-seed empty clusters with random sample points
+        empty = norms[:, 0] == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            norms[empty] = np.linalg.norm(sums[empty], axis=1, keepdims=True)
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+class IVFIndex:
+    """Inverted-file ANN index over the rows of a session's vector matrix
+
+    Vectors are assigned to their nearest k-means centroid. A query scores the
+    centroids, scans the rows of the nprobe closest clusters and re-scores
+    them exactly, so recall/latency are traded off with nprobe.
+    """
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = LOCAL_ANN_NPROBE):
+        self.centroids = centroids.astype(np.float32)
+        self.nprobe = nprobe
+        self.trained_count = 0
+        self.assignments = np.empty(0, dtype=np.int32)
+        self._lists: List[List[int]] = [[] for _ in range(len(centroids))]
+        self._list_arrays: Optional[List[np.ndarray]] = None
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def count(self) -> int:
+        return len(self.assignments)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: Optional[int] = None, nprobe: int = LOCAL_ANN_NPROBE) -> "IVFIndex":
+        """Train centroids on vectors and index all of them"""
+        nlist = min(nlist or default_nlist(len(vectors)), len(vectors))
+        index = cls(spherical_kmeans(vectors, nlist), nprobe)
+        index.trained_count = len(vectors)
+        index.add(vectors)
+        logger.info(f"Built IVF index with {nlist} lists over {len(vectors)} vectors")
+        return index
+
+    def needs_retraining(self) -> bool:
+        return self.count > self.trained_count * RETRAIN_GROWTH_FACTOR
+
+    def add(self, vectors: np.ndarray) -> None:
+        """Assign new rows (appended after the existing ones) to their clusters"""
+        if len(vectors) == 0:
+            return
+        assignments = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+        start = self.count
+        for offset, list_id in enumerate(assignments):
+            self._lists[list_id].append(start + offset)
+        self.assignments = np.concatenate([self.assignments, assignments])
+        self._list_arrays = None
+
+    def probe(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Return the rows of the nprobe clusters closest to the query"""
+        if self._list_arrays is None:
+            self._list_arrays = [np.asarray(rows, dtype=np.int64) for rows in self._lists]
+
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self._list_arrays[list_id] for list_id in probes])
+
+    def save(self, path: str) -> None:
+        """Save centroids and row assignments"""
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                assignments=self.assignments,
+                trained_count=np.array(self.trained_count)
+            )
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = LOCAL_ANN_NPROBE) -> "IVFIndex":
+        """Load an index saved with save()"""
+        with np.load(path) as data:
+            index = cls(data["centroids"], nprobe)
+            index.trained_count = int(data["trained_count"])
+            index.assignments = data["assignments"].astype(np.int32)
+        for row, list_id in enumerate(index.assignments):
+            index._lists[list_id].append(row)
+        return index
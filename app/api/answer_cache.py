@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity between questions for a cached answer to be reused
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_MAX_ENTRIES_PER_SCOPE = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES_PER_SCOPE", 200))
+SEMANTIC_CACHE_MAX_SCOPES = int(os.getenv("SEMANTIC_CACHE_MAX_SCOPES", 1000))
+
+EXACT_CACHE_ENABLED = os.getenv("EXACT_CACHE_ENABLED", "true").lower() == "true"
+EXACT_CACHE_MAX_ENTRIES = int(os.getenv("EXACT_CACHE_MAX_ENTRIES", 2000))
+EXACT_CACHE_TTL_SECONDS = float(os.getenv("EXACT_CACHE_TTL_SECONDS", 3600))
+# Optional SQLite file shared by replicas; leave empty to cache in memory only
+EXACT_CACHE_PATH = os.getenv("EXACT_CACHE_PATH", "")
+# How often expired rows are deleted from the SQLite tier
+EXACT_CACHE_PRUNE_INTERVAL_SECONDS = float(os.getenv("EXACT_CACHE_PRUNE_INTERVAL_SECONDS", 300))
+
+class _ScopeEntries:
+    """Cached answers for one scope (a session or a shared corpus)"""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.vectors: Optional[np.ndarray] = None
+        self.entries: List[Dict[str, Any]] = []
+
+class SemanticAnswerCache:
+    """Reuses answers for questions that are near-duplicates of earlier ones
+
+    Answers are grouped by scope. Each scope has a document version; bumping
+    it with invalidate() drops every answer computed against the old documents.
+    Both the number of scopes and the entries per scope are bounded (LRU).
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries_per_scope: int = SEMANTIC_CACHE_MAX_ENTRIES_PER_SCOPE,
+        max_scopes: int = SEMANTIC_CACHE_MAX_SCOPES,
+        enabled: bool = SEMANTIC_CACHE_ENABLED
+    ):
+        self.threshold = threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self.max_scopes = max_scopes
+        self.enabled = enabled
+        self._scopes: "OrderedDict[str, _ScopeEntries]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def version(self, scope: str) -> int:
+        """Current document version of a scope"""
+        with self._lock:
+            return self._versions.get(scope, 0)
+
+    def lookup(self, scope: str, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Find a cached answer for a question embedding
+
+        Returns:
+            Dict with "answer", "sources", "question" and "similarity", or None
+        """
+        if not self.enabled:
+            return None
+        query = _unit(embedding)
+        with self._lock:
+            cached = self._scopes.get(scope)
+            if cached is None or cached.vectors is None:
+                self.misses += 1
+                return None
+
+            similarities = cached.vectors @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._scopes.move_to_end(scope)
+            entry = cached.entries[best]
+            entry["last_used"] = time.monotonic()
+            self.hits += 1
+            return {**entry["value"], "question": entry["question"], "similarity": float(similarities[best])}
+
+    def store(
+        self,
+        scope: str,
+        question: str,
+        embedding: List[float],
+        answer: str,
+        sources: List[Dict[str, Any]],
+        version: Optional[int] = None
+    ) -> None:
+        """Cache an answer
+
+        Args:
+            version: Scope version read before the answer was computed; the
+                answer is dropped if the scope's documents changed since then
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            current_version = self._versions.get(scope, 0)
+            if version is not None and version != current_version:
+                return
+
+            cached = self._scopes.get(scope)
+            if cached is None or cached.version != current_version:
+                cached = _ScopeEntries(current_version)
+                self._scopes[scope] = cached
+            self._scopes.move_to_end(scope)
+
+            entry = {
+                "question": question,
+                "value": {"answer": answer, "sources": sources},
+                "last_used": time.monotonic()
+            }
+            vector = _unit(embedding).reshape(1, -1)
+            if len(cached.entries) >= self.max_entries_per_scope:
+                # Replace the least recently used entry
+                oldest = min(range(len(cached.entries)), key=lambda i: cached.entries[i]["last_used"])
+                cached.entries[oldest] = entry
+                cached.vectors[oldest] = vector[0]
+                self.evictions += 1
+            else:
+                cached.entries.append(entry)
+                cached.vectors = vector if cached.vectors is None else np.vstack([cached.vectors, vector])
+
+            while len(self._scopes) > self.max_scopes:
+                _, dropped = self._scopes.popitem(last=False)
+                self.evictions += len(dropped.entries)
+
+    def invalidate(self, scope: str) -> None:
+        """Drop every answer for a scope because its documents changed"""
+        with self._lock:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+            if self._scopes.pop(scope, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters"""
+        return {
+            "scopes": len(self._scopes),
+            "entries": sum(len(cached.entries) for cached in self._scopes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+class ExactAnswerCache:
+    """Reuses answers for exactly repeated requests
+
+    The key covers everything the answer depends on: the normalized question,
+    the ids of the retrieved context chunks in order, the model and a digest
+    of the conversation history. Chunk ids change whenever documents are
+    re-ingested, so a hit can never return an answer built from other inputs.
+    Entries expire after ttl_seconds and the memory tier is an LRU of
+    max_entries; an optional SQLite tier can be shared by several replicas.
+    Expired rows are ignored on read and deleted every prune_interval seconds.
+    get() and put() may touch SQLite, so coroutines call them through run_io.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = EXACT_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = EXACT_CACHE_TTL_SECONDS,
+        path: Optional[str] = EXACT_CACHE_PATH,
+        enabled: bool = EXACT_CACHE_ENABLED,
+        prune_interval: float = EXACT_CACHE_PRUNE_INTERVAL_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path or None
+        self.enabled = enabled
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.path and self.enabled:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = sqlite3.connect(self.path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Exact answer cache disk tier disabled, could not open {self.path}: {str(e)}")
+                self._db = None
+
+    @staticmethod
+    def key(
+        question: str,
+        context_chunks: List[Dict[str, Any]],
+        model: str,
+        history: List[Dict[str, str]]
+    ) -> str:
+        """Build the cache key for a question asked with the given context, model and history"""
+        normalized = " ".join(question.casefold().split())
+        chunk_ids = [
+            chunk.get("id") or hashlib.sha256(chunk["text"].encode("utf-8")).hexdigest()
+            for chunk in context_chunks
+        ]
+        history_digest = hashlib.sha256(json.dumps(history, sort_keys=True).encode("utf-8")).hexdigest()
+        payload = json.dumps([normalized, chunk_ids, model, history_digest])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached {"answer", "sources"} for a key, or None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and cached[0] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return cached[1]
+            if cached is not None:
+                del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT value, expires_at FROM answers WHERE key = ? AND expires_at > ?", (key, now)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.error(f"Error reading from exact answer cache: {str(e)}")
+                    row = None
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, answer: str, sources: List[Dict[str, Any]]) -> None:
+        """Cache an answer under a key"""
+        if not self.enabled:
+            return
+        value = {"answer": answer, "sources": sources}
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO answers (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires_at)
+                    )
+                    now = time.time()
+                    if now - self._last_prune >= self.prune_interval:
+                        self._db.execute("DELETE FROM answers WHERE expires_at <= ?", (now,))
+                        self._last_prune = now
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Error writing to exact answer cache: {str(e)}")
+
+    def _remember(self, key: str, expires_at: float, value: Dict[str, Any]) -> None:
+        """Insert into the memory tier, evicting the least recently used entries"""
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters"""
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+def _unit(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+# Shared caches used by main
+semantic_answer_cache = SemanticAnswerCache()
+exact_answer_cache = ExactAnswerCache()
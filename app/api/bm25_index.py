@@ -0,0 +1,222 @@
+import os
+import re
+import json
+import math
+import shutil
+import hashlib
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+# Set to an empty string to keep the lexical index in memory only
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "data/bm25")
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+
+CHUNKS_FILE = "chunks.jsonl"
+
+# Identifiers like "ERR-404", "v2.3.1" or "part_no_77" are kept whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[\-_.:/][a-z0-9]+)*")
+SUBTOKEN_PATTERN = re.compile(r"[\-_.:/]")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in is it its of on or "
+    "so that the their there these this to was were what when where which who why will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase terms, keeping compound identifiers and their parts"""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        parts = SUBTOKEN_PATTERN.split(token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part and part not in STOPWORDS)
+            # Also match the identifier written without separators ("err404")
+            terms.append("".join(parts))
+    return terms
+
+class SessionBM25:
+    """Inverted index with BM25 scoring over one session's chunks"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.total_length = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Index new chunks"""
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            doc = len(self.ids)
+            terms = Counter(tokenize(text))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[doc] = frequency
+            length = sum(terms.values())
+            self.ids.append(chunk_id)
+            self.texts.append(text)
+            self.metadatas.append(metadata)
+            self.lengths.append(length)
+            self.total_length += length
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """Return (document, score) pairs for the top_k BM25 matches, best first"""
+        if not self.ids:
+            return []
+        average_length = self.total_length / len(self.ids) or 1.0
+        scores: Dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.ids) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, frequency in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / average_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+
+class BM25Index:
+    """Per-session lexical indexes, persisted as append-only chunk logs and rebuilt lazily"""
+
+    def __init__(self, path: Optional[str] = BM25_INDEX_PATH):
+        self.path = path or None
+        self._sessions: Dict[str, SessionBM25] = {}
+        self._lock = threading.RLock()
+
+    def _session_file(self, session_id: str) -> str:
+        digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest, CHUNKS_FILE)
+
+    def _get_session(self, session_id: str, create: bool = False) -> Optional[SessionBM25]:
+        with self._lock:
+            index = self._sessions.get(session_id)
+            if index is None and self.path and os.path.exists(self._session_file(session_id)):
+                index = self._load_session(session_id)
+            if index is None and create:
+                index = SessionBM25()
+            if index is not None:
+                self._sessions[session_id] = index
+            return index
+
+    def add(self, session_id: str, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Index chunks for a session"""
+        if not ids:
+            return
+        with self._lock:
+            self._get_session(session_id, create=True).add(ids, texts, metadatas)
+            if self.path:
+                path = self._session_file(session_id)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                        f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata}) + "\n")
+
+    def search(self, session_id: str, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """Return the top_k lexical matches of a session"""
+        with self._lock:
+            index = self._get_session(session_id)
+            if index is None:
+                return []
+            return [
+                {
+                    "id": index.ids[doc],
+                    "text": index.texts[doc],
+                    "metadata": dict(index.metadatas[doc]),
+                    "score": score
+                }
+                for doc, score in index.search(query, top_k)
+            ]
+
+    def chunks(self, session_id: str) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        """Ids, texts and metadata of a session's indexed chunks"""
+        with self._lock:
+            index = self._get_session(session_id)
+            if index is None:
+                return [], [], []
+            return list(index.ids), list(index.texts), [dict(metadata) for metadata in index.metadatas]
+
+    def remove(self, session_id: str, chunk_ids: List[str]) -> None:
+        """Remove chunks from a session's lexical index (rebuilds the session)"""
+        with self._lock:
+            index = self._get_session(session_id)
+            if index is None:
+                return
+            doomed = set(chunk_ids)
+            keep = [doc for doc, chunk_id in enumerate(index.ids) if chunk_id not in doomed]
+            if len(keep) == index.count:
+                return
+
+            rebuilt = SessionBM25()
+            rebuilt.add(
+                [index.ids[doc] for doc in keep],
+                [index.texts[doc] for doc in keep],
+                [index.metadatas[doc] for doc in keep]
+            )
+            self._sessions[session_id] = rebuilt
+            if self.path:
+                path = self._session_file(session_id)
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    for chunk_id, text, metadata in zip(rebuilt.ids, rebuilt.texts, rebuilt.metadatas):
+                        f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata}) + "\n")
+                os.replace(path + ".tmp", path)
+
+    def drop_session(self, session_id: str) -> None:
+        """Forget a session's lexical index"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self.path:
+                shutil.rmtree(os.path.dirname(self._session_file(session_id)), ignore_errors=True)
+
+    def _load_session(self, session_id: str) -> Optional[SessionBM25]:
+        index = SessionBM25()
+        try:
+            with open(self._session_file(session_id), "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        chunk = json.loads(line)
+                        index.add([chunk["id"]], [chunk["text"]], [chunk["metadata"]])
+            return index
+        except Exception as e:
+            logger.error(f"Error loading lexical index for session {session_id}: {str(e)}")
+            return None
+
+def _is_empty(value: Any) -> bool:
+    return value is None or (isinstance(value, (str, list, dict)) and not value)
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """Merge ranked result lists by reciprocal rank, deduplicating on chunk id
+
+    A fused result takes each field from the first occurrence where it is
+    non-empty (a vector hit without its text gets the lexical hit's). Its
+    "score" is the RRF score, since the retrievers' own scores are on
+    different scales; results are ordered by it, best first.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            key = result.get("id") or result["text"]
+            merged = fused.setdefault(key, {"score": 0.0})
+            for field, value in result.items():
+                if field != "score" and _is_empty(merged.get(field)):
+                    merged[field] = value
+            merged["score"] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda result: -result["score"])
+
+# Shared lexical index used by vector_store
+bm25_index = BM25Index()
@@ -0,0 +1,153 @@
+import os
+import re
+import logging
+import threading
+from typing import Any, Dict, List
+from dotenv import load_dotenv
+from app.utils.helpers import estimate_tokens, CHARS_PER_TOKEN
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+# Upper bound on the estimated tokens of a prompt (instructions, history, context and question)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 6000))
+# Share of what's left after the instructions and question that history may use; context gets the rest
+PROMPT_HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", 0.25))
+
+# Chunks are only cut down if at least this many tokens of them still fit
+MIN_CHUNK_TOKENS = 64
+# Separator and role-prefix overhead of each packed chunk or message
+ITEM_OVERHEAD_TOKENS = 2
+
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s")
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens, at the last sentence (or else word) boundary that fits"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    window = text[:max(0, max_tokens) * CHARS_PER_TOKEN]
+    ends = [match.end() for match in SENTENCE_END.finditer(window)]
+    if ends:
+        return window[:ends[-1]].rstrip()
+    space = window.rfind(" ")
+    return (window[:space] if space > 0 else window).rstrip()
+
+def pack_history(history: List[Dict[str, str]], budget: int) -> List[Dict[str, str]]:
+    """Keep the most recent messages that fit in budget, oldest first
+
+    Whole messages are kept; only the newest message is truncated if it alone
+    is over budget.
+    """
+    packed: List[Dict[str, str]] = []
+    remaining = budget
+    for message in reversed(history):
+        tokens = estimate_tokens(message["content"]) + ITEM_OVERHEAD_TOKENS
+        if tokens > remaining:
+            if not packed and remaining - ITEM_OVERHEAD_TOKENS >= MIN_CHUNK_TOKENS:
+                content = truncate_to_tokens(message["content"], remaining - ITEM_OVERHEAD_TOKENS)
+                packed.append({**message, "content": content})
+            break
+        packed.append(message)
+        remaining -= tokens
+    return list(reversed(packed))
+
+def pack_context(chunks: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+    """Fill budget with chunks greedily, best first
+
+    Chunks that fit are kept whole. The first chunk that doesn't fit is cut at
+    a sentence boundary if enough of it fits to be useful, and packing stops.
+    """
+    packed: List[Dict[str, Any]] = []
+    remaining = budget
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk["text"]) + ITEM_OVERHEAD_TOKENS
+        if tokens <= remaining:
+            packed.append(chunk)
+            remaining -= tokens
+            continue
+        if remaining - ITEM_OVERHEAD_TOKENS >= MIN_CHUNK_TOKENS:
+            text = truncate_to_tokens(chunk["text"], remaining - ITEM_OVERHEAD_TOKENS)
+            if text:
+                packed.append({**chunk, "text": text})
+        break
+    return packed
+
+def pack_prompt(
+    instructions: str,
+    question: str,
+    chunks: List[Dict[str, Any]],
+    history: List[Dict[str, str]],
+    budget: int = PROMPT_TOKEN_BUDGET,
+    history_share: float = PROMPT_HISTORY_SHARE
+) -> Dict[str, Any]:
+    """Choose the history and context that fit a prompt's token budget
+
+    The instructions and question are always included. History may use up to
+    history_share of the remaining budget, and whatever it leaves unused goes
+    to the context.
+
+    Args:
+        instructions: System prompt without the context
+        question: The question being asked
+        chunks: Retrieved context chunks, best first
+        history: Conversation history, oldest first
+        budget: Token budget for the whole prompt
+        history_share: Share of the remaining budget available to history
+
+    Returns:
+        Dict with the packed "history" and "context_chunks", and the estimated
+        tokens per section under "usage"
+    """
+    fixed = estimate_tokens(instructions) + estimate_tokens(question) + ITEM_OVERHEAD_TOKENS
+    available = max(0, budget - fixed)
+
+    packed_history = pack_history(history, int(available * history_share))
+    history_tokens = sum(estimate_tokens(message["content"]) + ITEM_OVERHEAD_TOKENS for message in packed_history)
+
+    packed_chunks = pack_context(chunks, available - history_tokens)
+    context_tokens = sum(estimate_tokens(chunk["text"]) + ITEM_OVERHEAD_TOKENS for chunk in packed_chunks)
+
+    usage = {
+        "instructions": estimate_tokens(instructions),
+        "question": estimate_tokens(question),
+        "history": history_tokens,
+        "context": context_tokens,
+        "total": fixed + history_tokens + context_tokens,
+        "budget": budget,
+        "history_messages": f"{len(packed_history)}/{len(history)}",
+        "context_chunks": f"{len(packed_chunks)}/{len(chunks)}"
+    }
+    prompt_usage.record(usage)
+    return {"history": packed_history, "context_chunks": packed_chunks, "usage": usage}
+
+class PromptUsage:
+    """Running totals of packed prompt sizes, per section"""
+
+    SECTIONS = ("instructions", "question", "history", "context", "total")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.totals = {section: 0 for section in self.SECTIONS}
+        self.largest_prompt = 0
+
+    def record(self, usage: Dict[str, Any]) -> None:
+        with self._lock:
+            self.prompts += 1
+            for section in self.SECTIONS:
+                self.totals[section] += usage[section]
+            self.largest_prompt = max(self.largest_prompt, usage["total"])
+
+    def stats(self) -> Dict[str, Any]:
+        """Average estimated tokens per section"""
+        with self._lock:
+            averages = {
+                f"average_{section}_tokens": round(total / self.prompts, 1) if self.prompts else 0.0
+                for section, total in self.totals.items()
+            }
+            return {"prompts": self.prompts, "largest_prompt_tokens": self.largest_prompt, **averages}
+
+# Shared prompt usage counters
+prompt_usage = PromptUsage()
@@ -0,0 +1,124 @@
+import os
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Set
+from dotenv import load_dotenv
+from app.utils.helpers import estimate_tokens
+from app.utils.priority import priority, BULK
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+HISTORY_COMPACTION_ENABLED = os.getenv("HISTORY_COMPACTION_ENABLED", "true").lower() == "true"
+# Compact once a session's verbatim history is estimated above this many tokens
+HISTORY_COMPACT_THRESHOLD_TOKENS = int(os.getenv("HISTORY_COMPACT_THRESHOLD_TOKENS", 1500))
+# Most recent messages that always stay verbatim
+HISTORY_KEEP_RECENT_MESSAGES = int(os.getenv("HISTORY_KEEP_RECENT_MESSAGES", 4))
+
+# Role of the running summary message; build_prompt renders it before the verbatim turns
+SUMMARY_ROLE = "summary"
+
+class _Conversation:
+    def __init__(self):
+        self.summary = ""
+        self.messages: List[Dict[str, str]] = []
+        self.compacting = False
+
+class ConversationMemory:
+    """Per-session conversation history with a rolling summary of older turns
+
+    Once a session's verbatim messages pass threshold_tokens, all but the most
+    recent keep_recent messages are folded into a running summary by
+    summarize_fn. This runs as a background task after the exchange has been
+    recorded, so no request waits on it; until it finishes, prompts simply
+    include the longer history.
+    """
+
+    def __init__(
+        self,
+        summarize_fn: Callable[[str, List[Dict[str, str]]], Awaitable[str]],
+        threshold_tokens: int = HISTORY_COMPACT_THRESHOLD_TOKENS,
+        keep_recent: int = HISTORY_KEEP_RECENT_MESSAGES,
+        enabled: bool = HISTORY_COMPACTION_ENABLED
+    ):
+        self.summarize_fn = summarize_fn
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent = max(0, keep_recent)
+        self.enabled = enabled
+        self._conversations: Dict[str, _Conversation] = {}
+        self._lock = threading.Lock()
+        # The event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self.compactions = 0
+        self.failed_compactions = 0
+        self.messages_compacted = 0
+
+    def history(self, session_id: str) -> List[Dict[str, str]]:
+        """Messages to send with the next question: the summary (if any), then recent turns"""
+        with self._lock:
+            conversation = self._conversations.get(session_id)
+            if conversation is None:
+                return []
+            summary = [{"role": SUMMARY_ROLE, "content": conversation.summary}] if conversation.summary else []
+            return summary + list(conversation.messages)
+
+    def append(self, session_id: str, question: str, answer: str) -> None:
+        """Record an exchange, starting a compaction in the background if the history got too long"""
+        with self._lock:
+            conversation = self._conversations.setdefault(session_id, _Conversation())
+            conversation.messages.append({"role": "user", "content": question})
+            conversation.messages.append({"role": "assistant", "content": answer})
+            if not self._needs_compaction(conversation):
+                return
+            conversation.compacting = True
+
+        task = asyncio.get_running_loop().create_task(self._compact(session_id, conversation))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def drop(self, session_id: str) -> None:
+        """Forget a session's conversation"""
+        with self._lock:
+            self._conversations.pop(session_id, None)
+
+    def _needs_compaction(self, conversation: _Conversation) -> bool:
+        if not self.enabled or conversation.compacting or len(conversation.messages) <= self.keep_recent:
+            return False
+        tokens = sum(estimate_tokens(message["content"]) for message in conversation.messages)
+        return tokens > self.threshold_tokens
+
+    async def _compact(self, session_id: str, conversation: _Conversation) -> None:
+        """Fold all but the most recent messages into the running summary"""
+        with self._lock:
+            older = conversation.messages[:len(conversation.messages) - self.keep_recent]
+            previous_summary = conversation.summary
+        try:
+            # Nobody is waiting for the summary
+            with priority(BULK):
+                summary = await self.summarize_fn(previous_summary, older)
+            with self._lock:
+                # Messages recorded while summarizing stay verbatim
+                conversation.summary = summary.strip()
+                conversation.messages = conversation.messages[len(older):]
+                self.compactions += 1
+                self.messages_compacted += len(older)
+            logger.info(f"Compacted {len(older)} messages of session {session_id} into a summary")
+        except Exception as e:
+            self.failed_compactions += 1
+            logger.error(f"Error compacting history for session {session_id}: {str(e)}")
+        finally:
+            with self._lock:
+                conversation.compacting = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Return compaction counters"""
+        with self._lock:
+            return {
+                "sessions": len(self._conversations),
+                "compactions": self.compactions,
+                "failed_compactions": self.failed_compactions,
+                "messages_compacted": self.messages_compacted
+            }
@@ -0,0 +1,123 @@
+import os
+import logging
+from typing import Any, Dict, List, Optional, Set
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+# Trade-off between relevance (1.0) and diversity (0.0) when picking context chunks
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", 0.7))
+# Chunks sharing at least this fraction of their word shingles with a chosen chunk are dropped
+DEDUP_OVERLAP_THRESHOLD = float(os.getenv("DEDUP_OVERLAP_THRESHOLD", 0.6))
+# Chunks at least this similar (cosine) to a chosen chunk are never added
+MMR_MAX_SIMILARITY = float(os.getenv("MMR_MAX_SIMILARITY", 0.95))
+
+SHINGLE_SIZE = 8
+
+def word_shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """Hashes of every run of size consecutive words in a text"""
+    words = text.lower().split()
+    if len(words) <= size:
+        return {hash(tuple(words))} if words else set()
+    return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+def overlap_ratio(a: Set[int], b: Set[int]) -> float:
+    """Share of the smaller text's shingles that also occur in the other text"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+def maximal_marginal_relevance(
+    relevance: np.ndarray,
+    vectors: np.ndarray,
+    top_k: int,
+    lambda_mult: float = MMR_LAMBDA,
+    max_similarity: float = MMR_MAX_SIMILARITY
+) -> List[int]:
+    """Greedy MMR selection
+
+    Args:
+        relevance: Relevance of each candidate to the query
+        vectors: Unit-length candidate embeddings, one row per candidate
+        top_k: Maximum number of candidates to select
+        lambda_mult: Weight of relevance against similarity to already selected candidates
+        max_similarity: Candidates this similar to a selected one are skipped
+
+    Returns:
+        Indexes of the selected candidates, in selection order
+    """
+    if len(relevance) == 0 or top_k <= 0:
+        return []
+    similarities = vectors @ vectors.T
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarities[selected[0]].copy()
+    remaining = np.ones(len(relevance), dtype=bool)
+    remaining[selected[0]] = False
+
+    while len(selected) < top_k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~remaining | (redundancy >= max_similarity)] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] == -np.inf:
+            break
+        selected.append(best)
+        remaining[best] = False
+        redundancy = np.maximum(redundancy, similarities[best])
+    return selected
+
+def diversify(
+    candidates: List[Dict[str, Any]],
+    embeddings: List[Optional[List[float]]],
+    top_k: int,
+    lambda_mult: float = MMR_LAMBDA,
+    overlap_threshold: float = DEDUP_OVERLAP_THRESHOLD,
+    max_similarity: float = MMR_MAX_SIMILARITY
+) -> List[Dict[str, Any]]:
+    """Pick a diverse context set from ranked retrieval candidates
+
+    Candidates that mostly repeat the text of a better-ranked one (overlapping
+    chunk windows, re-ingested pages) are dropped first. MMR then picks up to
+    top_k of the rest, using the candidate's rank as its relevance so that
+    hybrid fusion order is respected, and embedding similarity as redundancy.
+    Fewer than top_k chunks are returned when the candidates are redundant.
+
+    Args:
+        candidates: Retrieval results, best first
+        embeddings: Embedding of each candidate's text (None if unavailable)
+        top_k: Maximum number of chunks to return
+
+    Returns:
+        Selected candidates, in selection order
+    """
+    kept: List[int] = []
+    kept_shingles: List[Set[int]] = []
+    for index, candidate in enumerate(candidates):
+        shingles = word_shingles(candidate["text"])
+        if any(overlap_ratio(shingles, other) >= overlap_threshold for other in kept_shingles):
+            continue
+        kept.append(index)
+        kept_shingles.append(shingles)
+
+    if not kept:
+        return []
+
+    # Candidates without an embedding get a zero vector: never redundant, ranked by position only
+    dimensions = next((len(embeddings[index]) for index in kept if embeddings[index] is not None), 1)
+    vectors = np.zeros((len(kept), dimensions), dtype=np.float32)
+    for row, index in enumerate(kept):
+        if embeddings[index] is not None:
+            vectors[row] = embeddings[index]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    relevance = 1.0 - np.arange(len(kept), dtype=np.float32) / len(kept)
+
+    selected = maximal_marginal_relevance(relevance, vectors / norms, top_k, lambda_mult, max_similarity)
+    logger.info(
+        f"Diversified {len(candidates)} candidates to {len(selected)} "
+        f"({len(candidates) - len(kept)} near-duplicate texts)"
+    )
+    return [candidates[kept[i]] for i in selected]
@@ -5,6 +5,7 @@ import fitz  # PyMuPDF
 import docx
 from bs4 import BeautifulSoup
 from pdfminer.high_level import extract_text as pdfminer_extract_text
+from app.utils.executors import run_parse
 
 logger = logging.getLogger(__name__)
 
@@ -26,21 +27,24 @@ async def process_document(file_path: str, filename: str) -> List[Dict[str, Any]
         file_extension = os.path.splitext(filename)[1].lower()
         
         if file_extension == ".pdf":
-            return await process_pdf(file_path, filename)
+            parser = process_pdf
         elif file_extension == ".docx":
-            return await process_docx(file_path, filename)
+            parser = process_docx
         elif file_extension == ".txt":
-            return await process_txt(file_path, filename)
+            parser = process_txt
         elif file_extension in [".html", ".htm"]:
-            return await process_html(file_path, filename)
+            parser = process_html
         else:
             logger.warning(f"Unsupported file format: {file_extension}")
             return []
+        
+        # Parsing is CPU-bound, so it runs on the parse pool rather than the event loop
+        return await run_parse(parser, file_path, filename)
     except Exception as e:
         logger.error(f"Error processing document {filename}: {str(e)}")
         raise
 
-async def process_pdf(file_path: str, filename: str) -> List[Dict[str, Any]]:
+def process_pdf(file_path: str, filename: str) -> List[Dict[str, Any]]:
     """Process a PDF document and extract text chunks"""
     chunks = []
     
@@ -101,7 +105,7 @@ async def process_pdf(file_path: str, filename: str) -> List[Dict[str, Any]]:
     
     return chunks
 
-async def process_docx(file_path: str, filename: str) -> List[Dict[str, Any]]:
+def process_docx(file_path: str, filename: str) -> List[Dict[str, Any]]:
     """Process a DOCX document and extract text chunks"""
     chunks = []
     
@@ -140,7 +144,7 @@ async def process_docx(file_path: str, filename: str) -> List[Dict[str, Any]]:
     
     return chunks
 
-async def process_txt(file_path: str, filename: str) -> List[Dict[str, Any]]:
+def process_txt(file_path: str, filename: str) -> List[Dict[str, Any]]:
     """Process a TXT document and extract text chunks"""
     chunks = []
     
@@ -167,7 +171,7 @@ async def process_txt(file_path: str, filename: str) -> List[Dict[str, Any]]:
     
     return chunks
 
-async def process_html(file_path: str, filename: str) -> List[Dict[str, Any]]:
+def process_html(file_path: str, filename: str) -> List[Dict[str, Any]]:
     """Process an HTML document and extract text chunks"""
     chunks = []
     
@@ -0,0 +1,166 @@
+import os
+import logging
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-004")
+EMBEDDING_DIMENSIONALITY = int(os.getenv("EMBEDDING_DIMENSIONALITY", 768))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+# Set to an empty string to keep the cache in memory only
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite3")
+
+class EmbeddingCache:
+    """Content-addressed embedding cache with an LRU memory tier and a SQLite disk tier
+
+    Entries are keyed by (model, dimensionality, sha256(text)), so the same
+    text embedded by the same model is only ever sent to Vertex AI once.
+    """
+
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        dimensionality: int = EMBEDDING_DIMENSIONALITY,
+        max_entries: int = EMBEDDING_CACHE_SIZE,
+        path: Optional[str] = EMBEDDING_CACHE_PATH
+    ):
+        self.model = model
+        self.dimensionality = dimensionality
+        self.max_entries = max_entries
+        self.path = path or None
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.path:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = sqlite3.connect(self.path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Embedding cache disk tier disabled, could not open {self.path}: {str(e)}")
+                self._db = None
+
+    def key(self, text: str) -> str:
+        """Build the cache key for a text"""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model}:{self.dimensionality}:{digest}"
+
+    def _remember(self, key: str, embedding: List[float]) -> None:
+        """Insert into the memory tier, evicting the least recently used entries"""
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for texts, returning None for every miss"""
+        keys = [self.key(text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for index, key in enumerate(keys):
+                embedding = self._memory.get(key)
+                if embedding is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    results[index] = embedding
+                else:
+                    missing.setdefault(key, []).append(index)
+
+            if missing and self._db is not None:
+                found = self._load(list(missing.keys()))
+                for key, embedding in found.items():
+                    self._remember(key, embedding)
+                    for index in missing.pop(key):
+                        self.disk_hits += 1
+                        results[index] = embedding
+
+            self.misses += sum(len(indexes) for indexes in missing.values())
+
+        return results
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """Look up the embedding for a single text"""
+        return self.get_many([text])[0]
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]) -> None:
+        """Store embeddings for texts in both tiers"""
+        rows = []
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                embedding = list(embedding)
+                self._remember(key, embedding)
+                rows.append((key, array("f", embedding).tobytes()))
+
+            if rows and self._db is not None:
+                try:
+                    self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Error writing to embedding cache: {str(e)}")
+
+    def put(self, text: str, embedding: List[float]) -> None:
+        """Store the embedding for a single text"""
+        self.put_many([text], [embedding])
+
+    def _load(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Read entries from the disk tier"""
+        found = {}
+        try:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                )
+                for key, blob in cursor:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading from embedding cache: {str(e)}")
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters"""
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+# Shared cache used by vector_store
+embedding_cache = EmbeddingCache()
@@ -1,11 +1,18 @@
 import os
+import time
+import asyncio
 import logging
-from typing import List, Dict, Any, Tuple
+from collections import deque
+from typing import List, Dict, Any, Tuple, AsyncIterator, Awaitable, Deque, Optional, TypeVar
 import json
 from dotenv import load_dotenv
 import vertexai
-from vertexai.generative_models import GenerativeModel, Part
+from vertexai.generative_models import Part
 from google.oauth2 import service_account
+from app.api.model_registry import model_registry
+from app.api.context_packer import pack_prompt
+from app.api.outbound_governor import outbound_governor, is_stale_handle
+from app.utils.helpers import estimate_tokens
 
 load_dotenv()
 
@@ -16,6 +23,24 @@ LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash-002")
 GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 GCP_LOCATION = os.getenv("GCP_LOCATION", "us-central1")
 GCP_SERVICE_ACCOUNT_FILE = os.getenv("GCP_SERVICE_ACCOUNT_FILE")
+# Seconds to wait for a complete answer, or for each chunk of a streamed one
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+# Length limit for the running summary of older conversation turns
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", 300))
+# Model tiers; routing is off while both are LLM_MODEL
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", LLM_MODEL)
+LLM_STRONG_MODEL = os.getenv("LLM_STRONG_MODEL", LLM_MODEL)
+# Questions this long, context this large, or a flat score spread across sources go to the strong tier
+ROUTER_LONG_QUESTION_TOKENS = int(os.getenv("ROUTER_LONG_QUESTION_TOKENS", 40))
+ROUTER_LARGE_CONTEXT_TOKENS = int(os.getenv("ROUTER_LARGE_CONTEXT_TOKENS", 3000))
+ROUTER_MIN_SCORE_LEAD = float(os.getenv("ROUTER_MIN_SCORE_LEAD", 0.1))
+
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+# Recent calls per tier kept for latency percentiles
+ROUTER_LATENCY_SAMPLES = 500
+
+T = TypeVar("T")
 
 # Initialize Vertex AI
 def initialize_vertex_ai():
@@ -37,102 +62,383 @@ def initialize_vertex_ai():
 # Initialize Vertex AI
 initialize_vertex_ai()
 
-async def generate_answer(
+# Sampling settings shared by blocking and streaming generation
+GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "max_output_tokens": 2048,
+    "top_p": 0.95,
+    "top_k": 40
+}
+
+def format_sources(context_chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Describe the context chunks an answer is based on, for display"""
+    sources = []
+    for chunk in context_chunks:
+        source = {
+            "text": chunk["text"][:200] + "...",  # Truncate for display
+            "source": chunk["metadata"].get("source", "Unknown"),
+            "page": chunk["metadata"].get("page", None),
+            "title": chunk["metadata"].get("title", None)
+        }
+        sources.append(source)
+    return sources
+
+SYSTEM_PROMPT = """
+        You are a helpful AI assistant that answers questions based on the provided context.
+        If the answer is not in the context, say "I don't have enough information to answer this question."
+        Do not make up information that is not in the context.
+        Always cite your sources by referring to the document or URL where the information came from.
+        
+        Context information is below:
+        {context_text}
+        """
+
+def build_messages(
     question: str,
     context_chunks: List[Dict[str, Any]],
     conversation_history: List[Dict[str, str]]
-) -> Tuple[str, List[Dict[str, Any]]]:
+) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+    """Build the system, history and question messages for a question within the prompt token budget
+    
+    Returns:
+        Tuple of (messages, sources of the context chunks that were included)
+    """
+    # Fit history (a running summary plus recent turns) and context into the token budget
+    packed = pack_prompt(SYSTEM_PROMPT.format(context_text=""), question, context_chunks, conversation_history)
+    logger.info(f"Prompt token estimate: {packed['usage']}")
+    
+    # Prepare the system message
+    context_text = "\n\n---\n\n".join([chunk["text"] for chunk in packed["context_chunks"]])
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT.format(context_text=context_text)}
+    ]
+    
+    # Add conversation history
+    messages.extend(packed["history"])
+    
+    # Add the current question
+    messages.append({"role": "user", "content": question})
+    return messages, format_sources(packed["context_chunks"])
+
+def build_prompt(messages: List[Dict[str, str]]) -> str:
+    """Flatten messages into a single Gemini prompt"""
+    conversation_text = ""
+    system_prompt = ""
+    
+    for message in messages:
+        role = message["role"]
+        content = message["content"]
+        
+        if role == "system":
+            system_prompt = content
+        elif role == "summary":
+            conversation_text += f"Summary of the earlier conversation: {content}\n"
+        elif role == "user":
+            conversation_text += f"User: {content}\n"
+        elif role == "assistant":
+            conversation_text += f"Assistant: {content}\n"
+    
+    # Combine system prompt with conversation
+    return f"{system_prompt}\n\nConversation:\n{conversation_text}\nAssistant:"
+
+def score_lead(context_chunks: List[Dict[str, Any]]) -> Optional[float]:
+    """How far the best vector similarity stands out from the runner-up, relative to the best
+    
+    Uses the "vector_score" retrieval keeps on vector results. RRF scores only
+    encode ranks (neighbouring ranks always differ by a few percent) and BM25
+    scores are on another scale, so neither is used. Returns None without two
+    vector scores.
+    """
+    scores = [chunk.get("vector_score") for chunk in context_chunks]
+    scores = sorted((score for score in scores if isinstance(score, (int, float))), reverse=True)
+    if len(scores) < 2:
+        return None
+    if scores[0] == 0:
+        return 0.0
+    return (scores[0] - scores[1]) / abs(scores[0])
+
+class ModelRouter:
+    """Picks a fast or strong model tier per question and keeps per-tier latency and outcomes
+    
+    Questions go to the fast tier unless a cheap local signal suggests they
+    need more: a long question, a large context, or context from several
+    sources with no clearly best chunk (an answer to be pieced together).
+    """
+    
+    def __init__(
+        self,
+        models: Dict[str, str],
+        long_question_tokens: int = ROUTER_LONG_QUESTION_TOKENS,
+        large_context_tokens: int = ROUTER_LARGE_CONTEXT_TOKENS,
+        min_score_lead: float = ROUTER_MIN_SCORE_LEAD
+    ):
+        self.models = models
+        self.long_question_tokens = long_question_tokens
+        self.large_context_tokens = large_context_tokens
+        self.min_score_lead = min_score_lead
+        self._counters = {
+            tier: {"routed": 0, "ok": 0, "timeouts": 0, "errors": 0, "fallback_calls": 0}
+            for tier in models
+        }
+        self._latencies: Dict[str, Deque[float]] = {tier: deque(maxlen=ROUTER_LATENCY_SAMPLES) for tier in models}
+    
+    @property
+    def enabled(self) -> bool:
+        return self.models[FAST_TIER] != self.models[STRONG_TIER]
+    
+    def choose(self, question: str, context_chunks: List[Dict[str, Any]]) -> Tuple[str, str]:
+        """Return the tier for a question and the reason for choosing it"""
+        if not self.enabled:
+            return FAST_TIER, "routing disabled"
+        if estimate_tokens(question) >= self.long_question_tokens:
+            return STRONG_TIER, "long question"
+        if sum(estimate_tokens(chunk["text"]) for chunk in context_chunks) >= self.large_context_tokens:
+            return STRONG_TIER, "large context"
+        sources = {chunk["metadata"].get("source") for chunk in context_chunks}
+        lead = score_lead(context_chunks)
+        if len(sources) > 1 and lead is not None and lead < self.min_score_lead:
+            return STRONG_TIER, "no clear best chunk across sources"
+        return FAST_TIER, "simple lookup"
+    
+    def route(self, question: str, context_chunks: List[Dict[str, Any]]) -> str:
+        """Choose the tier for a question
+        
+        The decision is only counted once a model is actually called, so
+        questions answered from a cache don't show up in the routing share.
+        """
+        tier, reason = self.choose(question, context_chunks)
+        logger.info(f"Routing question to the {tier} tier ({self.models[tier]}): {reason}")
+        return tier
+    
+    def count_routed(self, tier: str) -> None:
+        """Count a question sent to a tier"""
+        self._counters[tier]["routed"] += 1
+    
+    def fallback_for(self, tier: str) -> Optional[str]:
+        """The other tier, if it uses a different model"""
+        if not self.enabled:
+            return None
+        return STRONG_TIER if tier == FAST_TIER else FAST_TIER
+    
+    def record(self, tier: str, latency: float, error: Optional[BaseException] = None, fallback: bool = False) -> None:
+        """Count a finished call to a tier's model"""
+        counters = self._counters[tier]
+        if error is None:
+            counters["ok"] += 1
+            self._latencies[tier].append(latency)
+        elif isinstance(error, asyncio.TimeoutError):
+            counters["timeouts"] += 1
+        else:
+            counters["errors"] += 1
+        if fallback:
+            counters["fallback_calls"] += 1
+    
+    async def timed(self, tier: str, awaitable: Awaitable[T], fallback: bool = False) -> T:
+        """Await a call to a tier's model, recording its latency and outcome"""
+        started = time.monotonic()
+        try:
+            result = await awaitable
+        except Exception as e:
+            self.record(tier, time.monotonic() - started, e, fallback)
+            raise
+        self.record(tier, time.monotonic() - started, fallback=fallback)
+        return result
+    
+    def stats(self) -> Dict[str, Any]:
+        """Per-tier model, routing share, outcomes and latency of successful calls"""
+        total_routed = sum(counters["routed"] for counters in self._counters.values())
+        tiers = {}
+        for tier, counters in self._counters.items():
+            latencies = sorted(self._latencies[tier])
+            tiers[tier] = {
+                "model": self.models[tier],
+                **counters,
+                "routed_share": round(counters["routed"] / total_routed, 3) if total_routed else 0.0,
+                "average_latency_ms": round(1000 * sum(latencies) / len(latencies), 1) if latencies else None,
+                "p95_latency_ms": round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else None
+            }
+        return {"enabled": self.enabled, "tiers": tiers}
+
+# Shared router for answer generation
+model_router = ModelRouter({FAST_TIER: LLM_FAST_MODEL, STRONG_TIER: LLM_STRONG_MODEL})
+
+async def generate_answer(
+    question: str,
+    context_chunks: List[Dict[str, Any]],
+    conversation_history: List[Dict[str, str]],
+    tier: Optional[str] = None
+) -> Tuple[str, List[Dict[str, Any]], str]:
     """Generate an answer to a question based on context chunks
     
     Args:
         question: The question to answer
         context_chunks: List of relevant text chunks with metadata
         conversation_history: Previous conversation history
+        tier: Model tier to use (routed from the question and context if None)
         
     Returns:
-        Tuple of (answer, sources)
+        Tuple of (answer, sources, name of the model that answered)
     """
     try:
-        # Prepare the context text
-        context_text = "\n\n---\n\n".join([chunk["text"] for chunk in context_chunks])
-        
-        # Prepare the sources
-        sources = []
-        for chunk in context_chunks:
-            source = {
-                "text": chunk["text"][:200] + "...",  # Truncate for display
-                "source": chunk["metadata"].get("source", "Unknown"),
-                "page": chunk["metadata"].get("page", None),
-                "title": chunk["metadata"].get("title", None)
-            }
-            sources.append(source)
-        
-        # Prepare the system message
-        system_message = f"""
-        You are a helpful AI assistant that answers questions based on the provided context.
-        If the answer is not in the context, say "I don't have enough information to answer this question."
-        Do not make up information that is not in the context.
-        Always cite your sources by referring to the document or URL where the information came from.
-        
-        Context information is below:
-        {context_text}
-        """
-        
-        # Prepare the messages
-        messages = [
-            {"role": "system", "content": system_message}
-        ]
-        
-        # Add conversation history (limited to last 5 exchanges)
-        for message in conversation_history[-10:]:
-            messages.append(message)
-        
-        # Add the current question
-        messages.append({"role": "user", "content": question})
-        
-        # Generate the answer using Gemini 2.5 Flash
-        return await generate_with_gemini(messages, sources)
+        messages, sources = build_messages(question, context_chunks, conversation_history)
+        tier = tier or model_router.route(question, context_chunks)
+        return await generate_routed(messages, sources, tier)
     except Exception as e:
         logger.error(f"Error generating answer: {str(e)}")
         raise
 
-async def generate_with_gemini(messages: List[Dict[str, str]], sources: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
-    """Generate an answer using Google's Gemini 2.5 Flash"""
+async def generate_routed(
+    messages: List[Dict[str, str]],
+    sources: List[Dict[str, Any]],
+    tier: str
+) -> Tuple[str, List[Dict[str, Any]], str]:
+    """Generate with the tier's model, falling back to the other tier on a timeout or error
+    
+    Returns:
+        Tuple of (answer, sources, name of the model that answered)
+    """
+    model_router.count_routed(tier)
+    fallback = model_router.fallback_for(tier)
     try:
-        # Initialize the Gemini model
-        model = GenerativeModel(LLM_MODEL)
+        model_name = model_router.models[tier]
+        answer, sources = await model_router.timed(tier, generate_with_gemini(messages, sources, model_name))
+        return answer, sources, model_name
+    except Exception as e:
+        if fallback is None:
+            raise
+        logger.warning(f"{model_router.models[tier]} failed ({str(e)}), falling back to {model_router.models[fallback]}")
+    model_name = model_router.models[fallback]
+    answer, sources = await model_router.timed(
+        fallback, generate_with_gemini(messages, sources, model_name), fallback=True
+    )
+    return answer, sources, model_name
+
+async def stream_routed(messages: List[Dict[str, str]], tier: str) -> AsyncIterator[Tuple[str, str]]:
+    """Stream with the tier's model, falling back to the other tier if it fails before any text
+    
+    Yields (name of the model answering, text) pairs.
+    """
+    model_router.count_routed(tier)
+    fallback = model_router.fallback_for(tier)
+    started = time.monotonic()
+    streamed = False
+    try:
+        async for text in stream_with_gemini(messages, model_router.models[tier]):
+            streamed = True
+            yield model_router.models[tier], text
+        model_router.record(tier, time.monotonic() - started)
+        return
+    except Exception as e:
+        model_router.record(tier, time.monotonic() - started, e)
+        if streamed or fallback is None:
+            raise
+        logger.warning(f"{model_router.models[tier]} failed ({str(e)}), falling back to {model_router.models[fallback]}")
+    
+    started = time.monotonic()
+    try:
+        async for text in stream_with_gemini(messages, model_router.models[fallback]):
+            yield model_router.models[fallback], text
+    except Exception as e:
+        model_router.record(fallback, time.monotonic() - started, e, fallback=True)
+        raise
+    model_router.record(fallback, time.monotonic() - started, fallback=True)
+
+async def generate_with_gemini(
+    messages: List[Dict[str, str]],
+    sources: List[Dict[str, Any]],
+    model_name: str = LLM_MODEL
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """Generate an answer with a Gemini model"""
+    try:
+        # Get the shared Gemini model
+        model = await model_registry.get_generative_model_async(model_name)
         
-        # Prepare the conversation history
-        conversation_text = ""
-        system_prompt = ""
+        # Generate the response with the SDK's native async client
+        prompt = build_prompt(messages)
+        response = await outbound_governor.call(f"llm:{model_name}", lambda: asyncio.wait_for(
+            model.generate_content_async(prompt, generation_config=GENERATION_CONFIG),
+            timeout=LLM_TIMEOUT_SECONDS
+        ))
         
-        for message in messages:
-            role = message["role"]
-            content = message["content"]
-            
-            if role == "system":
-                system_prompt = content
-            elif role == "user":
-                conversation_text += f"User: {content}\n"
-            elif role == "assistant":
-                conversation_text += f"Assistant: {content}\n"
+        answer = response.text
+        return answer, sources
+    except asyncio.TimeoutError:
+        logger.error(f"{model_name} did not answer within {LLM_TIMEOUT_SECONDS}s")
+        raise
+    except Exception as e:
+        logger.error(f"Error generating with {model_name}: {str(e)}")
+        if is_stale_handle(e):
+            model_registry.invalidate_generative_model(model_name)
+        raise
+
+async def stream_with_gemini(messages: List[Dict[str, str]], model_name: str = LLM_MODEL) -> AsyncIterator[str]:
+    """Stream an answer from a Gemini model, yielding the text of each response chunk"""
+    try:
+        model = await model_registry.get_generative_model_async(model_name)
+        prompt = build_prompt(messages)
+        # Only opening the stream is governed; its chunks arrive without further requests
+        responses = await outbound_governor.call(f"llm:{model_name}", lambda: asyncio.wait_for(
+            model.generate_content_async(prompt, generation_config=GENERATION_CONFIG, stream=True),
+            timeout=LLM_TIMEOUT_SECONDS
+        ))
         
-        # Combine system prompt with conversation
-        full_prompt = f"{system_prompt}\n\nConversation:\n{conversation_text}\nAssistant:"
+        # A stalled stream times out like a blocking call would
+        chunks = responses.__aiter__()
+        while True:
+            try:
+                response = await asyncio.wait_for(chunks.__anext__(), timeout=LLM_TIMEOUT_SECONDS)
+            except StopAsyncIteration:
+                break
+            try:
+                text = response.text
+            except ValueError:
+                # Chunks without text parts, such as a final finish-reason chunk
+                continue
+            if text:
+                yield text
+    except asyncio.TimeoutError:
+        logger.error(f"{model_name} stream stalled for more than {LLM_TIMEOUT_SECONDS}s")
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming from {model_name}: {str(e)}")
+        if is_stale_handle(e):
+            model_registry.invalidate_generative_model(model_name)
+        raise
+
+async def summarize_conversation(previous_summary: str, messages: List[Dict[str, str]]) -> str:
+    """Fold conversation turns into a running summary
+    
+    Args:
+        previous_summary: Summary of the turns before messages (may be empty)
+        messages: Turns to add to the summary, oldest first
         
-        # Generate the response
-        response = model.generate_content(
-            full_prompt,
-            generation_config={
-                "temperature": 0.3,
-                "max_output_tokens": 2048,
-                "top_p": 0.95,
-                "top_k": 40
-            }
+    Returns:
+        The updated summary
+    """
+    try:
+        # Summaries don't need the strong tier
+        model = await model_registry.get_generative_model_async(LLM_FAST_MODEL)
+        
+        turns = "\n".join(
+            f"{'User' if message['role'] == 'user' else 'Assistant'}: {message['content']}" for message in messages
+        )
+        prompt = (
+            "Update the summary of a conversation between a user and an assistant that answers "
+            "questions about the user's documents. Keep facts, names, numbers and open questions "
+            "that later questions may refer to; drop pleasantries. "
+            f"Reply with the summary only, in at most {HISTORY_SUMMARY_MAX_TOKENS * 3 // 4} words.\n\n"
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            f"New turns:\n{turns}\n\nUpdated summary:"
         )
         
-        answer = response.text
-        return answer, sources
+        response = await outbound_governor.call(f"llm:{LLM_FAST_MODEL}", lambda: asyncio.wait_for(
+            model.generate_content_async(
+                prompt,
+                generation_config={**GENERATION_CONFIG, "temperature": 0.0, "max_output_tokens": HISTORY_SUMMARY_MAX_TOKENS}
+            ),
+            timeout=LLM_TIMEOUT_SECONDS
+        ))
+        return response.text
     except Exception as e:
-        logger.error(f"Error generating with Gemini: {str(e)}")
-        raise
\ No newline at end of file
+        logger.error(f"Error summarizing conversation: {str(e)}")
+        raise
@@ -0,0 +1,565 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from app.api.ann_index import IVFIndex, LOCAL_ANN_MIN_VECTORS
+from app.utils.executors import get_executor
+from app.api.quantization import (
+    LOCAL_VECTOR_QUANTIZATION,
+    LOCAL_QUANTIZATION_MIN_VECTORS,
+    LOCAL_QUANTIZATION_RERANK,
+    QUANTIZATION_KINDS,
+    train_quantizer,
+    quantizer_from_arrays
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+# Set to an empty string to keep local vectors in memory only
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", "data/local_vectors")
+
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.jsonl"
+META_FILE = "meta.json"
+ANN_FILE = "ivf.npz"
+QUANTIZER_FILE = "quantizer.npz"
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length so dot products are cosine similarities"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Return the indexes of the top_k highest scores, best first"""
+    if top_k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < scores.size:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+class SessionIndex:
+    """Append-only matrix of unit vectors plus the chunk table for one session
+
+    Rows are float32 until the session reaches LOCAL_QUANTIZATION_MIN_VECTORS;
+    with quantization enabled they are then replaced by int8 or PQ codes and
+    scored asymmetrically against the float32 query. If float_rows is set (a
+    reader over the float32 rows kept on disk), the best quantized candidates
+    are re-ranked exactly.
+    """
+
+    def __init__(self, session_id: str, dimensions: Optional[int] = None, quantization: str = "none"):
+        self.session_id = session_id
+        self.dimensions = dimensions
+        self.quantization = quantization
+        self.quantizer = None
+        self.float_rows: Optional[Callable[[np.ndarray], np.ndarray]] = None
+        self.count = 0
+        self._rows = np.empty((0, dimensions or 0), dtype=np.float32)
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.ann: Optional[IVFIndex] = None
+        # Set when the ANN index changed and should be persisted
+        self.ann_dirty = False
+        # Set while a quantizer or ANN index is being built for this session
+        self.rebuilding = False
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The stored unit vectors, one row per chunk (reconstructed if quantized)"""
+        if self.quantizer is None:
+            return self._rows[:self.count]
+        if self.float_rows is not None:
+            return self.float_rows(np.arange(self.count))
+        return self.quantizer.decode(self._rows[:self.count])
+
+    def vectors_at(self, rows: np.ndarray) -> np.ndarray:
+        """The stored unit vectors of the given rows (reconstructed if quantized)"""
+        if self.quantizer is None:
+            return self._rows[rows]
+        if self.float_rows is not None:
+            return self.float_rows(rows)
+        return self.quantizer.decode(self._rows[rows])
+
+    def memory_bytes(self) -> int:
+        """Bytes used by the stored rows"""
+        return self.count * self._rows.shape[1] * self._rows.itemsize
+
+    def _reserve(self, extra: int) -> None:
+        """Grow the backing matrix geometrically so appends are amortised O(1)"""
+        needed = self.count + extra
+        if needed <= self._rows.shape[0]:
+            return
+        capacity = max(needed, self._rows.shape[0] * 2, 64)
+        grown = np.empty((capacity, self._rows.shape[1]), dtype=self._rows.dtype)
+        grown[:self.count] = self._rows[:self.count]
+        self._rows = grown
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> np.ndarray:
+        """Append chunks and return their normalised vectors"""
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+            self._rows = np.empty((0, self.dimensions), dtype=np.float32)
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(
+                f"Embedding has {vectors.shape[1]} dimensions, session {self.session_id} uses {self.dimensions}"
+            )
+
+        self._reserve(len(ids))
+        rows = vectors if self.quantizer is None else self.quantizer.encode(vectors)
+        self._rows[self.count:self.count + len(ids)] = rows
+        self.count += len(ids)
+        self.ids.extend(ids)
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        if self.ann is not None:
+            # Persisted indexes assign rows appended after the last save on load
+            self.ann.add(vectors)
+        return vectors
+
+    def needs_quantizer(self) -> bool:
+        """Whether the session is large enough to train its quantizer"""
+        return (
+            self.quantization != "none"
+            and self.quantizer is None
+            and self.count >= LOCAL_QUANTIZATION_MIN_VECTORS
+        )
+
+    def needs_ann(self) -> bool:
+        """Whether the ANN index should be built or retrained"""
+        return self.count >= LOCAL_ANN_MIN_VECTORS and (self.ann is None or self.ann.needs_retraining())
+
+    def set_quantizer(self, quantizer, vectors: np.ndarray) -> None:
+        """Replace the float32 rows with their codes under quantizer"""
+        self.quantizer = quantizer
+        self._rows = quantizer.encode(vectors)
+
+    def _score(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        stored = self._rows[:self.count] if rows is None else self._rows[rows]
+        if self.quantizer is None:
+            return stored @ query
+        return self.quantizer.score(stored, query)
+
+    def search(self, query_embedding: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """Cosine top-k: IVF once an ANN index has been built, exact otherwise"""
+        if self.count == 0:
+            return []
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+
+        rerank = self.quantizer is not None and self.float_rows is not None and LOCAL_QUANTIZATION_RERANK > 0
+        shortlist = top_k * LOCAL_QUANTIZATION_RERANK if rerank else top_k
+
+        if self.ann is not None:
+            candidates = self.ann.probe(query)
+            scores = self._score(query, candidates)
+            best = top_k_indices(scores, shortlist)
+            rows, scores = candidates[best], scores[best]
+        else:
+            scores = self._score(query)
+            rows = top_k_indices(scores, shortlist)
+            scores = scores[rows]
+
+        if rerank and rows.size:
+            # Exact float32 scores for the quantized shortlist
+            scores = self.float_rows(rows) @ query
+            best = top_k_indices(scores, top_k)
+            rows, scores = rows[best], scores[best]
+
+        return [(int(i), float(score)) for i, score in zip(rows[:top_k], scores[:top_k])]
+
+class LocalVectorStore:
+    """In-process vector store keeping one SessionIndex per session
+
+    Each session is persisted append-only under its own directory: raw float32
+    rows in vectors.f32 and one JSON line per chunk in chunks.jsonl. Sessions
+    are loaded lazily on first use. With quantization enabled only the codes
+    are held in memory; vectors.f32 is memory-mapped for exact re-ranking.
+    """
+
+    def __init__(self, path: Optional[str] = LOCAL_VECTOR_STORE_PATH, quantization: str = LOCAL_VECTOR_QUANTIZATION):
+        if quantization not in QUANTIZATION_KINDS:
+            logger.warning(f"Unknown LOCAL_VECTOR_QUANTIZATION {quantization}, storing float32 vectors")
+            quantization = "none"
+        self.path = path or None
+        self.quantization = quantization
+        self._sessions: Dict[str, SessionIndex] = {}
+        self._lock = threading.RLock()
+
+    def _session_dir(self, session_id: str) -> str:
+        digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest)
+
+    def _get_session(self, session_id: str) -> Optional[SessionIndex]:
+        """Return the session's index, loading it from disk on first use
+
+        A loaded session is searched with whatever quantizer and ANN index were
+        persisted (exactly, if none); any training it still needs runs on the
+        bulk I/O pool, outside the lock.
+        """
+        with self._lock:
+            index = self._sessions.get(session_id)
+            if index is None and self.path:
+                index = self._load_session(session_id)
+                if index is not None:
+                    self._sessions[session_id] = index
+                    job = self._claim_rebuild(index)
+                    if job is not None:
+                        get_executor("bulk_io").submit(self._run_rebuild, index, job)
+            return index
+
+    def add(
+        self,
+        session_id: str,
+        ids: List[str],
+        embeddings: List[List[float]],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """Append chunks to a session
+
+        Quantizer training and index building happen here on the ingest path,
+        never on a query, and outside the lock so queries keep being served.
+        Sessions loaded from disk are trained the same way, on the bulk I/O pool.
+        """
+        if not ids:
+            return
+        with self._lock:
+            index = self._get_session(session_id)
+            if index is None:
+                index = self._new_session(session_id)
+                self._sessions[session_id] = index
+            vectors = index.add(ids, np.asarray(embeddings, dtype=np.float32), texts, metadatas)
+            if self.path:
+                self._append_to_disk(index, ids, vectors, texts, metadatas)
+            job = self._claim_rebuild(index)
+
+        if job is not None:
+            self._run_rebuild(index, job)
+
+    def _claim_rebuild(self, index: SessionIndex) -> Optional[Tuple[int, bool, bool]]:
+        """Mark the session as rebuilding if it needs a quantizer or ANN index; call with the lock held
+
+        Returns:
+            The _rebuild arguments after the index, or None if there is nothing to do
+        """
+        quantize = index.needs_quantizer()
+        build_ann = index.needs_ann()
+        if index.rebuilding or not (quantize or build_ann):
+            return None
+        index.rebuilding = True
+        return index.count, quantize, build_ann
+
+    def _run_rebuild(self, index: SessionIndex, job: Tuple[int, bool, bool]) -> None:
+        """Run a claimed rebuild without the lock"""
+        try:
+            self._rebuild(index, *job)
+        except Exception as e:
+            logger.error(f"Error rebuilding index for session {index.session_id}: {str(e)}")
+            raise
+        finally:
+            index.rebuilding = False
+
+    def _rebuild(self, index: SessionIndex, count: int, quantize: bool, build_ann: bool) -> None:
+        """Train a quantizer and/or build an ANN index over a session's first count rows, then swap them in
+
+        Stored rows are never modified in place, so they are read without the
+        lock; rows appended meanwhile are encoded and assigned at the swap.
+        """
+        vectors = index._rows[:count] if index.quantizer is None else index.vectors_at(np.arange(count))
+        quantizer = train_quantizer(index.quantization, vectors) if quantize else None
+        codes = quantizer.encode(vectors) if quantizer is not None else None
+        ann = IVFIndex.build(vectors) if build_ann else None
+
+        # Write the files now and only rename them into place below
+        written = []
+        if self.path:
+            directory = self._session_dir(index.session_id)
+            try:
+                if quantizer is not None:
+                    path = os.path.join(directory, QUANTIZER_FILE)
+                    with open(path + ".rebuild", "wb") as f:
+                        np.savez(f, **quantizer.to_arrays())
+                    written.append(path)
+                if ann is not None:
+                    path = os.path.join(directory, ANN_FILE)
+                    ann.save(path + ".rebuild")
+                    written.append(path)
+            except Exception as e:
+                logger.error(f"Error saving rebuilt index for session {index.session_id}: {str(e)}")
+
+        with self._lock:
+            current = self._sessions.get(index.session_id) is index
+            for path in written:
+                if current:
+                    os.replace(path + ".rebuild", path)
+                elif os.path.exists(path + ".rebuild"):
+                    os.remove(path + ".rebuild")
+            if not current:
+                # The session was deleted or rewritten while building
+                return
+
+            if quantizer is not None:
+                if index.count > count:
+                    codes = np.concatenate([codes, quantizer.encode(index._rows[count:index.count])])
+                index.quantizer = quantizer
+                index._rows = codes
+                logger.info(
+                    f"Quantized {index.count} vectors for session {index.session_id} "
+                    f"({index.quantization}, {quantizer.bytes_per_vector()} bytes per vector)"
+                )
+            if ann is not None:
+                if index.count > count:
+                    ann.add(index.vectors_at(np.arange(count, index.count)))
+                index.ann = ann
+
+    def query(
+        self,
+        session_id: str,
+        query_embedding: List[float],
+        top_k: int,
+        include_vectors: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Return the top_k most similar chunks of a session
+
+        With include_vectors, each result also carries its stored unit vector
+        under "embedding".
+        """
+        index = self._get_session(session_id)
+        if index is None:
+            return []
+        with self._lock:
+            hits = index.search(np.asarray(query_embedding, dtype=np.float32), top_k)
+            results = [
+                {
+                    "id": index.ids[i],
+                    "text": index.texts[i],
+                    "metadata": dict(index.metadatas[i]),
+                    "score": score
+                }
+                for i, score in hits
+            ]
+            if include_vectors and hits:
+                vectors = index.vectors_at(np.array([i for i, _ in hits]))
+                for result, vector in zip(results, vectors):
+                    result["embedding"] = vector.tolist()
+            return results
+
+    def delete(self, session_id: str, chunk_ids: List[str]) -> int:
+        """Remove chunks from a session by id, returning how many were removed
+
+        The session's files are rewritten without the removed rows, so this
+        costs time proportional to the size of the session.
+        """
+        with self._lock:
+            index = self._get_session(session_id)
+            if index is None:
+                return 0
+            doomed = set(chunk_ids)
+            keep = np.array([chunk_id not in doomed for chunk_id in index.ids], dtype=bool)
+            removed = int((~keep).sum())
+            if not removed:
+                return 0
+
+            vectors = index.vectors[keep]
+            rows = np.flatnonzero(keep)
+            replacement = self._new_session(session_id, index.dimensions)
+            replacement._rows = vectors
+            replacement.count = len(rows)
+            replacement.ids = [index.ids[i] for i in rows]
+            replacement.texts = [index.texts[i] for i in rows]
+            replacement.metadatas = [index.metadatas[i] for i in rows]
+            if index.quantizer is not None:
+                replacement.set_quantizer(index.quantizer, vectors)
+            if index.ann is not None:
+                # Keep the trained centroids, only the row assignments change
+                replacement.ann = IVFIndex(index.ann.centroids, index.ann.nprobe)
+                replacement.ann.trained_count = index.ann.trained_count
+                replacement.ann.add(vectors)
+                replacement.ann_dirty = True
+
+            if self.path:
+                self._rewrite_files(replacement, vectors)
+                self._save_ann(replacement)
+            self._sessions[session_id] = replacement
+            return removed
+
+    def export(self, session_id: str) -> Optional[Tuple[List[str], np.ndarray, List[str], List[Dict[str, Any]]]]:
+        """Return a session's ids, float32 unit vectors, texts and metadata, or None if it is unknown"""
+        with self._lock:
+            index = self._get_session(session_id)
+            if index is None:
+                return None
+            return list(index.ids), index.vectors, list(index.texts), [dict(metadata) for metadata in index.metadatas]
+
+    def delete_session(self, session_id: str) -> int:
+        """Remove a session's chunks from memory and disk, returning how many were removed"""
+        with self._lock:
+            index = self._get_session(session_id)
+            self._sessions.pop(session_id, None)
+            if self.path:
+                shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+            return index.count if index else 0
+
+    def memory_bytes(self) -> int:
+        """Bytes used by the vectors of all loaded sessions"""
+        with self._lock:
+            return sum(index.memory_bytes() for index in self._sessions.values())
+
+    def count(self, session_id: str) -> int:
+        """Number of chunks stored for a session"""
+        index = self._get_session(session_id)
+        return index.count if index else 0
+
+    def _append_to_disk(
+        self,
+        index: SessionIndex,
+        ids: List[str],
+        vectors: np.ndarray,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """Append new rows to the session's files"""
+        directory = self._session_dir(index.session_id)
+        os.makedirs(directory, exist_ok=True)
+
+        meta_path = os.path.join(directory, META_FILE)
+        if not os.path.exists(meta_path):
+            with open(meta_path, "w") as f:
+                json.dump({"session_id": index.session_id, "dimensions": index.dimensions}, f)
+
+        with open(os.path.join(directory, VECTORS_FILE), "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(os.path.join(directory, CHUNKS_FILE), "a", encoding="utf-8") as f:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata}) + "\n")
+
+    def _new_session(self, session_id: str, dimensions: Optional[int] = None) -> SessionIndex:
+        index = SessionIndex(session_id, dimensions, self.quantization)
+        if self.path:
+            vectors_path = os.path.join(self._session_dir(session_id), VECTORS_FILE)
+            index.float_rows = lambda rows: self._read_float_rows(vectors_path, index, rows)
+        return index
+
+    def _read_float_rows(self, vectors_path: str, index: SessionIndex, rows: np.ndarray) -> np.ndarray:
+        """Read float32 rows from the session's vectors file"""
+        # Rows being appended may not be on disk yet; only whole rows are mapped
+        rows_on_disk = os.path.getsize(vectors_path) // (4 * index.dimensions)
+        vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows_on_disk, index.dimensions))
+        return np.asarray(vectors[rows])
+
+    def _rewrite_files(self, index: SessionIndex, vectors: np.ndarray) -> None:
+        """Replace the session's vector and chunk files with the index's current rows"""
+        directory = self._session_dir(index.session_id)
+        vectors_path = os.path.join(directory, VECTORS_FILE)
+        chunks_path = os.path.join(directory, CHUNKS_FILE)
+
+        with open(vectors_path + ".tmp", "wb") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(chunks_path + ".tmp", "w", encoding="utf-8") as f:
+            for chunk_id, text, metadata in zip(index.ids, index.texts, index.metadatas):
+                f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata}) + "\n")
+        os.replace(vectors_path + ".tmp", vectors_path)
+        os.replace(chunks_path + ".tmp", chunks_path)
+
+    def _save_ann(self, index: SessionIndex) -> None:
+        """Persist the session's ANN index if it changed"""
+        if index.ann is None or not index.ann_dirty:
+            return
+        try:
+            path = os.path.join(self._session_dir(index.session_id), ANN_FILE)
+            index.ann.save(path + ".tmp")
+            os.replace(path + ".tmp", path)
+            index.ann_dirty = False
+        except Exception as e:
+            logger.error(f"Error saving ANN index for session {index.session_id}: {str(e)}")
+
+    def _load_session(self, session_id: str) -> Optional[SessionIndex]:
+        """Load a session from disk, or return None if it was never stored"""
+        directory = self._session_dir(session_id)
+        meta_path = os.path.join(directory, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            dimensions = int(meta["dimensions"])
+
+            # Byte offset in chunks.jsonl just past each complete chunk line
+            chunks = []
+            chunk_ends = []
+            chunks_path = os.path.join(directory, CHUNKS_FILE)
+            with open(chunks_path, "rb") as f:
+                offset = 0
+                for line in f:
+                    offset += len(line)
+                    if not line.strip():
+                        continue
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        chunks.append(json.loads(line))
+                    except ValueError:
+                        break
+                    chunk_ends.append(offset)
+
+            vectors_path = os.path.join(directory, VECTORS_FILE)
+            vectors = np.fromfile(vectors_path, dtype=np.float32)
+            rows = vectors.size // dimensions
+
+            # A crash during an append can leave the files out of step or end in a partial row;
+            # cut both back to the rows they agree on so later appends line up again
+            count = min(rows, len(chunks))
+            chunks_size = chunk_ends[count - 1] if count else 0
+            if os.path.getsize(chunks_path) != chunks_size or vectors.size != count * dimensions:
+                logger.warning(f"Local vector store for session {session_id} was truncated to {count} chunks")
+                os.truncate(chunks_path, chunks_size)
+                os.truncate(vectors_path, count * dimensions * vectors.itemsize)
+
+            index = self._new_session(session_id, dimensions)
+            index._rows = vectors[:rows * dimensions].reshape(rows, dimensions)[:count].copy()
+            index.count = count
+            index.ids = [chunk["id"] for chunk in chunks[:count]]
+            index.texts = [chunk["text"] for chunk in chunks[:count]]
+            index.metadatas = [chunk["metadata"] for chunk in chunks[:count]]
+
+            quantizer_path = os.path.join(directory, QUANTIZER_FILE)
+            if os.path.exists(quantizer_path):
+                with np.load(quantizer_path) as data:
+                    quantizer = quantizer_from_arrays(dict(data))
+                if quantizer.kind == self.quantization:
+                    index.set_quantizer(quantizer, index._rows)
+
+            ann_path = os.path.join(directory, ANN_FILE)
+            if os.path.exists(ann_path):
+                ann = IVFIndex.load(ann_path)
+                if ann.count <= count:
+                    # Assign rows appended after the index was last saved
+                    ann.add(index.vectors[ann.count:])
+                    index.ann = ann
+            logger.info(f"Loaded {count} local vectors for session {session_id}")
+            return index
+        except Exception as e:
+            logger.error(f"Error loading local vectors for session {session_id}: {str(e)}")
+            return None
+
+# Shared store used when VECTOR_DB_TYPE=local
+local_vector_store = LocalVectorStore()
@@ -0,0 +1,181 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from vertexai.language_models import TextEmbeddingModel
+from vertexai.generative_models import GenerativeModel
+from google.cloud import aiplatform
+from app.utils.executors import run_io
+from app.utils.single_flight import SingleFlight
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-004")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash-002")
+# Every model answers may be routed to, warmed up at startup
+LLM_MODELS = list(dict.fromkeys([
+    os.getenv("LLM_FAST_MODEL", LLM_MODEL),
+    os.getenv("LLM_STRONG_MODEL", LLM_MODEL)
+]))
+REGISTRY_TTL_SECONDS = float(os.getenv("REGISTRY_TTL_SECONDS", 3600))
+
+EMBEDDING_MODEL_KEY = "embedding_model"
+INDEX_ENDPOINT_KEY = "index_endpoint"
+INDEX_KEY = "index"
+
+def _generative_model_key(model_name: str) -> str:
+    return f"generative_model:{model_name}"
+
+class ModelRegistry:
+    """Process-wide cache of Vertex AI model and index-endpoint handles
+
+    Handles are resolved once and reused until they are older than the TTL or
+    are invalidated after an error, so request paths don't pay for
+    from_pretrained() or control-plane listings on every call. Coroutines use
+    the *_async accessors, which resolve missing handles in a worker thread.
+    """
+
+    def __init__(self, ttl_seconds: float = REGISTRY_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._handles: Dict[str, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self._resolving = SingleFlight("model_registry")
+
+    def _fresh(self, key: str) -> Optional[Any]:
+        """Return a cached handle that has not expired, or None"""
+        with self._lock:
+            cached = self._handles.get(key)
+        if cached and time.monotonic() - cached[1] < self.ttl_seconds:
+            return cached[0]
+        return None
+
+    def _get(self, key: str, factory: Callable[[], Any]) -> Any:
+        """Return a cached handle, resolving it with factory if missing or expired
+
+        The lock only guards the cache itself; factory runs without it, so a
+        slow resolution never holds up callers of other (or cached) handles.
+        """
+        handle = self._fresh(key)
+        if handle is not None:
+            return handle
+
+        handle = factory()
+        with self._lock:
+            self._handles[key] = (handle, time.monotonic())
+        logger.info(f"Resolved {key}")
+        return handle
+
+    async def _get_async(self, key: str, getter: Callable[[], Any]) -> Any:
+        """Return a cached handle without blocking the event loop
+
+        A missing or expired handle is resolved by getter in a worker thread;
+        concurrent callers for the same key share that resolution.
+        """
+        handle = self._fresh(key)
+        if handle is not None:
+            return handle
+        return await self._resolving.do(key, lambda: run_io(getter))
+
+    def get_embedding_model(self) -> TextEmbeddingModel:
+        """Get the shared text embedding model"""
+        return self._get(EMBEDDING_MODEL_KEY, lambda: TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL))
+
+    def get_generative_model(self, model_name: Optional[str] = None) -> GenerativeModel:
+        """Get a shared Gemini model (defaults to LLM_MODEL)"""
+        model_name = model_name or LLM_MODEL
+        return self._get(_generative_model_key(model_name), lambda: GenerativeModel(model_name))
+
+    def get_index_endpoint(self) -> aiplatform.MatchingEngineIndexEndpoint:
+        """Get the shared Vertex AI Vector Search index endpoint"""
+        return self._get(INDEX_ENDPOINT_KEY, _find_index_endpoint)
+
+    def get_index(self) -> aiplatform.MatchingEngineIndex:
+        """Get the shared Vertex AI Vector Search index (used for datapoint removal)"""
+        return self._get(INDEX_KEY, _find_index)
+
+    async def get_embedding_model_async(self) -> TextEmbeddingModel:
+        """Get the shared text embedding model from a coroutine"""
+        return await self._get_async(EMBEDDING_MODEL_KEY, self.get_embedding_model)
+
+    async def get_generative_model_async(self, model_name: Optional[str] = None) -> GenerativeModel:
+        """Get a shared Gemini model from a coroutine"""
+        model_name = model_name or LLM_MODEL
+        return await self._get_async(
+            _generative_model_key(model_name), functools.partial(self.get_generative_model, model_name)
+        )
+
+    async def get_index_endpoint_async(self) -> aiplatform.MatchingEngineIndexEndpoint:
+        """Get the shared index endpoint from a coroutine"""
+        return await self._get_async(INDEX_ENDPOINT_KEY, self.get_index_endpoint)
+
+    async def get_index_async(self) -> aiplatform.MatchingEngineIndex:
+        """Get the shared index from a coroutine"""
+        return await self._get_async(INDEX_KEY, self.get_index)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Drop one cached handle (or all of them) so it is resolved again on next use"""
+        with self._lock:
+            if key is None:
+                self._handles.clear()
+            else:
+                self._handles.pop(key, None)
+
+    def invalidate_generative_model(self, model_name: Optional[str] = None) -> None:
+        """Drop a cached Gemini model handle"""
+        self.invalidate(_generative_model_key(model_name or LLM_MODEL))
+
+    async def warmup(self, include_index_endpoint: bool = False) -> None:
+        """Resolve all handles ahead of the first request
+
+        Failures are logged rather than raised so the app can still start
+        (handles are retried lazily on first use).
+        """
+        loaders: List[Tuple[str, Callable[[], Any]]] = [(EMBEDDING_MODEL_KEY, self.get_embedding_model)]
+        loaders.extend(
+            (_generative_model_key(model_name), functools.partial(self.get_generative_model, model_name))
+            for model_name in LLM_MODELS
+        )
+        if include_index_endpoint:
+            loaders.append((INDEX_ENDPOINT_KEY, self.get_index_endpoint))
+
+        results = await asyncio.gather(
+            *(run_io(loader) for _, loader in loaders),
+            return_exceptions=True
+        )
+        for (key, _), result in zip(loaders, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to warm up {key}: {str(result)}")
+
+def _find_index_endpoint() -> aiplatform.MatchingEngineIndexEndpoint:
+    """Look up the index endpoint through the Vertex AI control plane"""
+    index_name = os.getenv("VECTOR_INDEX_NAME")
+    if not index_name:
+        raise ValueError("VECTOR_INDEX_NAME environment variable not set")
+
+    endpoints = aiplatform.MatchingEngineIndexEndpoint.list(
+        filter=f'display_name="{index_name}"'
+    )
+    if not endpoints:
+        raise ValueError(f"No index endpoint found for index {index_name}")
+    return endpoints[0]
+
+def _find_index() -> aiplatform.MatchingEngineIndex:
+    """Look up the index through the Vertex AI control plane"""
+    index_name = os.getenv("VECTOR_INDEX_NAME")
+    if not index_name:
+        raise ValueError("VECTOR_INDEX_NAME environment variable not set")
+
+    indexes = aiplatform.MatchingEngineIndex.list(filter=f'display_name="{index_name}"')
+    if not indexes:
+        raise ValueError(f"No index found with name {index_name}")
+    return indexes[0]
+
+# Shared registry used by vector_store and llm_service
+model_registry = ModelRegistry()
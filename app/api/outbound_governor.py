@@ -0,0 +1,404 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+from dotenv import load_dotenv
+from app.utils.priority import current_priority, INTERACTIVE, BULK, PRIORITIES
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Get configuration from environment variables
+OUTBOUND_GOVERNOR_ENABLED = os.getenv("OUTBOUND_GOVERNOR_ENABLED", "true").lower() == "true"
+# Upper bound on the adaptive concurrency limit of each outbound service
+OUTBOUND_MAX_CONCURRENCY = {
+    "embedding": int(os.getenv("EMBEDDING_OUTBOUND_MAX_CONCURRENCY", 16)),
+    "vector_search": int(os.getenv("VECTOR_SEARCH_OUTBOUND_MAX_CONCURRENCY", 32)),
+    "vector_write": int(os.getenv("VECTOR_WRITE_OUTBOUND_MAX_CONCURRENCY", 8)),
+    "llm": int(os.getenv("LLM_OUTBOUND_MAX_CONCURRENCY", 16))
+}
+OUTBOUND_MIN_CONCURRENCY = int(os.getenv("OUTBOUND_MIN_CONCURRENCY", 1))
+# A call slower than this many times the service's typical latency counts as congestion
+OUTBOUND_LATENCY_TOLERANCE = float(os.getenv("OUTBOUND_LATENCY_TOLERANCE", 3.0))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 3))
+OUTBOUND_RETRY_BASE_DELAY = float(os.getenv("OUTBOUND_RETRY_BASE_DELAY", 0.5))
+# Longest single wait before a retry; longer retry hints fail the call instead
+OUTBOUND_RETRY_MAX_DELAY = float(os.getenv("OUTBOUND_RETRY_MAX_DELAY", 10.0))
+# Consecutive failures that open a service's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", 30.0))
+# Share of each service's concurrency limit that bulk work (ingestion) may use
+BULK_CONCURRENCY_SHARE = float(os.getenv("BULK_CONCURRENCY_SHARE", 0.5))
+# Bulk work queued this long goes ahead of waiting interactive work
+BULK_MAX_WAIT_SECONDS = float(os.getenv("BULK_MAX_WAIT_SECONDS", 2.0))
+
+# Generation time depends on the answer's length, so LLM latency is not a congestion signal
+LATENCY_SIGNAL_SERVICES = ("embedding", "vector_search")
+
+# Quota, overload and transient server errors are retried
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+OVERLOAD_STATUS_CODES = {429, 503}
+# Expired credentials, revoked access or a deleted resource: a cached handle may be stale
+STALE_HANDLE_STATUS_CODES = {401, 403, 404}
+# The request itself was rejected (InvalidArgument)
+INVALID_ARGUMENT_STATUS_CODE = 400
+
+# Multiplicative decrease factor, and smoothing of the typical latency
+LIMIT_BACKOFF = 0.5
+LATENCY_SMOOTHING = 0.1
+
+class OutboundUnavailable(Exception):
+    """An outbound service is unhealthy or over quota; retry after retry_after seconds"""
+
+    def __init__(self, service: str, message: str, retry_after: float):
+        super().__init__(f"{service} is unavailable: {message}")
+        self.service = service
+        self.retry_after = retry_after
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP status of a Google API, Pinecone or Weaviate error, if it has one"""
+    for attribute in ("code", "status", "status_code"):
+        code = getattr(error, attribute, None)
+        if isinstance(code, int):
+            return code
+    return None
+
+def retry_hint(error: BaseException) -> Optional[float]:
+    """Seconds the service asked us to wait, from RetryInfo details or a Retry-After header"""
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error: BaseException) -> bool:
+    return status_code(error) in RETRYABLE_STATUS_CODES or isinstance(error, ConnectionError)
+
+def is_overload(error: BaseException) -> bool:
+    return status_code(error) in OVERLOAD_STATUS_CODES or isinstance(error, asyncio.TimeoutError)
+
+def is_stale_handle(error: BaseException) -> bool:
+    return status_code(error) in STALE_HANDLE_STATUS_CODES
+
+def is_invalid_argument(error: BaseException) -> bool:
+    return status_code(error) == INVALID_ARGUMENT_STATUS_CODE
+
+class AdaptiveLimiter:
+    """Concurrency limit that grows additively while calls go well and halves on congestion
+
+    Congestion is an overload error or, when latency_tolerance is set, a call
+    taking longer than latency_tolerance times the typical latency. Calls that
+    started before the last decrease don't decrease the limit again, so one
+    burst of failures only halves it once.
+
+    Freed slots go to interactive waiters first. Bulk work may only hold
+    bulk_share of the limit, and only gets slots no interactive call is
+    waiting for, unless it has been queued for bulk_max_wait seconds.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = OUTBOUND_MIN_CONCURRENCY,
+        latency_tolerance: Optional[float] = None,
+        bulk_share: float = BULK_CONCURRENCY_SHARE,
+        bulk_max_wait: float = BULK_MAX_WAIT_SECONDS
+    ):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(max(self.min_limit, self.max_limit // 2))
+        self.latency_tolerance = latency_tolerance
+        self.bulk_share = bulk_share
+        self.bulk_max_wait = bulk_max_wait
+        self.typical_latency: Optional[float] = None
+        self.running = {level: 0 for level in PRIORITIES}
+        # (queued at, future) per priority class, oldest first
+        self._waiters: Dict[str, Deque[Tuple[float, asyncio.Future]]] = {level: deque() for level in PRIORITIES}
+        self._last_decrease = 0.0
+        self.decreases = 0
+        self.starvation_grants = 0
+
+    @property
+    def in_flight(self) -> int:
+        return sum(self.running.values())
+
+    def cap(self, level: str) -> int:
+        """Most slots the priority class may hold at the current limit"""
+        if level == BULK:
+            return max(1, int(self.limit * self.bulk_share))
+        return int(self.limit)
+
+    def _can_start(self, level: str) -> bool:
+        return self.in_flight < int(self.limit) and self.running[level] < self.cap(level)
+
+    async def acquire(self, level: str = INTERACTIVE) -> None:
+        """Wait for a slot under the current limit for the given priority class"""
+        if self._can_start(level) and not self._waiters[level]:
+            self.running[level] += 1
+            return
+        entry = (time.monotonic(), asyncio.get_running_loop().create_future())
+        self._waiters[level].append(entry)
+        try:
+            await entry[1]
+        except asyncio.CancelledError:
+            if entry[1].cancelled():
+                if entry in self._waiters[level]:
+                    self._waiters[level].remove(entry)
+            else:
+                # The slot was handed over just as the caller went away
+                self.running[level] -= 1
+                self._wake()
+            raise
+
+    def release(self, started: float, latency: float, congested: bool, level: str = INTERACTIVE) -> None:
+        """Free a slot and adjust the limit from the call's outcome"""
+        saturated = self.in_flight >= int(self.limit)
+        self.running[level] -= 1
+
+        slow = bool(self.latency_tolerance and self.typical_latency) and \
+            latency > self.typical_latency * self.latency_tolerance
+        if not congested:
+            # Slow calls still count, so a lasting slowdown becomes the new normal
+            if self.typical_latency is None:
+                self.typical_latency = latency
+            else:
+                self.typical_latency += LATENCY_SMOOTHING * (latency - self.typical_latency)
+
+        if congested or slow:
+            if started >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * LIMIT_BACKOFF)
+                self._last_decrease = time.monotonic()
+                self.decreases += 1
+        elif saturated:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def _wake(self) -> None:
+        while True:
+            level = self._next_level()
+            if level is None:
+                return
+            _, future = self._waiters[level].popleft()
+            self.running[level] += 1
+            future.set_result(None)
+
+    def _next_level(self) -> Optional[str]:
+        """Priority class whose oldest waiter gets the next free slot, if any"""
+        for waiters in self._waiters.values():
+            while waiters and waiters[0][1].done():
+                waiters.popleft()
+        if self.in_flight >= int(self.limit):
+            return None
+
+        interactive, bulk = self._waiters[INTERACTIVE], self._waiters[BULK]
+        bulk_ready = bool(bulk) and self.running[BULK] < self.cap(BULK)
+        # Keeps a steady stream of questions from starving ingestion completely
+        if bulk_ready and time.monotonic() - bulk[0][0] >= self.bulk_max_wait:
+            if interactive:
+                self.starvation_grants += 1
+            return BULK
+        if interactive:
+            return INTERACTIVE
+        return BULK if bulk_ready else None
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def queued_by_priority(self) -> Dict[str, int]:
+        return {level: len(waiters) for level, waiters in self._waiters.items()}
+
+class CircuitBreaker:
+    """Fails calls fast after failure_threshold consecutive failures
+
+    After open_seconds one probe call is let through (half-open); its success
+    closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+
+    def before_call(self) -> Optional[float]:
+        """Return None if a call may go ahead, or the seconds until one may"""
+        if self.state == "open":
+            remaining = self.opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                return remaining
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                return self.open_seconds
+            self._probing = True
+        return None
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def record_abandoned(self) -> None:
+        """A probe was cancelled before it finished; let the next call probe instead"""
+        self._probing = False
+
+class _Service:
+    def __init__(self, name: str, max_concurrency: int):
+        tolerance = OUTBOUND_LATENCY_TOLERANCE if name in LATENCY_SIGNAL_SERVICES else None
+        self.limiter = AdaptiveLimiter(max_concurrency, latency_tolerance=tolerance)
+        self.breaker = CircuitBreaker()
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+
+class OutboundGovernor:
+    """Concurrency limits, retries and circuit breakers for outbound service calls
+
+    Each service (embedding, vector_search, vector_write, llm) has its own
+    adaptive concurrency limit and circuit breaker. Calls failing with a quota
+    or transient server error are retried with jittered exponential backoff,
+    waiting at least as long as the service's retry hint. Other errors are
+    raised straight away, and timeouts are not retried (they already waited
+    long enough) but do count against the service. Calls are queued by the
+    priority class of the context they are made from.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Dict[str, int] = OUTBOUND_MAX_CONCURRENCY,
+        max_retries: int = OUTBOUND_MAX_RETRIES,
+        base_delay: float = OUTBOUND_RETRY_BASE_DELAY,
+        max_delay: float = OUTBOUND_RETRY_MAX_DELAY,
+        enabled: bool = OUTBOUND_GOVERNOR_ENABLED
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.enabled = enabled
+        self._services: Dict[str, _Service] = {}
+
+    def _service(self, name: str) -> _Service:
+        if name not in self._services:
+            # Per-model services such as "llm:gemini-2.5-pro" use their family's settings
+            family = name.split(":", 1)[0]
+            self._services[name] = _Service(family, self.max_concurrency.get(family, 16))
+        return self._services[name]
+
+    async def call(self, service: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await fn() under the service's concurrency limit, retries and circuit breaker
+
+        Args:
+            service: Outbound service name, e.g. "embedding" or "llm:<model>"
+            fn: Makes one attempt at the call
+
+        Returns:
+            The result of the first successful attempt
+
+        Raises:
+            OutboundUnavailable: If the circuit is open or retryable errors persist
+        """
+        if not self.enabled:
+            return await fn()
+
+        state = self._service(service)
+        state.calls += 1
+        for attempt in range(self.max_retries + 1):
+            wait = state.breaker.before_call()
+            if wait is not None:
+                state.rejected += 1
+                raise OutboundUnavailable(service, "circuit open", wait)
+
+            try:
+                return await self._attempt(state, fn)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                hint = retry_hint(e)
+                if attempt == self.max_retries or (hint is not None and hint > self.max_delay):
+                    raise OutboundUnavailable(service, str(e), hint or self.base_delay) from e
+
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                delay = max(hint or 0.0, backoff)
+                state.retries += 1
+                logger.warning(
+                    f"{service} call failed ({str(e)}), "
+                    f"retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})"
+                )
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, state: _Service, fn: Callable[[], Awaitable[T]]) -> T:
+        """Make one call in a concurrency slot, feeding its outcome to the limiter and breaker"""
+        level = current_priority()
+        await state.limiter.acquire(level)
+        started = time.monotonic()
+        congested = False
+        try:
+            result = await fn()
+            state.successes += 1
+            state.breaker.record_success()
+            return result
+        except asyncio.CancelledError:
+            state.breaker.record_abandoned()
+            raise
+        except Exception as e:
+            if is_retryable(e) or isinstance(e, asyncio.TimeoutError):
+                congested = is_overload(e)
+                state.failures += 1
+                state.breaker.record_failure()
+            else:
+                # The service answered; the request itself was bad
+                state.breaker.record_success()
+            raise
+        finally:
+            state.limiter.release(started, time.monotonic() - started, congested, level)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-service limits, breaker states and call counters"""
+        return {
+            name: {
+                "calls": state.calls,
+                "successes": state.successes,
+                "failures": state.failures,
+                "retries": state.retries,
+                "rejected": state.rejected,
+                "concurrency_limit": round(state.limiter.limit, 2),
+                "in_flight": dict(state.limiter.running),
+                "queued": state.limiter.queued_by_priority(),
+                "bulk_cap": state.limiter.cap(BULK),
+                "starvation_grants": state.limiter.starvation_grants,
+                "limit_decreases": state.limiter.decreases,
+                "typical_latency_ms": round(state.limiter.typical_latency * 1000, 1) if state.limiter.typical_latency else None,
+                "circuit": state.breaker.state,
+                "circuit_opened": state.breaker.times_opened
+            }
+            for name, state in self._services.items()
+        }
+
+# Shared by the embedding, vector search and LLM calls
+outbound_governor = OutboundGovernor()
@@ -0,0 +1,171 @@
+import os
+import logging
+from typing import Dict
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+# "none", "int8" (4x smaller) or "pq" (product quantization, 3072 / LOCAL_PQ_SUBVECTORS times smaller)
+LOCAL_VECTOR_QUANTIZATION = os.getenv("LOCAL_VECTOR_QUANTIZATION", "none").lower()
+LOCAL_PQ_SUBVECTORS = int(os.getenv("LOCAL_PQ_SUBVECTORS", 192))
+# Sessions keep float32 rows until they reach this size, then the quantizer is trained on them
+LOCAL_QUANTIZATION_MIN_VECTORS = int(os.getenv("LOCAL_QUANTIZATION_MIN_VECTORS", 4096))
+# Re-rank top_k * this many quantized candidates with exact float32 scores (0 disables)
+LOCAL_QUANTIZATION_RERANK = int(os.getenv("LOCAL_QUANTIZATION_RERANK", 8))
+
+QUANTIZATION_KINDS = ("none", "int8", "pq")
+
+PQ_CENTROIDS = 256
+PQ_TRAINING_SAMPLES = 10000
+PQ_KMEANS_ITERATIONS = 10
+# Rows scored at a time: int8 blocks are decoded to float32 and should stay in cache,
+# PQ blocks only allocate one float32 per row
+INT8_SCORE_BLOCK_ROWS = 256
+PQ_SCORE_BLOCK_ROWS = 16384
+
+class ScalarQuantizer:
+    """Per-dimension int8 scalar quantization
+
+    Each dimension is mapped linearly from its trained [min, max] range onto
+    256 levels. Scoring is asymmetric: the float32 query is folded into the
+    per-dimension scales, so the database never has to be decoded.
+    """
+
+    kind = "int8"
+
+    def __init__(self, low: np.ndarray, scale: np.ndarray):
+        self.low = low.astype(np.float32)
+        self.scale = scale.astype(np.float32)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray) -> "ScalarQuantizer":
+        low = vectors.min(axis=0)
+        scale = (vectors.max(axis=0) - low) / 255.0
+        scale[scale == 0] = 1e-8
+        return cls(low, scale)
+
+    def bytes_per_vector(self) -> int:
+        return len(self.low)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        levels = np.clip(np.rint((vectors - self.low) / self.scale), 0, 255)
+        return (levels - 128).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (codes.astype(np.float32) + 128) * self.scale + self.low
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Inner products between query and every encoded row"""
+        weights = (query * self.scale).astype(np.float32)
+        offset = float((128 * self.scale + self.low) @ query)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), INT8_SCORE_BLOCK_ROWS):
+            block = codes[start:start + INT8_SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ weights
+        return scores + offset
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {"kind": np.array(self.kind), "low": self.low, "scale": self.scale}
+
+class ProductQuantizer:
+    """Product quantization with 256 centroids per subspace (one byte per subvector)
+
+    Scoring uses asymmetric distance computation: one lookup table of
+    query-subvector · centroid products per query, summed over the codes.
+    """
+
+    kind = "pq"
+
+    def __init__(self, codebooks: np.ndarray):
+        # codebooks has shape (subvectors, centroids, subvector dimensions)
+        self.codebooks = codebooks.astype(np.float32)
+
+    @property
+    def subvectors(self) -> int:
+        return self.codebooks.shape[0]
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, subvectors: int = LOCAL_PQ_SUBVECTORS, seed: int = 0) -> "ProductQuantizer":
+        dimensions = vectors.shape[1]
+        # Use the largest subvector count that divides the dimensions evenly
+        subvectors = max(d for d in range(1, min(subvectors, dimensions) + 1) if dimensions % d == 0)
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), PQ_TRAINING_SAMPLES), replace=False)]
+        parts = sample.reshape(len(sample), subvectors, -1).transpose(1, 0, 2).copy()
+        centroids = min(PQ_CENTROIDS, len(sample))
+
+        codebooks = np.stack([
+            _kmeans(parts[j], centroids, rng) for j in range(subvectors)
+        ])
+        if centroids < PQ_CENTROIDS:
+            # Pad so codes always index a full table
+            padding = np.repeat(codebooks[:, :1, :], PQ_CENTROIDS - centroids, axis=1)
+            codebooks = np.concatenate([codebooks, padding], axis=1)
+        return cls(codebooks)
+
+    def bytes_per_vector(self) -> int:
+        return self.subvectors
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        parts = vectors.reshape(len(vectors), self.subvectors, -1)
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for j in range(self.subvectors):
+            centroids = self.codebooks[j]
+            distances = -2 * parts[:, j, :] @ centroids.T + (centroids ** 2).sum(axis=1)
+            codes[:, j] = np.argmin(distances, axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = self.codebooks[np.arange(self.subvectors), codes]
+        return parts.reshape(len(codes), -1)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Approximate inner products between query and every encoded row"""
+        table = np.einsum("jkd,jd->jk", self.codebooks, query.reshape(self.subvectors, -1)).astype(np.float32)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), PQ_SCORE_BLOCK_ROWS):
+            block = codes[start:start + PQ_SCORE_BLOCK_ROWS]
+            total = np.zeros(len(block), dtype=np.float32)
+            # One gather per subvector is much faster than a single 2-D fancy index
+            for j in range(self.subvectors):
+                total += table[j].take(block[:, j])
+            scores[start:start + len(block)] = total
+        return scores
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {"kind": np.array(self.kind), "codebooks": self.codebooks}
+
+def _kmeans(points: np.ndarray, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Plain L2 k-means used to train one PQ subspace"""
+    centroids = points[rng.choice(len(points), size=clusters, replace=False)].copy()
+    for _ in range(PQ_KMEANS_ITERATIONS):
+        distances = -2 * points @ centroids.T + (centroids ** 2).sum(axis=1)
+        assignments = np.argmin(distances, axis=1)
+        counts = np.bincount(assignments, minlength=clusters).astype(np.float32)
+        sums = np.stack([
+            np.bincount(assignments, weights=points[:, d], minlength=clusters) for d in range(points.shape[1])
+        ], axis=1).astype(np.float32)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+def train_quantizer(kind: str, vectors: np.ndarray):
+    """Train a quantizer of the given kind ("int8" or "pq")"""
+    if kind == "int8":
+        return ScalarQuantizer.train(vectors)
+    if kind == "pq":
+        return ProductQuantizer.train(vectors, LOCAL_PQ_SUBVECTORS)
+    raise ValueError(f"Unsupported quantization: {kind}")
+
+def quantizer_from_arrays(arrays: Dict[str, np.ndarray]):
+    """Rebuild a quantizer saved with to_arrays()"""
+    kind = str(arrays["kind"])
+    if kind == "int8":
+        return ScalarQuantizer(arrays["low"], arrays["scale"])
+    if kind == "pq":
+        return ProductQuantizer(arrays["codebooks"])
+    raise ValueError(f"Unsupported quantization: {kind}")
@@ -0,0 +1,105 @@
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+QUERY_BATCHING_ENABLED = os.getenv("QUERY_BATCHING_ENABLED", "true").lower() == "true"
+# Longest a query waits for others to join its batch while a batch is already in flight
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", 5))
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", 32))
+
+class MicroBatcher:
+    """Coalesces concurrent single-item calls into batched calls
+
+    When nothing is in flight an item is dispatched immediately, so an idle
+    server adds no latency. While a batch is in flight, new items queue up and
+    are sent together when the batch completes, the queue reaches max_size or
+    max_wait_ms passes, whichever comes first. Identical items in a batch are
+    only sent once.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS,
+        max_size: int = QUERY_BATCH_MAX_SIZE
+    ):
+        self.batch_fn = batch_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_size = max(1, max_size)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._in_flight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.full_batches = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if self._in_flight == 0 or len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Dispatch up to max_size pending items as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Drop items whose callers have gone away
+        self._pending = [(item, future) for item, future in self._pending if not future.done()]
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+        self._in_flight += 1
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        if len(batch) == self.max_size:
+            self.full_batches += 1
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        unique_items = list(dict.fromkeys(item for item, _ in batch))
+        try:
+            results = dict(zip(unique_items, await self.batch_fn(unique_items)))
+            for item, future in batch:
+                if not future.done():
+                    future.set_result(results[item])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._in_flight -= 1
+            if self._pending:
+                self._flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batch fill counters"""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "full_batches": self.full_batches,
+            "max_batch_size": self.max_size,
+            "max_wait_ms": self.max_wait * 1000.0
+        }
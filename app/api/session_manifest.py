@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+# Set to an empty string to keep the manifest in memory only
+SESSION_MANIFEST_PATH = os.getenv("SESSION_MANIFEST_PATH", "data/session_manifest.json")
+# Sessions idle for longer than this are cleared (0 disables expiry)
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 86400))
+
+# Chunk hash used for ids recorded without one; it never matches a real chunk
+UNKNOWN_CHUNK_HASH = ""
+
+class SessionManifest:
+    """Tracks which vector ids each session owns, per source, and when it was last active
+
+    This is what lets a session's vectors be deleted from backends that can't
+    enumerate them by session, and what drives TTL expiry. Each source also
+    keeps the fingerprint of what was last ingested and the vector ids of each
+    chunk by chunk hash, so a re-ingest only has to write what changed. Each
+    crawled page is its own source, tagged with the URL of the crawl it came from.
+    """
+
+    def __init__(self, path: Optional[str] = SESSION_MANIFEST_PATH):
+        self.path = path or None
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._load()
+
+    def _entry(self, session_id: str) -> Dict[str, Any]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            entry = {"sources": {}, "last_active": time.time()}
+            self._sessions[session_id] = entry
+        return entry
+
+    def _source(self, entry: Dict[str, Any], source: str) -> Dict[str, Any]:
+        return entry["sources"].setdefault(source, {"fingerprint": None, "chunks": {}})
+
+    def record_chunks(
+        self,
+        session_id: str,
+        source: str,
+        chunk_ids: List[str],
+        chunk_hashes: Optional[List[str]] = None
+    ) -> None:
+        """Record vector ids written for a session's source, optionally with their chunk hashes"""
+        if not chunk_ids:
+            return
+        with self._lock:
+            entry = self._entry(session_id)
+            chunks = self._source(entry, source)["chunks"]
+            for chunk_id, chunk_hash in zip(chunk_ids, chunk_hashes or [UNKNOWN_CHUNK_HASH] * len(chunk_ids)):
+                chunks.setdefault(chunk_hash, []).append(chunk_id)
+            entry["last_active"] = time.time()
+            self._save()
+
+    def replace_source(
+        self,
+        session_id: str,
+        source: str,
+        fingerprint: Optional[str],
+        chunks: Dict[str, List[str]],
+        crawl: Optional[str] = None
+    ) -> None:
+        """Replace what is recorded for a source after a (re-)ingest
+
+        Args:
+            fingerprint: Hash of the ingested file or page, or None if unknown
+            chunks: Vector ids of the source's chunks, by chunk hash
+            crawl: URL of the crawl a page source was found by
+        """
+        with self._lock:
+            entry = self._entry(session_id)
+            source_entry = {"fingerprint": fingerprint, "chunks": chunks}
+            if crawl:
+                source_entry["crawl"] = crawl
+            entry["sources"][source] = source_entry
+            entry["last_active"] = time.time()
+            self._save()
+
+    def drop_source(self, session_id: str, source: str) -> None:
+        """Forget a source of a session"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry and entry["sources"].pop(source, None) is not None:
+                self._save()
+
+    def source_fingerprint(self, session_id: str, source: str) -> Optional[str]:
+        """Fingerprint of the last ingest of a source"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            source_entry = entry["sources"].get(source) if entry else None
+            return source_entry["fingerprint"] if source_entry else None
+
+    def crawl_pages(self, session_id: str, crawl: str) -> Dict[str, Optional[str]]:
+        """Fingerprints of the pages last ingested by a crawl, by page URL"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return {}
+            return {
+                source: source_entry["fingerprint"]
+                for source, source_entry in entry["sources"].items()
+                if source_entry.get("crawl") == crawl
+            }
+
+    def source_chunks(self, session_id: str, source: str) -> Dict[str, List[str]]:
+        """Vector ids of a source's chunks, by chunk hash"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            source_entry = entry["sources"].get(source) if entry else None
+            if not source_entry:
+                return {}
+            return {chunk_hash: list(ids) for chunk_hash, ids in source_entry["chunks"].items()}
+
+    def source_entries(self, session_id: str) -> Dict[str, Dict[str, Any]]:
+        """Fingerprint and chunk ids by chunk hash of every source of a session"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return {}
+            return json.loads(json.dumps(entry["sources"]))
+
+    def touch(self, session_id: str) -> None:
+        """Mark a session as active (the timestamp is persisted with the next write)"""
+        with self._lock:
+            self._entry(session_id)["last_active"] = time.time()
+
+    def chunk_ids(self, session_id: str) -> List[str]:
+        """All vector ids owned by a session"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            return [
+                chunk_id
+                for source_entry in entry["sources"].values()
+                for ids in source_entry["chunks"].values()
+                for chunk_id in ids
+            ]
+
+    def sources(self, session_id: str) -> List[str]:
+        """Sources that have been ingested into a session"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return list(entry["sources"].keys()) if entry else []
+
+    def drop(self, session_id: str) -> None:
+        """Forget a session entirely"""
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                self._save()
+
+    def expired_sessions(self, ttl_seconds: float = SESSION_TTL_SECONDS, now: Optional[float] = None) -> List[str]:
+        """Sessions idle for longer than ttl_seconds"""
+        if ttl_seconds <= 0:
+            return []
+        now = now if now is not None else time.time()
+        with self._lock:
+            return [
+                session_id for session_id, entry in self._sessions.items()
+                if now - entry["last_active"] > ttl_seconds
+            ]
+
+    def _save(self) -> None:
+        """Write the manifest atomically"""
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self._sessions, f)
+            os.replace(self.path + ".tmp", self.path)
+        except Exception as e:
+            logger.error(f"Error saving session manifest: {str(e)}")
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                self._sessions = json.load(f)
+            # Older manifests stored a plain id list per source
+            for entry in self._sessions.values():
+                for source, source_entry in entry["sources"].items():
+                    if isinstance(source_entry, list):
+                        entry["sources"][source] = {"fingerprint": None, "chunks": {UNKNOWN_CHUNK_HASH: source_entry}}
+            logger.info(f"Loaded session manifest with {len(self._sessions)} sessions")
+        except Exception as e:
+            logger.error(f"Error loading session manifest: {str(e)}")
+
+# Shared manifest used by vector_store and main
+session_manifest = SessionManifest()
@@ -0,0 +1,168 @@
+import os
+import json
+import struct
+import zipfile
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+# Where exported snapshots are written before they are downloaded
+SESSION_SNAPSHOT_PATH = os.getenv("SESSION_SNAPSHOT_PATH", "data/snapshots")
+
+SNAPSHOT_FORMAT = "session-snapshot"
+SNAPSHOT_VERSION = 1
+
+# Fixed size of a zip local file header, before the member name and extra field
+ZIP_LOCAL_HEADER_SIZE = 30
+
+class SessionSnapshot:
+    """A session's chunks, metadata and embeddings, plus its ingest manifest
+
+    Embeddings are one float32 row per chunk. Ids, texts and metadata are kept
+    as parallel lists in the same order.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        model: str,
+        ids: List[str],
+        embeddings: np.ndarray,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        sources: Optional[Dict[str, Dict[str, Any]]] = None
+    ):
+        if not (len(ids) == len(embeddings) == len(texts) == len(metadatas)):
+            raise ValueError("Snapshot columns must all have one entry per chunk")
+        self.session_id = session_id
+        self.model = model
+        self.ids = ids
+        self.embeddings = embeddings
+        self.texts = texts
+        self.metadatas = metadatas
+        # Per-source fingerprint and chunk ids by chunk hash, as kept by the session manifest
+        self.sources = sources or {}
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dimensions(self) -> int:
+        return int(self.embeddings.shape[1]) if self.embeddings.ndim == 2 else 0
+
+def _encode_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack strings into one UTF-8 buffer plus end offsets"""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.cumsum([len(value) for value in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _decode_strings(buffer: np.ndarray, offsets: np.ndarray) -> List[str]:
+    data = buffer.tobytes()
+    starts = [0] + offsets[:-1].tolist()
+    return [data[start:end].decode("utf-8") for start, end in zip(starts, offsets.tolist())]
+
+def write_snapshot(snapshot: SessionSnapshot, path: str) -> None:
+    """Write a snapshot as an uncompressed .npz archive
+
+    Each column is stored as a separate array. Strings are packed into a
+    single UTF-8 buffer with offsets rather than a fixed-width array, and the
+    archive is left uncompressed so the embeddings can be memory-mapped.
+    """
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "session_id": snapshot.session_id,
+        "model": snapshot.model,
+        "count": snapshot.count,
+        "dimensions": snapshot.dimensions,
+        "sources": snapshot.sources
+    }
+    ids, id_offsets = _encode_strings(snapshot.ids)
+    texts, text_offsets = _encode_strings(snapshot.texts)
+    metadatas, metadata_offsets = _encode_strings([json.dumps(metadata) for metadata in snapshot.metadatas])
+
+    with open(path + ".tmp", "wb") as f:
+        np.savez(
+            f,
+            header=np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8),
+            embeddings=np.ascontiguousarray(snapshot.embeddings, dtype=np.float32),
+            ids=ids,
+            id_offsets=id_offsets,
+            texts=texts,
+            text_offsets=text_offsets,
+            metadatas=metadatas,
+            metadata_offsets=metadata_offsets
+        )
+    os.replace(path + ".tmp", path)
+
+def _memmap_member(path: str, name: str) -> Optional[np.ndarray]:
+    """Memory-map an array stored uncompressed in an .npz archive, or None if it is compressed"""
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name + ".npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        local_header = f.read(ZIP_LOCAL_HEADER_SIZE)
+        name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+        f.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if fortran_order or dtype.hasobject:
+        return None
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+def read_snapshot(path: str, mmap: bool = True) -> SessionSnapshot:
+    """Read a snapshot written by write_snapshot
+
+    Args:
+        path: Snapshot file
+        mmap: Memory-map the embeddings instead of reading them into memory
+
+    Returns:
+        The snapshot, with embeddings backed by the file when mmap is set
+    """
+    try:
+        data = np.load(path, allow_pickle=False)
+        header = json.loads(data["header"].tobytes().decode("utf-8"))
+    except (OSError, KeyError, IndexError, zipfile.BadZipFile, ValueError) as e:
+        raise ValueError(f"{path} is not a session snapshot: {str(e)}")
+
+    with data:
+        if header.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"{path} is not a session snapshot")
+        if header.get("version", 0) > SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported session snapshot version {header['version']}")
+
+        ids = _decode_strings(data["ids"], data["id_offsets"])
+        texts = _decode_strings(data["texts"], data["text_offsets"])
+        metadatas = [json.loads(value) for value in _decode_strings(data["metadatas"], data["metadata_offsets"])]
+
+        embeddings = _memmap_member(path, "embeddings") if mmap else None
+        if embeddings is None:
+            embeddings = data["embeddings"]
+
+    return SessionSnapshot(
+        header["session_id"],
+        header["model"],
+        ids,
+        embeddings.reshape(len(ids), header["dimensions"]),
+        texts,
+        metadatas,
+        header.get("sources")
+    )
@@ -1,11 +1,13 @@
 import logging
 import os
-from typing import List, Dict, Any, Set
+import hashlib
+from typing import List, Dict, Any, Optional, Set, Tuple
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
 import trafilatura
 from dotenv import load_dotenv
+from app.utils.executors import run_io, run_parse
 
 load_dotenv()
 
@@ -19,15 +21,22 @@ MAX_PAGES_PER_DOMAIN = int(os.getenv("MAX_PAGES_PER_DOMAIN", 50))
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 
-async def crawl_url(start_url: str, max_depth: int = MAX_CRAWL_DEPTH) -> List[Dict[str, Any]]:
+async def crawl_url(
+    start_url: str,
+    max_depth: int = MAX_CRAWL_DEPTH,
+    known_fingerprints: Optional[Dict[str, Optional[str]]] = None
+) -> List[Dict[str, Any]]:
     """Crawl a URL and its subpages to extract text content
     
     Args:
         start_url: The URL to start crawling from
         max_depth: Maximum crawl depth
+        known_fingerprints: Fingerprints of previously ingested pages, by URL; pages
+            whose content still matches are only scanned for links, not chunked
         
     Returns:
-        List of text chunks with metadata
+        One dict per visited page with its "url", "fingerprint" (SHA-256 of the
+        response body) and "chunks" (None if the page is unchanged or failed to load)
     """
     try:
         # Validate URL
@@ -41,7 +50,8 @@ async def crawl_url(start_url: str, max_depth: int = MAX_CRAWL_DEPTH) -> List[Di
         # Initialize variables
         visited_urls: Set[str] = set()
         urls_to_visit: List[Dict[str, Any]] = [{"url": start_url, "depth": 0}]
-        chunks: List[Dict[str, Any]] = []
+        pages: List[Dict[str, Any]] = []
+        known_fingerprints = known_fingerprints or {}
         
         # Crawl until we've visited all URLs or reached the maximum number of pages
         while urls_to_visit and len(visited_urls) < MAX_PAGES_PER_DOMAIN:
@@ -57,11 +67,14 @@ async def crawl_url(start_url: str, max_depth: int = MAX_CRAWL_DEPTH) -> List[Di
             logger.info(f"Crawling URL: {current_url} (depth: {current_depth})")
             
             try:
-                # Mark as visited
+                # Mark as visited; a page that fails to load keeps what was ingested before
                 visited_urls.add(current_url)
+                page = {"url": current_url, "fingerprint": None, "chunks": None}
+                pages.append(page)
                 
                 # Fetch the page
-                response = requests.get(
+                response = await run_io(
+                    requests.get,
                     current_url,
                     headers={
                         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
@@ -72,84 +85,136 @@ async def crawl_url(start_url: str, max_depth: int = MAX_CRAWL_DEPTH) -> List[Di
                 # Skip if not HTML
                 content_type = response.headers.get("Content-Type", "")
                 if "text/html" not in content_type.lower():
+                    pages.pop()
                     continue
                 
-                # Extract text using trafilatura (better content extraction)
-                extracted_text = trafilatura.extract(
-                    response.text,
-                    include_links=True,
-                    include_images=False,
-                    include_tables=True,
-                    output_format="text"
-                )
-                
-                # If trafilatura fails, fall back to BeautifulSoup
-                if not extracted_text:
-                    soup = BeautifulSoup(response.text, "html.parser")
-                    # Remove script and style elements
-                    for script_or_style in soup(["script", "style"]):
-                        script_or_style.extract()
-                    extracted_text = soup.get_text()
-                
-                # Clean up whitespace
-                lines = (line.strip() for line in extracted_text.splitlines())
-                chunks_of_lines = (phrase.strip() for line in lines for phrase in line.split("  "))
-                cleaned_text = "\n".join(chunk for chunk in chunks_of_lines if chunk)
+                page["fingerprint"] = hashlib.sha256(response.content).hexdigest()
+                changed = page["fingerprint"] != known_fingerprints.get(current_url)
+                find_links = current_depth < max_depth
+                if not changed and not find_links:
+                    continue
                 
-                # Split into chunks
-                words = cleaned_text.split()
-                for i in range(0, len(words), CHUNK_SIZE - CHUNK_OVERLAP):
-                    chunk_words = words[i:i + CHUNK_SIZE]
-                    chunk_text = " ".join(chunk_words)
-                    
-                    chunks.append({
-                        "text": chunk_text,
-                        "metadata": {
-                            "source": current_url,
-                            "chunk_index": i // (CHUNK_SIZE - CHUNK_OVERLAP),
-                            "title": get_page_title(response.text)
-                        }
-                    })
+                # Extraction is CPU-bound, so it runs on the parse pool rather than the event loop
+                page_chunks, links = await run_parse(
+                    parse_page, response.text, current_url, base_domain, find_links, changed
+                )
+                if changed:
+                    page["chunks"] = page_chunks
                 
-                # If we haven't reached the maximum depth, find links to crawl
-                if current_depth < max_depth:
-                    # Parse the page to find links
-                    soup = BeautifulSoup(response.text, "html.parser")
-                    links = soup.find_all("a", href=True)
+                for absolute_url in links:
+                    # Skip if we've already visited or queued this URL
+                    if absolute_url in visited_urls or any(item["url"] == absolute_url for item in urls_to_visit):
+                        continue
                     
-                    for link in links:
-                        href = link["href"]
-                        
-                        # Skip empty links, anchors, and non-HTTP links
-                        if not href or href.startswith("#") or href.startswith("javascript:"):
-                            continue
-                        
-                        # Convert relative URLs to absolute URLs
-                        absolute_url = urljoin(current_url, href)
-                        
-                        # Skip URLs from different domains
-                        parsed_link = urlparse(absolute_url)
-                        if parsed_link.netloc != base_domain:
-                            continue
-                        
-                        # Skip if we've already visited or queued this URL
-                        if absolute_url in visited_urls or any(item["url"] == absolute_url for item in urls_to_visit):
-                            continue
-                        
-                        # Add to the queue
-                        urls_to_visit.append({"url": absolute_url, "depth": current_depth + 1})
+                    # Add to the queue
+                    urls_to_visit.append({"url": absolute_url, "depth": current_depth + 1})
             
             except Exception as e:
                 logger.error(f"Error crawling URL {current_url}: {str(e)}")
                 continue
         
-        logger.info(f"Crawling completed. Visited {len(visited_urls)} pages, extracted {len(chunks)} chunks.")
-        return chunks
+        changed_pages = [page for page in pages if page["chunks"] is not None]
+        chunk_count = sum(len(page["chunks"]) for page in changed_pages)
+        logger.info(
+            f"Crawling completed. Visited {len(visited_urls)} pages, "
+            f"extracted {chunk_count} chunks from {len(changed_pages)} new or changed pages."
+        )
+        return pages
     
     except Exception as e:
         logger.error(f"Error in crawl_url: {str(e)}")
         raise
 
+def parse_page(
+    html_content: str,
+    page_url: str,
+    base_domain: str,
+    find_links: bool,
+    extract_text: bool = True
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Extract text chunks and same-domain links from a fetched HTML page
+    
+    Args:
+        html_content: The page HTML
+        page_url: URL the page was fetched from
+        base_domain: Domain that links must stay within
+        find_links: Whether to collect links to crawl next
+        extract_text: Whether to extract and chunk the page text
+        
+    Returns:
+        Tuple of (chunks, absolute link URLs)
+    """
+    chunks: List[Dict[str, Any]] = []
+    links: List[str] = []
+    
+    if extract_text:
+        chunks = extract_chunks(html_content, page_url)
+    
+    # Find links to crawl
+    if find_links:
+        soup = BeautifulSoup(html_content, "html.parser")
+        for link in soup.find_all("a", href=True):
+            href = link["href"]
+            
+            # Skip empty links, anchors, and non-HTTP links
+            if not href or href.startswith("#") or href.startswith("javascript:"):
+                continue
+            
+            # Convert relative URLs to absolute URLs
+            absolute_url = urljoin(page_url, href)
+            
+            # Skip URLs from different domains
+            if urlparse(absolute_url).netloc != base_domain:
+                continue
+            
+            links.append(absolute_url)
+    
+    return chunks, links
+
+def extract_chunks(html_content: str, page_url: str) -> List[Dict[str, Any]]:
+    """Extract the main text of an HTML page and split it into chunks"""
+    chunks: List[Dict[str, Any]] = []
+    
+    # Extract text using trafilatura (better content extraction)
+    extracted_text = trafilatura.extract(
+        html_content,
+        include_links=True,
+        include_images=False,
+        include_tables=True,
+        output_format="text"
+    )
+    
+    # If trafilatura fails, fall back to BeautifulSoup
+    if not extracted_text:
+        soup = BeautifulSoup(html_content, "html.parser")
+        # Remove script and style elements
+        for script_or_style in soup(["script", "style"]):
+            script_or_style.extract()
+        extracted_text = soup.get_text()
+    
+    # Clean up whitespace
+    lines = (line.strip() for line in extracted_text.splitlines())
+    chunks_of_lines = (phrase.strip() for line in lines for phrase in line.split("  "))
+    cleaned_text = "\n".join(chunk for chunk in chunks_of_lines if chunk)
+    
+    # Split into chunks
+    title = get_page_title(html_content)
+    words = cleaned_text.split()
+    for i in range(0, len(words), CHUNK_SIZE - CHUNK_OVERLAP):
+        chunk_words = words[i:i + CHUNK_SIZE]
+        chunk_text = " ".join(chunk_words)
+        
+        chunks.append({
+            "text": chunk_text,
+            "metadata": {
+                "source": page_url,
+                "chunk_index": i // (CHUNK_SIZE - CHUNK_OVERLAP),
+                "title": title
+            }
+        })
+    
+    return chunks
+
 def get_page_title(html_content: str) -> str:
     """Extract the title from an HTML page"""
     try:
@@ -1,13 +1,30 @@
 import os
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
 import json
 import uuid
+import hashlib
+import numpy as np
 from dotenv import load_dotenv
 import vertexai
 from vertexai.language_models import TextEmbeddingModel
 from google.cloud import aiplatform
+from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import Namespace
 from google.oauth2 import service_account
+from app.api.model_registry import model_registry, EMBEDDING_MODEL_KEY, INDEX_ENDPOINT_KEY, INDEX_KEY
+from app.api.session_manifest import session_manifest
+from app.api.answer_cache import semantic_answer_cache
+from app.api.bm25_index import bm25_index, reciprocal_rank_fusion
+from app.api.diversity import diversify
+from app.api.query_batcher import MicroBatcher, QUERY_BATCHING_ENABLED
+from app.api.embedding_cache import embedding_cache
+from app.api.local_vector_store import local_vector_store
+from app.api.session_snapshot import SessionSnapshot
+from app.api.outbound_governor import outbound_governor, is_stale_handle, is_invalid_argument
+from app.utils.helpers import estimate_tokens
+from app.utils.executors import run_io
+from app.utils.single_flight import SingleFlight
 
 load_dotenv()
 
@@ -22,6 +39,52 @@ GCP_SERVICE_ACCOUNT_FILE = os.getenv("GCP_SERVICE_ACCOUNT_FILE")
 VECTOR_INDEX_NAME = os.getenv("VECTOR_INDEX_NAME", "ai-agent-vector-index")
 VECTOR_INDEX_ENDPOINT_NAME = os.getenv("VECTOR_INDEX_ENDPOINT_NAME", "ai-agent-vector-endpoint")
 
+# Batched embedding settings (text-embedding-004 accepts up to 250 inputs / 20k tokens per request)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", 15000))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+
+# Retrieval settings
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 4))
+# Fuse lexical (BM25) and vector results with reciprocal rank fusion
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", 2))
+RRF_K = int(os.getenv("RRF_K", 60))
+# Over-fetch this many times top_k and keep a diverse, de-duplicated subset (MMR)
+MMR_ENABLED = os.getenv("MMR_ENABLED", "true").lower() == "true"
+MMR_CANDIDATE_MULTIPLIER = int(os.getenv("MMR_CANDIDATE_MULTIPLIER", 3))
+
+# Bulk write settings
+STORE_BATCH_MAX_ITEMS = {
+    "vertex_ai": int(os.getenv("VERTEX_UPSERT_BATCH_SIZE", 500)),
+    "pinecone": int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", 100)),
+    "weaviate": int(os.getenv("WEAVIATE_BATCH_SIZE", 100)),
+    "local": 10000
+}
+STORE_BATCH_MAX_BYTES = int(os.getenv("STORE_BATCH_MAX_BYTES", 2000000))
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", 1000))
+
+# Session isolation for Vertex AI queries: datapoints are tagged with a
+# session_id restrict at upsert time. Set VERTEX_SESSION_RESTRICTS=false for
+# indexes populated without restricts to fall back to adaptive over-fetch.
+SESSION_NAMESPACE = "session_id"
+VERTEX_SESSION_RESTRICTS = os.getenv("VERTEX_SESSION_RESTRICTS", "true").lower() == "true"
+OVERFETCH_INITIAL_FACTOR = int(os.getenv("OVERFETCH_INITIAL_FACTOR", 4))
+OVERFETCH_MAX_CANDIDATES = int(os.getenv("OVERFETCH_MAX_CANDIDATES", 1000))
+
+# Optional vector database clients
+try:
+    import pinecone
+    PINECONE_AVAILABLE = True
+except ImportError:
+    PINECONE_AVAILABLE = False
+
+try:
+    import weaviate
+    WEAVIATE_AVAILABLE = True
+except ImportError:
+    WEAVIATE_AVAILABLE = False
+
 # Initialize Vertex AI
 def initialize_vertex_ai():
     """Initialize Vertex AI client"""
@@ -44,9 +107,46 @@ def initialize_vertex_ai():
 # Initialize Vertex AI
 initialize_vertex_ai()
 
+# Initialize the optional vector database clients
+weaviate_client = None
+if VECTOR_DB_TYPE == "pinecone" and PINECONE_AVAILABLE:
+    pinecone.init(
+        api_key=os.getenv("PINECONE_API_KEY"),
+        environment=os.getenv("PINECONE_ENVIRONMENT")
+    )
+elif VECTOR_DB_TYPE == "weaviate" and WEAVIATE_AVAILABLE:
+    weaviate_api_key = os.getenv("WEAVIATE_API_KEY")
+    weaviate_client = weaviate.Client(
+        url=os.getenv("WEAVIATE_URL"),
+        auth_client_secret=weaviate.AuthApiKey(api_key=weaviate_api_key) if weaviate_api_key else None
+    )
+
+async def _embed_queries(texts: List[str]) -> List[List[float]]:
+    """Embed a micro-batch of concurrent queries with one request and cache the results"""
+    model = await model_registry.get_embedding_model_async()
+    embeddings = await _embed_batch(model, texts)
+    await run_io(embedding_cache.put_many, texts, embeddings)
+    return embeddings
+
+# Concurrent /ask and /webhook queries share embedding requests
+query_embedding_batcher = MicroBatcher(_embed_queries)
+
+# Identical queries already in flight share one embedding and one retrieval
+embedding_flight = SingleFlight("embedding")
+retrieval_flight = SingleFlight("retrieval")
+
+async def _embed_query(text: str) -> List[float]:
+    if QUERY_BATCHING_ENABLED:
+        return await query_embedding_batcher.submit(text)
+    return (await _embed_queries([text]))[0]
+
 async def generate_embeddings(text: str) -> List[float]:
     """Generate embeddings for a text using Google's text-embedding-004 model
     
+    Uncached texts go through the query micro-batcher, so concurrent callers
+    share one embedding request, and a text already being embedded is not
+    sent again.
+    
     Args:
         text: The text to generate embeddings for
         
@@ -54,75 +154,370 @@ async def generate_embeddings(text: str) -> List[float]:
         A list of floats representing the embedding vector
     """
     try:
+        cached = await run_io(embedding_cache.get, text)
+        if cached is not None:
+            return cached
+        
         # Using Google Vertex AI text-embedding-004
-        model = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL)
-        embeddings = model.get_embeddings([text])
-        return embeddings[0].values
+        return await embedding_flight.do(text, lambda: _embed_query(text))
     except Exception as e:
         logger.error(f"Error generating embeddings: {str(e)}")
+        if is_stale_handle(e):
+            model_registry.invalidate(EMBEDDING_MODEL_KEY)
         raise
 
-async def add_to_vector_store(chunks: List[Dict[str, Any]], session_id: str, source: str) -> None:
-    """Add text chunks to the vector store
+def plan_embedding_batches(
+    texts: List[str],
+    max_items: int = EMBEDDING_BATCH_SIZE,
+    max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS
+) -> List[List[int]]:
+    """Group texts into embedding batches bounded by item count and estimated tokens
+    
+    Args:
+        texts: The texts to embed
+        max_items: Maximum number of texts per batch
+        max_tokens: Maximum estimated tokens per batch
+        
+    Returns:
+        List of batches, each a list of indexes into texts (in original order)
+    """
+    batches = []
+    current: List[int] = []
+    current_tokens = 0
+    
+    for index, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        
+        # Close the current batch if this text would overflow it
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        
+        # Oversized texts still go alone; the model truncates them
+        current.append(index)
+        current_tokens += tokens
+    
+    if current:
+        batches.append(current)
+    
+    return batches
+
+async def _embed_batch(model: TextEmbeddingModel, texts: List[str]) -> List[List[float]]:
+    """Embed one batch of texts with the SDK's native async client"""
+    embeddings = await outbound_governor.call("embedding", lambda: model.get_embeddings_async(texts))
+    return [embedding.values for embedding in embeddings]
+
+async def _embed_batch_isolating_errors(
+    model: TextEmbeddingModel,
+    texts: List[str],
+    indexes: List[int],
+    results: List[Optional[List[float]]],
+    errors: Dict[int, str]
+) -> None:
+    """Embed a batch, splitting it when rejected so that only the offending chunks are reported
+    
+    Only an invalid-argument error can be caused by some of the texts; any
+    other failure (quota, outage, permissions) fails the whole batch at once.
+    """
+    try:
+        embeddings = await _embed_batch(model, [texts[i] for i in indexes])
+        for index, embedding in zip(indexes, embeddings):
+            results[index] = embedding
+    except Exception as e:
+        if is_stale_handle(e):
+            model_registry.invalidate(EMBEDDING_MODEL_KEY)
+        if len(indexes) == 1 or not is_invalid_argument(e):
+            for index in indexes:
+                errors[index] = str(e)
+            return
+        middle = len(indexes) // 2
+        await _embed_batch_isolating_errors(model, texts, indexes[:middle], results, errors)
+        await _embed_batch_isolating_errors(model, texts, indexes[middle:], results, errors)
+
+async def generate_embeddings_batch(
+    texts: List[str],
+    max_concurrency: int = EMBEDDING_MAX_CONCURRENCY
+) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+    """Generate embeddings for many texts using batched, concurrent requests
+    
+    Args:
+        texts: The texts to generate embeddings for
+        max_concurrency: Maximum number of batches in flight at once
+        
+    Returns:
+        Tuple of (embeddings, errors). embeddings is aligned with texts and holds
+        None for every text that failed; errors maps those indexes to the error message.
+    """
+    results: List[Optional[List[float]]] = await run_io(embedding_cache.get_many, texts)
+    errors: Dict[int, str] = {}
+    
+    # Only embed texts that aren't cached, and each distinct text once
+    pending: Dict[str, List[int]] = {}
+    for index, (text, embedding) in enumerate(zip(texts, results)):
+        if embedding is None:
+            pending.setdefault(text, []).append(index)
+    if not pending:
+        return results, errors
+    
+    unique_texts = list(pending.keys())
+    unique_results: List[Optional[List[float]]] = [None] * len(unique_texts)
+    unique_errors: Dict[int, str] = {}
+    
+    model = await model_registry.get_embedding_model_async()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    
+    async def run_batch(indexes: List[int]) -> None:
+        async with semaphore:
+            await _embed_batch_isolating_errors(model, unique_texts, indexes, unique_results, unique_errors)
+    
+    batches = plan_embedding_batches(unique_texts, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_MAX_TOKENS)
+    await asyncio.gather(*(run_batch(indexes) for indexes in batches))
+    
+    embedded = [(text, embedding) for text, embedding in zip(unique_texts, unique_results) if embedding is not None]
+    await run_io(embedding_cache.put_many, [text for text, _ in embedded], [embedding for _, embedding in embedded])
+    
+    for unique_index, text in enumerate(unique_texts):
+        for index in pending[text]:
+            results[index] = unique_results[unique_index]
+            if unique_index in unique_errors:
+                errors[index] = unique_errors[unique_index]
+    
+    logger.info(
+        f"Embedded {len(texts) - len(errors)}/{len(texts)} texts "
+        f"({len(unique_texts)} uncached) in {len(batches)} batches"
+    )
+    return results, errors
+
+def chunk_hash(chunk: Dict[str, Any]) -> str:
+    """Hash a chunk's text and metadata (excluding the session) to detect changes on re-ingest"""
+    metadata = {key: value for key, value in chunk["metadata"].items() if key != "session_id"}
+    payload = chunk["text"] + "\0" + json.dumps(metadata, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+async def add_to_vector_store(
+    chunks: List[Dict[str, Any]],
+    session_id: str,
+    source: str,
+    fingerprint: Optional[str] = None,
+    crawl: Optional[str] = None
+) -> Dict[str, int]:
+    """Add text chunks to the vector store, replacing what was ingested before for the source
+    
+    Chunks are compared with the source's previous ingest by chunk hash: only
+    new or changed chunks are embedded and written, chunks that are no longer
+    present are deleted, and unchanged chunks keep their vectors.
     
     Args:
         chunks: List of text chunks with metadata
         session_id: Session ID for grouping related chunks
-        source: Source of the chunks (filename or URL)
+        source: Source of the chunks (filename or page URL)
+        fingerprint: Hash of the source file or page, recorded so identical re-ingests can be skipped
+        crawl: URL of the crawl a page was found by
+        
+    Returns:
+        Counts of "added", "unchanged" and "removed" chunks
     """
     try:
+        previous = session_manifest.source_chunks(session_id, source)
+        
+        # Reuse the vectors of chunks that are still present (matching duplicates one to one)
+        current: Dict[str, List[str]] = {}
+        new_chunks: List[Dict[str, Any]] = []
+        new_hashes: List[str] = []
         for chunk in chunks:
-            # Generate a unique ID for the chunk
-            chunk_id = str(uuid.uuid4())
+            key = chunk_hash(chunk)
+            if previous.get(key):
+                current.setdefault(key, []).append(previous[key].pop())
+            else:
+                new_chunks.append(chunk)
+                new_hashes.append(key)
+        stale_ids = [chunk_id for ids in previous.values() for chunk_id in ids]
+        
+        # Generate embeddings for the new chunks in batches
+        embeddings, errors = await generate_embeddings_batch([chunk["text"] for chunk in new_chunks])
+        
+        for index, error in sorted(errors.items()):
+            logger.error(f"Error generating embeddings for chunk {index} of {source}: {error}")
+        if new_chunks and len(errors) == len(new_chunks):
+            raise RuntimeError(f"Failed to generate embeddings for all {len(new_chunks)} new chunks of {source}")
+        
+        items = []
+        for chunk, key, embedding in zip(new_chunks, new_hashes, embeddings):
+            if embedding is None:
+                continue
             
             # Add session_id to metadata
             chunk["metadata"]["session_id"] = session_id
             
-            # Generate embeddings for the chunk
-            embedding = await generate_embeddings(chunk["text"])
+            items.append({
+                "id": str(uuid.uuid4()),
+                "text": chunk["text"],
+                "embedding": embedding,
+                "metadata": chunk["metadata"]
+            })
+            current.setdefault(key, []).append(items[-1]["id"])
+        
+        # Store in the appropriate vector database with bulk writes
+        if items:
+            await store_batch(items)
             
-            # Store in the appropriate vector database
-            if VECTOR_DB_TYPE == "vertex_ai":
-                await store_in_vertex_ai(chunk_id, chunk["text"], embedding, chunk["metadata"])
-            elif VECTOR_DB_TYPE == "pinecone" and PINECONE_AVAILABLE:
-                await store_in_pinecone(chunk_id, embedding, chunk["text"], chunk["metadata"])
-            elif VECTOR_DB_TYPE == "weaviate" and WEAVIATE_AVAILABLE:
-                await store_in_weaviate(chunk_id, embedding, chunk["text"], chunk["metadata"])
-            else:
-                logger.warning(f"Unsupported vector database type: {VECTOR_DB_TYPE}")
+            # Keep the lexical index in step with the vectors
+            await run_io(
+                bm25_index.add,
+                session_id,
+                [item["id"] for item in items],
+                [item["text"] for item in items],
+                [item["metadata"] for item in items]
+            )
+        
+        if stale_ids:
+            await delete_chunks(session_id, stale_ids)
+        
+        # Remember which vectors belong to the source so re-ingests and deletes can find them.
+        # A partial failure records no fingerprint, so the next upload of the file is retried.
+        await run_io(
+            session_manifest.replace_source,
+            session_id,
+            source,
+            fingerprint if not errors else None,
+            current,
+            crawl
+        )
+        
+        # Answers computed against the old documents are stale now
+        if items or stale_ids:
+            semantic_answer_cache.invalidate(session_id)
+        
+        unchanged = len(chunks) - len(new_chunks)
+        logger.info(f"Ingested {source}: {len(items)} added, {unchanged} unchanged, {len(stale_ids)} removed")
+        return {"added": len(items), "unchanged": unchanged, "removed": len(stale_ids)}
     except Exception as e:
         logger.error(f"Error adding to vector store: {str(e)}")
         raise
 
-async def store_in_vertex_ai(chunk_id: str, text: str, embedding: List[float], metadata: Dict[str, Any]) -> None:
-    """Store a chunk in Vertex AI Vector Search"""
+def _estimate_item_bytes(item: Dict[str, Any]) -> int:
+    """Roughly estimate the request payload size of one vector item"""
+    metadata_bytes = sum(len(str(key)) + len(str(value)) for key, value in item["metadata"].items())
+    return len(item["embedding"]) * 12 + len(item["text"].encode("utf-8")) + metadata_bytes
+
+def plan_store_batches(
+    items: List[Dict[str, Any]],
+    max_items: int,
+    max_bytes: int = STORE_BATCH_MAX_BYTES
+) -> List[List[Dict[str, Any]]]:
+    """Split items into write batches bounded by item count and payload size
+    
+    The last, partially filled batch is always included.
+    """
+    batches = []
+    current: List[Dict[str, Any]] = []
+    current_bytes = 0
+    
+    for item in items:
+        size = _estimate_item_bytes(item)
+        if current and (len(current) >= max_items or current_bytes + size > max_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(item)
+        current_bytes += size
+    
+    if current:
+        batches.append(current)
+    
+    return batches
+
+async def _write(func: Callable[..., Awaitable[None]], *args) -> None:
+    """Run one vector database write through the outbound governor
+    
+    Quota and transient server errors are retried there; other errors, such
+    as a rejected payload or a missing index, are raised straight away.
+    """
+    await outbound_governor.call("vector_write", lambda: func(*args))
+
+async def store_batch(items: List[Dict[str, Any]]) -> None:
+    """Store many vectors in the configured vector database using bulk writes
+    
+    Args:
+        items: Dicts with "id", "text", "embedding" and "metadata" (metadata must hold session_id)
+    """
+    if not items:
+        return
+    
+    if VECTOR_DB_TYPE == "vertex_ai":
+        writer = store_batch_in_vertex_ai
+    elif VECTOR_DB_TYPE == "local":
+        writer = store_batch_in_local
+    elif VECTOR_DB_TYPE == "pinecone" and PINECONE_AVAILABLE:
+        writer = store_batch_in_pinecone
+    elif VECTOR_DB_TYPE == "weaviate" and WEAVIATE_AVAILABLE:
+        writer = store_batch_in_weaviate
+    else:
+        logger.warning(f"Unsupported vector database type: {VECTOR_DB_TYPE}")
+        return
+    
+    batches = plan_store_batches(items, STORE_BATCH_MAX_ITEMS.get(VECTOR_DB_TYPE, 100))
+    for batch in batches:
+        await _write(writer, batch)
+    
+    logger.info(f"Stored {len(items)} vectors in {VECTOR_DB_TYPE} with {len(batches)} batch writes")
+
+async def store_batch_in_vertex_ai(items: List[Dict[str, Any]]) -> None:
+    """Store a batch of chunks in Vertex AI Vector Search with a single upsert"""
     try:
         # Get the index name from environment variables
         index_name = os.getenv("VECTOR_INDEX_NAME")
         if not index_name:
             raise ValueError("VECTOR_INDEX_NAME environment variable not set")
         
-        # Get the index endpoint
-        index_endpoint = aiplatform.MatchingEngineIndexEndpoint.list(
-            filter=f'display_name="{index_name}"'
-        )[0]
+        # Get the shared index endpoint
+        index_endpoint = await model_registry.get_index_endpoint_async()
         
-        # Convert metadata to strings
-        string_metadata = {k: str(v) for k, v in metadata.items()}
+        # Convert metadata to strings and tag each datapoint with its session
+        # so queries can restrict the search to that session
+        datapoints = [
+            [
+                item["id"],
+                item["embedding"],
+                {k: str(v) for k, v in item["metadata"].items()},
+                [{"namespace": SESSION_NAMESPACE, "allow_list": [item["metadata"]["session_id"]]}]
+            ]
+            for item in items
+        ]
         
-        # Add the document to the index
-        index_endpoint.upsert(
-            embeddings=[[chunk_id, embedding, string_metadata]],
-            deployed_index_id=index_name
-        )
+        # Add the documents to the index
+        await run_io(index_endpoint.upsert, embeddings=datapoints, deployed_index_id=index_name)
         
-        logger.info(f"Stored chunk {chunk_id} in Vertex AI Vector Search")
+        logger.info(f"Stored {len(items)} chunks in Vertex AI Vector Search")
     except Exception as e:
         logger.error(f"Error storing in Vertex AI: {str(e)}")
+        if is_stale_handle(e):
+            model_registry.invalidate(INDEX_ENDPOINT_KEY)
         raise
 
-async def store_in_pinecone(chunk_id: str, embedding: List[float], text: str, metadata: Dict[str, Any]) -> None:
-    """Store a chunk in Pinecone"""
+async def store_batch_in_local(items: List[Dict[str, Any]]) -> None:
+    """Store a batch of chunks in the in-process vector store"""
+    try:
+        by_session: Dict[str, List[Dict[str, Any]]] = {}
+        for item in items:
+            by_session.setdefault(item["metadata"]["session_id"], []).append(item)
+        
+        for session_id, session_items in by_session.items():
+            await run_io(
+                local_vector_store.add,
+                session_id,
+                [item["id"] for item in session_items],
+                [item["embedding"] for item in session_items],
+                [item["text"] for item in session_items],
+                [item["metadata"] for item in session_items]
+            )
+    except Exception as e:
+        logger.error(f"Error storing in local vector store: {str(e)}")
+        raise
+
+async def store_batch_in_pinecone(items: List[Dict[str, Any]]) -> None:
+    """Store a batch of chunks in Pinecone with a single upsert"""
     try:
         # Get the index name from environment variables
         index_name = os.getenv("PINECONE_INDEX_NAME")
@@ -133,85 +528,399 @@ async def store_in_pinecone(chunk_id: str, embedding: List[float], text: str, me
         index = pinecone.Index(index_name)
         
         # Add text to metadata
-        metadata["text"] = text
+        vectors = [
+            (item["id"], item["embedding"], {**item["metadata"], "text": item["text"]})
+            for item in items
+        ]
         
-        # Upsert the vector
-        index.upsert([(chunk_id, embedding, metadata)])
+        # Upsert the vectors
+        await run_io(index.upsert, vectors=vectors)
         
-        logger.info(f"Stored chunk {chunk_id} in Pinecone")
+        logger.info(f"Stored {len(items)} chunks in Pinecone")
     except Exception as e:
         logger.error(f"Error storing in Pinecone: {str(e)}")
         raise
 
-async def store_in_weaviate(chunk_id: str, embedding: List[float], text: str, metadata: Dict[str, Any]) -> None:
-    """Store a chunk in Weaviate"""
+def _ensure_weaviate_class(class_name: str) -> None:
+    """Create the Weaviate class if it doesn't exist yet"""
+    if weaviate_client.schema.exists(class_name):
+        return
+    class_obj = {
+        "class": class_name,
+        "vectorizer": "none",  # We're providing our own vectors
+        "properties": [
+            {"name": "text", "dataType": ["text"]},
+            {"name": "source", "dataType": ["string"]},
+            {"name": "session_id", "dataType": ["string"]},
+            # Add other metadata properties as needed
+        ]
+    }
+    weaviate_client.schema.create_class(class_obj)
+
+def _import_weaviate_batch(class_name: str, items: List[Dict[str, Any]]) -> None:
+    """Import objects through the Weaviate batch API"""
+    _ensure_weaviate_class(class_name)
+    
+    failed = []
+    with weaviate_client.batch(batch_size=len(items), dynamic=False) as batch:
+        for item in items:
+            batch.add_data_object(
+                data_object={"text": item["text"], **item["metadata"]},
+                class_name=class_name,
+                uuid=item["id"],
+                vector=item["embedding"]
+            )
+        results = batch.create_objects()
+    
+    for result in results or []:
+        errors = result.get("result", {}).get("errors")
+        if errors:
+            failed.append(errors)
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(items)} Weaviate objects failed: {failed[0]}")
+
+async def store_batch_in_weaviate(items: List[Dict[str, Any]]) -> None:
+    """Store a batch of chunks in Weaviate with a batch import"""
     try:
         # Define the class name
         class_name = "Document"
         
-        # Check if the class exists, create it if it doesn't
-        if not weaviate_client.schema.exists(class_name):
-            class_obj = {
-                "class": class_name,
-                "vectorizer": "none",  # We're providing our own vectors
-                "properties": [
-                    {"name": "text", "dataType": ["text"]},
-                    {"name": "source", "dataType": ["string"]},
-                    {"name": "session_id", "dataType": ["string"]},
-                    # Add other metadata properties as needed
-                ]
-            }
-            weaviate_client.schema.create_class(class_obj)
+        await run_io(_import_weaviate_batch, class_name, items)
         
-        # Prepare the data object
-        data_object = {
-            "text": text,
-            **metadata
-        }
+        logger.info(f"Stored {len(items)} chunks in Weaviate")
+    except Exception as e:
+        logger.error(f"Error storing in Weaviate: {str(e)}")
+        raise
+
+async def store_in_vertex_ai(chunk_id: str, text: str, embedding: List[float], metadata: Dict[str, Any]) -> None:
+    """Store a chunk in Vertex AI Vector Search"""
+    await store_batch_in_vertex_ai([{"id": chunk_id, "text": text, "embedding": embedding, "metadata": metadata}])
+
+async def store_in_local(chunk_id: str, embedding: List[float], text: str, metadata: Dict[str, Any]) -> None:
+    """Store a chunk in the in-process vector store"""
+    await store_batch_in_local([{"id": chunk_id, "text": text, "embedding": embedding, "metadata": metadata}])
+
+async def store_in_pinecone(chunk_id: str, embedding: List[float], text: str, metadata: Dict[str, Any]) -> None:
+    """Store a chunk in Pinecone"""
+    await store_batch_in_pinecone([{"id": chunk_id, "text": text, "embedding": embedding, "metadata": metadata}])
+
+async def store_in_weaviate(chunk_id: str, embedding: List[float], text: str, metadata: Dict[str, Any]) -> None:
+    """Store a chunk in Weaviate"""
+    await store_batch_in_weaviate([{"id": chunk_id, "text": text, "embedding": embedding, "metadata": metadata}])
+
+async def delete_vectors_for_session(session_id: str) -> int:
+    """Delete every vector a session owns from the vector database
+    
+    Args:
+        session_id: Session whose vectors should be removed
         
-        # Add the object with the vector
-        weaviate_client.data_object.create(
-            class_name=class_name,
-            data_object=data_object,
-            uuid=chunk_id,
-            vector=embedding
-        )
+    Returns:
+        Number of vectors removed
+    """
+    try:
+        chunk_ids = session_manifest.chunk_ids(session_id)
+        
+        if VECTOR_DB_TYPE == "local":
+            removed = await run_io(local_vector_store.delete_session, session_id)
+        elif VECTOR_DB_TYPE == "weaviate" and WEAVIATE_AVAILABLE:
+            await _write(delete_session_from_weaviate, session_id)
+            removed = len(chunk_ids)
+        elif VECTOR_DB_TYPE in ("vertex_ai", "pinecone"):
+            if VECTOR_DB_TYPE == "vertex_ai":
+                writer = delete_batch_from_vertex_ai
+            elif PINECONE_AVAILABLE:
+                writer = delete_batch_from_pinecone
+            else:
+                logger.warning(f"Unsupported vector database type: {VECTOR_DB_TYPE}")
+                return 0
+            for start in range(0, len(chunk_ids), DELETE_BATCH_SIZE):
+                await _write(writer, chunk_ids[start:start + DELETE_BATCH_SIZE])
+            removed = len(chunk_ids)
+        else:
+            logger.warning(f"Unsupported vector database type: {VECTOR_DB_TYPE}")
+            return 0
         
-        logger.info(f"Stored chunk {chunk_id} in Weaviate")
+        await run_io(session_manifest.drop, session_id)
+        await run_io(bm25_index.drop_session, session_id)
+        semantic_answer_cache.invalidate(session_id)
+        logger.info(f"Deleted {removed} vectors for session {session_id}")
+        return removed
     except Exception as e:
-        logger.error(f"Error storing in Weaviate: {str(e)}")
+        logger.error(f"Error deleting vectors for session {session_id}: {str(e)}")
         raise
 
-async def query_vector_store(query: str, session_id: str, top_k: int = 5) -> List[Dict[str, Any]]:
-    """Query the vector store for relevant chunks
+async def export_session(session_id: str) -> SessionSnapshot:
+    """Collect a session's chunks, metadata and embeddings into a snapshot
+    
+    The local store exports its stored vectors. Remote backends don't return
+    chunk text, so their chunks come from the session's BM25 chunk log and
+    their embeddings from the embedding cache, embedding only cache misses.
     
     Args:
-        query: The query to search for
-        session_id: Session ID to filter results
-        top_k: Number of results to return
+        session_id: Session to export
         
     Returns:
-        List of relevant text chunks with metadata
+        Snapshot of the session (empty if the session has no chunks)
+    """
+    try:
+        if VECTOR_DB_TYPE == "local":
+            exported = await run_io(local_vector_store.export, session_id)
+            ids, embeddings, texts, metadatas = exported or ([], np.empty((0, 0), dtype=np.float32), [], [])
+        else:
+            ids, texts, metadatas = await run_io(bm25_index.chunks, session_id)
+            vectors, errors = await generate_embeddings_batch(texts)
+            if errors:
+                raise RuntimeError(f"Failed to embed {len(errors)} chunks of session {session_id}")
+            embeddings = np.asarray(vectors, dtype=np.float32) if vectors else np.empty((0, 0), dtype=np.float32)
+        
+        sources = await run_io(session_manifest.source_entries, session_id)
+        logger.info(f"Exported {len(ids)} chunks of session {session_id}")
+        return SessionSnapshot(session_id, EMBEDDING_MODEL, ids, embeddings, texts, metadatas, sources)
+    except Exception as e:
+        logger.error(f"Error exporting session {session_id}: {str(e)}")
+        raise
+
+async def import_session(snapshot: SessionSnapshot, session_id: Optional[str] = None) -> int:
+    """Load a snapshot into a session without re-embedding, replacing what the session held
+    
+    Args:
+        snapshot: Snapshot to load (its embeddings may be memory-mapped)
+        session_id: Target session, defaulting to the session the snapshot was taken from
+        
+    Returns:
+        Number of chunks imported
     """
+    if snapshot.model != EMBEDDING_MODEL:
+        raise ValueError(f"Snapshot was embedded with {snapshot.model}, but this server uses {EMBEDDING_MODEL}")
+    
+    target = session_id or snapshot.session_id
     try:
-        # Generate embeddings for the query
-        query_embedding = await generate_embeddings(query)
+        if await run_io(session_manifest.chunk_ids, target) or await run_io(local_vector_store.count, target):
+            await delete_vectors_for_session(target)
+        
+        # Vector ids must stay unique when a snapshot is loaded into another session
+        ids = snapshot.ids
+        sources = snapshot.sources
+        if target != snapshot.session_id:
+            renamed = {chunk_id: str(uuid.uuid4()) for chunk_id in ids}
+            ids = [renamed[chunk_id] for chunk_id in ids]
+            sources = {
+                source: {
+                    **entry,
+                    "chunks": {
+                        key: [renamed[chunk_id] for chunk_id in chunk_ids if chunk_id in renamed]
+                        for key, chunk_ids in entry.get("chunks", {}).items()
+                    }
+                }
+                for source, entry in sources.items()
+            }
+        metadatas = [{**metadata, "session_id": target} for metadata in snapshot.metadatas]
+        
+        if snapshot.count:
+            if VECTOR_DB_TYPE == "local":
+                # One bulk append straight from the (memory-mapped) snapshot rows
+                await run_io(local_vector_store.add, target, ids, snapshot.embeddings, snapshot.texts, metadatas)
+            else:
+                await store_batch([
+                    {"id": chunk_id, "text": text, "embedding": embedding.tolist(), "metadata": metadata}
+                    for chunk_id, text, embedding, metadata in zip(ids, snapshot.texts, snapshot.embeddings, metadatas)
+                ])
+            await run_io(bm25_index.add, target, ids, snapshot.texts, metadatas)
+        
+        for source, entry in sources.items():
+            await run_io(
+                session_manifest.replace_source,
+                target,
+                source,
+                entry.get("fingerprint"),
+                entry.get("chunks", {}),
+                entry.get("crawl")
+            )
+        semantic_answer_cache.invalidate(target)
         
-        # Query the appropriate vector database
+        logger.info(f"Imported {snapshot.count} chunks into session {target}")
+        return snapshot.count
+    except Exception as e:
+        logger.error(f"Error importing snapshot into session {target}: {str(e)}")
+        raise
+
+async def delete_chunks(session_id: str, chunk_ids: List[str]) -> None:
+    """Delete specific chunks of a session from the vector database and lexical index"""
+    if VECTOR_DB_TYPE == "local":
+        await run_io(local_vector_store.delete, session_id, chunk_ids)
+    elif VECTOR_DB_TYPE in ("vertex_ai", "pinecone", "weaviate"):
         if VECTOR_DB_TYPE == "vertex_ai":
-            return await query_vertex_ai(query_embedding, session_id, top_k)
+            writer = delete_batch_from_vertex_ai
         elif VECTOR_DB_TYPE == "pinecone" and PINECONE_AVAILABLE:
-            return await query_pinecone(query_embedding, session_id, top_k)
+            writer = delete_batch_from_pinecone
         elif VECTOR_DB_TYPE == "weaviate" and WEAVIATE_AVAILABLE:
-            return await query_weaviate(query_embedding, session_id, top_k)
+            writer = delete_batch_from_weaviate
         else:
             logger.warning(f"Unsupported vector database type: {VECTOR_DB_TYPE}")
-            return []
+            return
+        for start in range(0, len(chunk_ids), DELETE_BATCH_SIZE):
+            await _write(writer, chunk_ids[start:start + DELETE_BATCH_SIZE])
+    else:
+        logger.warning(f"Unsupported vector database type: {VECTOR_DB_TYPE}")
+        return
+    
+    await run_io(bm25_index.remove, session_id, chunk_ids)
+
+async def delete_batch_from_vertex_ai(chunk_ids: List[str]) -> None:
+    """Remove a batch of datapoints from Vertex AI Vector Search"""
+    try:
+        index = await model_registry.get_index_async()
+        await run_io(index.remove_datapoints, datapoint_ids=chunk_ids)
+    except Exception as e:
+        logger.error(f"Error deleting from Vertex AI: {str(e)}")
+        if is_stale_handle(e):
+            model_registry.invalidate(INDEX_KEY)
+        raise
+
+async def delete_batch_from_pinecone(chunk_ids: List[str]) -> None:
+    """Remove a batch of vectors from Pinecone"""
+    index_name = os.getenv("PINECONE_INDEX_NAME")
+    if not index_name:
+        raise ValueError("PINECONE_INDEX_NAME environment variable not set")
+    await run_io(pinecone.Index(index_name).delete, ids=chunk_ids)
+
+async def delete_session_from_weaviate(session_id: str) -> None:
+    """Remove a session's objects from Weaviate with one batch delete"""
+    await run_io(
+        weaviate_client.batch.delete_objects,
+        class_name="Document",
+        where={
+            "path": ["session_id"],
+            "operator": "Equal",
+            "valueString": session_id
+        }
+    )
+
+async def delete_batch_from_weaviate(chunk_ids: List[str]) -> None:
+    """Remove a batch of objects from Weaviate by id"""
+    await run_io(
+        weaviate_client.batch.delete_objects,
+        class_name="Document",
+        where={
+            "path": ["id"],
+            "operator": "ContainsAny",
+            "valueTextArray": chunk_ids
+        }
+    )
+
+async def query_vector_store(query: str, session_id: str, top_k: int = RETRIEVAL_TOP_K) -> List[Dict[str, Any]]:
+    """Query the vector store for relevant chunks
+    
+    When hybrid search is enabled, vector results are fused with BM25 matches
+    from the session's lexical index so exact identifiers are found too. With
+    MMR enabled, a larger candidate pool is narrowed to a diverse set without
+    overlapping or near-identical chunks, which may hold fewer than top_k.
+    Identical queries arriving while one is in flight share its results, which
+    callers must therefore not modify.
+    
+    Args:
+        query: The query to search for
+        session_id: Session ID to filter results
+        top_k: Maximum number of results to return
+        
+    Returns:
+        List of relevant text chunks with metadata
+    """
+    try:
+        return await retrieval_flight.do(
+            (session_id, query, top_k),
+            lambda: _retrieve(query, session_id, top_k)
+        )
     except Exception as e:
         logger.error(f"Error querying vector store: {str(e)}")
         raise
 
-async def query_vertex_ai(query_embedding: List[float], session_id: str, top_k: int) -> List[Dict[str, Any]]:
+async def _retrieve(query: str, session_id: str, top_k: int) -> List[Dict[str, Any]]:
+    """Run the vector (and optionally lexical and MMR) retrieval for one query"""
+    # Generate embeddings for the query
+    query_embedding = await generate_embeddings(query)
+    
+    pool_size = top_k * MMR_CANDIDATE_MULTIPLIER if MMR_ENABLED else top_k
+    num_candidates = pool_size * HYBRID_CANDIDATE_MULTIPLIER if HYBRID_SEARCH_ENABLED else pool_size
+    candidates = await query_vector_backend(query_embedding, session_id, num_candidates, include_vectors=MMR_ENABLED)
+    # Fusion orders by rank only; keep the vector similarity for the model router
+    for candidate in candidates:
+        candidate["vector_score"] = candidate["score"]
+    
+    # MMR measures redundancy on the stored vectors, which callers don't need
+    embeddings = [candidate.pop("embedding", None) for candidate in candidates]
+    by_id = {candidate["id"]: embedding for candidate, embedding in zip(candidates, embeddings)}
+    
+    if HYBRID_SEARCH_ENABLED:
+        lexical_results = await run_io(bm25_index.search, session_id, query, num_candidates)
+        candidates = reciprocal_rank_fusion([candidates, lexical_results], k=RRF_K)[:pool_size]
+    
+    if not MMR_ENABLED or len(candidates) <= 1:
+        return candidates[:top_k]
+    
+    # Chunks found only by BM25 have no vector; diversify ranks them by position alone
+    return diversify(candidates, [by_id.get(candidate.get("id")) for candidate in candidates], top_k)
+
+async def query_vector_backend(
+    query_embedding: List[float],
+    session_id: str,
+    top_k: int,
+    include_vectors: bool = False
+) -> List[Dict[str, Any]]:
+    """Query the configured vector database for a session's nearest chunks
+    
+    With include_vectors, each result also carries its stored vector under
+    "embedding", so callers never have to embed the chunk texts again.
+    """
+    if VECTOR_DB_TYPE == "vertex_ai":
+        return await query_vertex_ai(query_embedding, session_id, top_k, include_vectors)
+    elif VECTOR_DB_TYPE == "local":
+        return await query_local(query_embedding, session_id, top_k, include_vectors)
+    elif VECTOR_DB_TYPE == "pinecone" and PINECONE_AVAILABLE:
+        return await query_pinecone(query_embedding, session_id, top_k, include_vectors)
+    elif VECTOR_DB_TYPE == "weaviate" and WEAVIATE_AVAILABLE:
+        return await query_weaviate(query_embedding, session_id, top_k, include_vectors)
+    else:
+        logger.warning(f"Unsupported vector database type: {VECTOR_DB_TYPE}")
+        return []
+
+async def adaptive_overfetch(
+    fetch: Callable[[int], Awaitable[List[Dict[str, Any]]]],
+    session_id: str,
+    top_k: int,
+    initial_factor: int = OVERFETCH_INITIAL_FACTOR,
+    max_candidates: int = OVERFETCH_MAX_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """Widen an unfiltered nearest-neighbour search until top_k in-session results are found
+    
+    Args:
+        fetch: Returns the best n results across all sessions for a given n
+        session_id: Session to keep results for
+        top_k: Number of in-session results wanted
+        initial_factor: First fetch asks for top_k * initial_factor candidates
+        max_candidates: Upper bound on the number of candidates requested
+        
+    Returns:
+        Up to top_k in-session results, best first
+    """
+    num_candidates = min(max(top_k, top_k * initial_factor), max_candidates)
+    while True:
+        candidates = await fetch(num_candidates)
+        matches = [result for result in candidates if result["metadata"].get("session_id") == session_id]
+        
+        # Stop once we have enough, the index is exhausted, or we hit the cap
+        if len(matches) >= top_k or len(candidates) < num_candidates or num_candidates >= max_candidates:
+            return matches[:top_k]
+        
+        num_candidates = min(num_candidates * 4, max_candidates)
+        logger.info(f"Only {len(matches)}/{top_k} neighbours in session, widening search to {num_candidates}")
+
+async def query_vertex_ai(
+    query_embedding: List[float],
+    session_id: str,
+    top_k: int,
+    include_vectors: bool = False
+) -> List[Dict[str, Any]]:
     """Query Vertex AI Vector Search"""
     try:
         # Get the index name from environment variables
@@ -219,41 +928,65 @@ async def query_vertex_ai(query_embedding: List[float], session_id: str, top_k:
         if not index_name:
             raise ValueError("VECTOR_INDEX_NAME environment variable not set")
         
-        # Get the index endpoint
-        index_endpoint = aiplatform.MatchingEngineIndexEndpoint.list(
-            filter=f'display_name="{index_name}"'
-        )[0]
-        
-        # Query the index
-        response = index_endpoint.find_neighbors(
-            deployed_index_id=index_name,
-            queries=[query_embedding],
-            num_neighbors=top_k
-        )
+        # Get the shared index endpoint
+        index_endpoint = await model_registry.get_index_endpoint_async()
         
-        # Process the results
-        results = []
-        for neighbor in response[0]:
-            # Parse metadata
-            metadata = neighbor.metadata
-            
-            # Skip if not from the current session
-            if metadata.get("session_id") != session_id:
-                continue
+        async def find_neighbors(num_neighbors: int, restricts: Optional[List[Namespace]] = None) -> List[Dict[str, Any]]:
+            response = await outbound_governor.call("vector_search", lambda: run_io(
+                index_endpoint.find_neighbors,
+                deployed_index_id=index_name,
+                queries=[query_embedding],
+                num_neighbors=num_neighbors,
+                filter=restricts,
+                return_full_datapoint=include_vectors
+            ))
             
-            # Add to results
-            results.append({
-                "text": metadata.get("text", ""),
-                "metadata": metadata,
-                "score": neighbor.distance
-            })
+            # Process the results
+            results = []
+            for neighbor in response[0]:
+                metadata = dict(getattr(neighbor, "metadata", None) or {})
+                result = {
+                    "id": neighbor.id,
+                    "text": metadata.get("text", ""),
+                    "metadata": metadata,
+                    "score": neighbor.distance
+                }
+                if include_vectors and getattr(neighbor, "feature_vector", None):
+                    result["embedding"] = list(neighbor.feature_vector)
+                results.append(result)
+            return results
         
-        return results
+        if VERTEX_SESSION_RESTRICTS:
+            # The index only returns datapoints tagged with this session
+            return await find_neighbors(top_k, [Namespace(SESSION_NAMESPACE, [session_id], [])])
+        
+        # Datapoints written without restricts can only be filtered after the search
+        return await adaptive_overfetch(find_neighbors, session_id, top_k)
     except Exception as e:
         logger.error(f"Error querying Vertex AI: {str(e)}")
+        if is_stale_handle(e):
+            model_registry.invalidate(INDEX_ENDPOINT_KEY)
         raise
 
-async def query_pinecone(query_embedding: List[float], session_id: str, top_k: int) -> List[Dict[str, Any]]:
+async def query_local(
+    query_embedding: List[float],
+    session_id: str,
+    top_k: int,
+    include_vectors: bool = False
+) -> List[Dict[str, Any]]:
+    """Query the in-process vector store"""
+    try:
+        return await run_io(local_vector_store.query, session_id, query_embedding, top_k, include_vectors)
+    except Exception as e:
+        logger.error(f"Error querying local vector store: {str(e)}")
+        raise
+
+async def query_pinecone(
+    query_embedding: List[float],
+    session_id: str,
+    top_k: int,
+    include_vectors: bool = False
+) -> List[Dict[str, Any]]:
     """Query Pinecone"""
     try:
         # Get the index name from environment variables
@@ -265,10 +998,12 @@ async def query_pinecone(query_embedding: List[float], session_id: str, top_k: i
         index = pinecone.Index(index_name)
         
         # Query the index
-        response = index.query(
+        response = await run_io(
+            index.query,
             vector=query_embedding,
             top_k=top_k,
             include_metadata=True,
+            include_values=include_vectors,
             filter={"session_id": {"$eq": session_id}}
         )
         
@@ -278,47 +1013,63 @@ async def query_pinecone(query_embedding: List[float], session_id: str, top_k: i
             metadata = match["metadata"]
             text = metadata.pop("text", "")
             
-            results.append({
+            result = {
+                "id": match["id"],
                 "text": text,
                 "metadata": metadata,
                 "score": match["score"]
-            })
+            }
+            if include_vectors and match.get("values"):
+                result["embedding"] = match["values"]
+            results.append(result)
         
         return results
     except Exception as e:
         logger.error(f"Error querying Pinecone: {str(e)}")
         raise
 
-async def query_weaviate(query_embedding: List[float], session_id: str, top_k: int) -> List[Dict[str, Any]]:
+async def query_weaviate(
+    query_embedding: List[float],
+    session_id: str,
+    top_k: int,
+    include_vectors: bool = False
+) -> List[Dict[str, Any]]:
     """Query Weaviate"""
     try:
         # Define the class name
         class_name = "Document"
+        additional = "_additional {certainty id vector}" if include_vectors else "_additional {certainty id}"
         
         # Query the index
-        response = weaviate_client.query.get(
-            class_name=class_name,
-            properties=["text", "source", "session_id", "_additional {certainty}"]
-        ).with_near_vector({
-            "vector": query_embedding
-        }).with_where({
-            "path": ["session_id"],
-            "operator": "Equal",
-            "valueString": session_id
-        }).with_limit(top_k).do()
+        response = await run_io(
+            weaviate_client.query.get(
+                class_name=class_name,
+                properties=["text", "source", "session_id", additional]
+            ).with_near_vector({
+                "vector": query_embedding
+            }).with_where({
+                "path": ["session_id"],
+                "operator": "Equal",
+                "valueString": session_id
+            }).with_limit(top_k).do
+        )
         
         # Process the results
         results = []
         for obj in response["data"]["Get"][class_name]:
             text = obj.pop("text", "")
             certainty = obj["_additional"]["certainty"]
-            obj.pop("_additional")
+            additional = obj.pop("_additional")
             
-            results.append({
+            result = {
+                "id": additional.get("id"),
                 "text": text,
                 "metadata": obj,
                 "score": certainty
-            })
+            }
+            if include_vectors and additional.get("vector"):
+                result["embedding"] = additional["vector"]
+            results.append(result)
         
         return results
     except Exception as e:
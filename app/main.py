@@ -1,9 +1,11 @@
 from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException, BackgroundTasks
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator, Awaitable, TypeVar
+from contextlib import asynccontextmanager
 import os
+import asyncio
 import uvicorn
 from dotenv import load_dotenv
 import logging
@@ -11,8 +13,29 @@ import logging
 # Import custom modules
 from app.api.document_processor import process_document
 from app.api.url_crawler import crawl_url
-from app.api.vector_store import add_to_vector_store, query_vector_store
-from app.api.llm_service import generate_answer
+from app.api.vector_store import (
+    add_to_vector_store,
+    query_vector_store,
+    delete_vectors_for_session,
+    generate_embeddings,
+    query_embedding_batcher,
+    export_session,
+    import_session,
+    VECTOR_DB_TYPE
+)
+from app.api.session_snapshot import write_snapshot, read_snapshot, SESSION_SNAPSHOT_PATH
+from app.api.session_manifest import session_manifest, SESSION_TTL_SECONDS
+from app.api.llm_service import generate_answer, build_messages, stream_routed, summarize_conversation, model_router
+from app.api.conversation_memory import ConversationMemory
+from app.api.context_packer import prompt_usage
+from app.api.model_registry import model_registry
+from app.api.embedding_cache import embedding_cache
+from app.api.answer_cache import semantic_answer_cache, exact_answer_cache
+from app.api.outbound_governor import outbound_governor, OutboundUnavailable
+from app.utils.executors import run_io, shutdown_executors
+from app.utils.single_flight import SingleFlight, single_flight_stats
+from app.utils.priority import priority, BULK
+from app.utils.helpers import save_file, file_fingerprint, generate_unique_id, sse_event
 
 # Load environment variables
 load_dotenv()
@@ -24,11 +47,205 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# How often to look for expired sessions
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", 300))
+
+# How often in-flight /ask and /webhook work checks that the client is still connected
+DISCONNECT_POLL_INTERVAL_SECONDS = float(os.getenv("DISCONNECT_POLL_INTERVAL_SECONDS", 0.5))
+# Status for requests abandoned by the client (nginx's "client closed request")
+CLIENT_CLOSED_REQUEST = 499
+
+# Store conversation history in memory (in production, use a database);
+# older turns are compacted into a running summary
+conversation_store = ConversationMemory(summarize_conversation)
+
+# Identical generations (same exact answer cache key) already in flight are shared
+generation_flight = SingleFlight("generation")
+
+T = TypeVar("T")
+
+class ClientDisconnected(Exception):
+    """The client went away before its request was answered"""
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    """Await work on behalf of a request, cancelling it if the client disconnects
+    
+    Raises:
+        ClientDisconnected: If the client disconnected first (the work is cancelled)
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def clear_session_data(session_id: str) -> int:
+    """Drop a session's conversation history and vectors, returning the number of vectors removed"""
+    conversation_store.drop(session_id)
+    return await delete_vectors_for_session(session_id)
+
+async def generate_and_cache(
+    question: str,
+    context_chunks: List[Dict[str, Any]],
+    history: List[Dict[str, str]],
+    tier: str
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """Generate an answer and store it in the exact answer cache under the model that answered"""
+    answer, sources, model_name = await generate_answer(question, context_chunks, history, tier)
+    await run_io(
+        exact_answer_cache.put, exact_answer_cache.key(question, context_chunks, model_name, history), answer, sources
+    )
+    return answer, sources
+
+async def answer_question(question: str, session_id: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Answer a question for a session and record the exchange in its history
+    
+    Near-duplicates of questions already answered against the session's current
+    documents are served from the semantic answer cache without calling the LLM;
+    follow-up questions depend on the conversation, so they bypass it. Exact
+    repeats (same question, retrieved chunks, model and history) are served
+    from the exact answer cache, or share the generation if it is still in
+    flight.
+    """
+    session_manifest.touch(session_id)
+    
+    # Get conversation history
+    history = conversation_store.history(session_id)
+    
+    # Check for a previous answer to an equivalent question asked without history
+    documents_version = semantic_answer_cache.version(session_id)
+    cached = None
+    if not history:
+        question_embedding = await generate_embeddings(question)
+        cached = semantic_answer_cache.lookup(session_id, question_embedding)
+    
+    if cached:
+        logger.info(f"Semantic cache hit for session {session_id} (similarity {cached['similarity']:.3f})")
+        answer, sources = cached["answer"], cached["sources"]
+    else:
+        # Query the vector store for relevant context
+        context_chunks = await query_vector_store(question, session_id)
+        
+        # Pick the model tier up front; answers are cached per model
+        tier = model_router.route(question, context_chunks)
+        exact_key = exact_answer_cache.key(question, context_chunks, model_router.models[tier], history)
+        exact = await run_io(exact_answer_cache.get, exact_key)
+        if exact:
+            logger.info(f"Exact answer cache hit for session {session_id}")
+            answer, sources = exact["answer"], exact["sources"]
+        else:
+            # Generate an answer using the LLM
+            answer, sources = await generation_flight.do(
+                exact_key,
+                lambda: generate_and_cache(question, context_chunks, history, tier)
+            )
+        
+        # Answers without any context aren't worth reusing
+        if context_chunks and not history:
+            semantic_answer_cache.store(
+                session_id, question, question_embedding, answer, sources, version=documents_version
+            )
+    
+    # Update conversation history
+    conversation_store.append(session_id, question, answer)
+    return answer, sources
+
+async def stream_question(question: str, session_id: str) -> AsyncIterator[str]:
+    """Answer a question like answer_question, as Server-Sent Events
+    
+    A "sources" event is sent as soon as retrieval finishes, then one "token"
+    event per piece of generated text and a final "done" event with the full
+    answer. The history and answer cache are only updated once the answer is
+    complete, so an abandoned stream leaves no partial answer behind.
+    """
+    try:
+        session_manifest.touch(session_id)
+        history = conversation_store.history(session_id)
+        
+        documents_version = semantic_answer_cache.version(session_id)
+        cached = None
+        if not history:
+            question_embedding = await generate_embeddings(question)
+            cached = semantic_answer_cache.lookup(session_id, question_embedding)
+        
+        if cached:
+            logger.info(f"Semantic cache hit for session {session_id} (similarity {cached['similarity']:.3f})")
+            answer = cached["answer"]
+            yield sse_event("sources", cached["sources"])
+            yield sse_event("token", {"text": answer})
+        else:
+            context_chunks = await query_vector_store(question, session_id)
+            tier = model_router.route(question, context_chunks)
+            exact_key = exact_answer_cache.key(question, context_chunks, model_router.models[tier], history)
+            exact = await run_io(exact_answer_cache.get, exact_key)
+            
+            if exact:
+                logger.info(f"Exact answer cache hit for session {session_id}")
+                answer, sources = exact["answer"], exact["sources"]
+                yield sse_event("sources", sources)
+                yield sse_event("token", {"text": answer})
+            else:
+                messages, sources = build_messages(question, context_chunks, history)
+                yield sse_event("sources", sources)
+                
+                parts = []
+                model_name = model_router.models[tier]
+                async for model_name, text in stream_routed(messages, tier):
+                    parts.append(text)
+                    yield sse_event("token", {"text": text})
+                answer = "".join(parts)
+                await run_io(
+                    exact_answer_cache.put,
+                    exact_answer_cache.key(question, context_chunks, model_name, history),
+                    answer,
+                    sources
+                )
+            
+            if context_chunks and not history:
+                semantic_answer_cache.store(
+                    session_id, question, question_embedding, answer, sources, version=documents_version
+                )
+        
+        conversation_store.append(session_id, question, answer)
+        yield sse_event("done", {"answer": answer})
+    except Exception as e:
+        logger.error(f"Error streaming answer: {str(e)}")
+        yield sse_event("error", {"detail": str(e)})
+
+async def expire_sessions() -> None:
+    """Periodically clear sessions that have been idle for longer than SESSION_TTL_SECONDS"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        for session_id in session_manifest.expired_sessions():
+            try:
+                removed = await clear_session_data(session_id)
+                logger.info(f"Expired session {session_id} ({removed} vectors removed)")
+            except Exception as e:
+                logger.error(f"Error expiring session {session_id}: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up shared model handles on startup and release them and the executors on shutdown"""
+    await model_registry.warmup(include_index_endpoint=VECTOR_DB_TYPE == "vertex_ai")
+    expiry_task = asyncio.create_task(expire_sessions()) if SESSION_TTL_SECONDS > 0 else None
+    yield
+    if expiry_task:
+        expiry_task.cancel()
+    model_registry.invalidate()
+    shutdown_executors()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="AI Document QA Chatbot",
     description="An AI-powered chatbot for document and web content Q&A",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Mount static files
@@ -37,9 +254,6 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 # Setup Jinja2 templates
 templates = Jinja2Templates(directory="app/templates")
 
-# Store conversation history in memory (in production, use a database)
-conversation_store = {}
-
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """Render the main page"""
@@ -53,11 +267,12 @@ async def upload_document(
 ):
     """Upload and process a document"""
     try:
+        session_manifest.touch(session_id)
+        
         # Save the file temporarily
         file_location = f"temp_{file.filename}"
-        with open(file_location, "wb") as f:
-            contents = await file.read()
-            f.write(contents)
+        contents = await file.read()
+        await run_io(save_file, file_location, contents)
         
         # Process the document in the background
         background_tasks.add_task(
@@ -86,6 +301,8 @@ async def process_url(
 ):
     """Crawl a URL and process its content"""
     try:
+        session_manifest.touch(session_id)
+        
         # Crawl the URL in the background
         background_tasks.add_task(
             crawl_and_store_url,
@@ -106,24 +323,13 @@ async def process_url(
 
 @app.post("/ask")
 async def ask_question(
+    request: Request,
     question: str = Form(...),
     session_id: str = Form(...)
 ):
     """Answer a question based on the processed documents"""
     try:
-        # Get conversation history
-        history = conversation_store.get(session_id, [])
-        
-        # Query the vector store for relevant context
-        context_chunks = await query_vector_store(question, session_id)
-        
-        # Generate an answer using the LLM
-        answer, sources = await generate_answer(question, context_chunks, history)
-        
-        # Update conversation history
-        history.append({"role": "user", "content": question})
-        history.append({"role": "assistant", "content": answer})
-        conversation_store[session_id] = history
+        answer, sources = await run_until_disconnected(request, answer_question(question, session_id))
         
         return JSONResponse(
             content={
@@ -131,10 +337,34 @@ async def ask_question(
                 "sources": sources
             }
         )
+    except ClientDisconnected:
+        logger.info(f"Client disconnected, cancelled question for session {session_id}")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out generating an answer")
+    except OutboundUnavailable as e:
+        logger.warning(f"Could not answer question: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
     except Exception as e:
         logger.error(f"Error answering question: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/ask/stream")
+async def ask_question_stream(
+    question: str = Form(...),
+    session_id: str = Form(...)
+):
+    """Answer a question, streaming the answer as Server-Sent Events"""
+    return StreamingResponse(
+        stream_question(question, session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/status/{session_id}")
 async def get_processing_status(session_id: str):
     """Get the status of document/URL processing"""
@@ -151,17 +381,65 @@ async def get_processing_status(session_id: str):
 @app.delete("/clear/{session_id}")
 async def clear_session(session_id: str):
     """Clear the conversation history and documents for a session"""
-    if session_id in conversation_store:
-        del conversation_store[session_id]
-    
-    # In a real implementation, you would also delete the vectors from the vector store
-    # await delete_vectors_for_session(session_id)
-    
-    return JSONResponse(
-        content={
-            "message": f"Session {session_id} cleared"
-        }
-    )
+    try:
+        removed = await clear_session_data(session_id)
+        
+        return JSONResponse(
+            content={
+                "message": f"Session {session_id} cleared",
+                "vectors_deleted": removed
+            }
+        )
+    except Exception as e:
+        logger.error(f"Error clearing session {session_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/snapshot/{session_id}")
+async def download_session_snapshot(session_id: str, background_tasks: BackgroundTasks):
+    """Export a session's chunks, metadata and embeddings as a snapshot file"""
+    try:
+        snapshot = await export_session(session_id)
+        if not snapshot.count:
+            raise HTTPException(status_code=404, detail=f"Session {session_id} has no documents")
+        
+        os.makedirs(SESSION_SNAPSHOT_PATH, exist_ok=True)
+        path = os.path.join(SESSION_SNAPSHOT_PATH, f"{generate_unique_id()}.npz")
+        await run_io(write_snapshot, snapshot, path)
+        
+        # Remove the file once it has been sent
+        background_tasks.add_task(os.remove, path)
+        return FileResponse(path, media_type="application/octet-stream", filename="session-snapshot.npz")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error exporting session {session_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/snapshot/{session_id}")
+async def upload_session_snapshot(session_id: str, file: UploadFile = File(...)):
+    """Replace a session's documents with the contents of a snapshot file"""
+    os.makedirs(SESSION_SNAPSHOT_PATH, exist_ok=True)
+    path = os.path.join(SESSION_SNAPSHOT_PATH, f"{generate_unique_id()}.npz")
+    try:
+        session_manifest.touch(session_id)
+        await run_io(save_file, path, await file.read())
+        snapshot = await run_io(read_snapshot, path)
+        imported = await import_session(snapshot, session_id)
+        
+        return JSONResponse(
+            content={
+                "message": f"Snapshot imported into session {session_id}",
+                "chunks_imported": imported
+            }
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error importing snapshot into session {session_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
 
 @app.post("/webhook")
 async def agent_builder_webhook(request: Request):
@@ -189,19 +467,7 @@ async def agent_builder_webhook(request: Request):
                 }
             )
         
-        # Query the vector store for relevant context
-        context_chunks = await query_vector_store(query_text, session_id)
-        
-        # Get conversation history
-        history = conversation_store.get(session_id, [])
-        
-        # Generate an answer using the LLM
-        answer, sources = await generate_answer(query_text, context_chunks, history)
-        
-        # Update conversation history
-        history.append({"role": "user", "content": query_text})
-        history.append({"role": "assistant", "content": answer})
-        conversation_store[session_id] = history
+        answer, sources = await run_until_disconnected(request, answer_question(query_text, session_id))
         
         # Format response for Agent Builder
         response_text = answer
@@ -224,6 +490,9 @@ async def agent_builder_webhook(request: Request):
                 }
             }
         )
+    except ClientDisconnected:
+        logger.info("Agent Builder disconnected, cancelled webhook request")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         logger.error(f"Error in webhook: {str(e)}")
         return JSONResponse(
@@ -252,36 +521,87 @@ async def health_check():
         }
     )
 
+@app.get("/metrics")
+async def get_metrics():
+    """Cache and batching counters for monitoring"""
+    return JSONResponse(
+        content={
+            "embedding_cache": embedding_cache.stats(),
+            "semantic_answer_cache": semantic_answer_cache.stats(),
+            "exact_answer_cache": exact_answer_cache.stats(),
+            "query_embedding_batcher": query_embedding_batcher.stats(),
+            "single_flight": single_flight_stats(),
+            "outbound": outbound_governor.stats(),
+            "model_routing": model_router.stats(),
+            "prompt_tokens": prompt_usage.stats(),
+            "conversation_history": conversation_store.stats()
+        }
+    )
+
 # Background processing functions
 async def process_and_store_document(file_path: str, filename: str, session_id: str):
-    """Process a document and store its content in the vector database"""
-    try:
-        # Process the document to extract text
-        chunks = await process_document(file_path, filename)
-        
-        # Add chunks to vector store
-        await add_to_vector_store(chunks, session_id, source=filename)
-        
-        # Clean up temporary file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    """Process a document and store its content in the vector database
+    
+    Runs at bulk priority, so questions are served ahead of its embedding calls.
+    """
+    with priority(BULK):
+        try:
+            # Skip parsing and embedding entirely when the same file was already ingested
+            fingerprint = await run_io(file_fingerprint, file_path)
+            if fingerprint == session_manifest.source_fingerprint(session_id, filename):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                logger.info(f"Document {filename} is unchanged since it was last ingested, skipping")
+                return
             
-        logger.info(f"Document {filename} processed and stored successfully")
-    except Exception as e:
-        logger.error(f"Error processing document {filename}: {str(e)}")
+            # Process the document to extract text
+            chunks = await process_document(file_path, filename)
+            
+            # Add chunks to vector store, re-embedding only new or changed chunks
+            await add_to_vector_store(chunks, session_id, source=filename, fingerprint=fingerprint)
+            
+            # Clean up temporary file
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                
+            logger.info(f"Document {filename} processed and stored successfully")
+        except Exception as e:
+            logger.error(f"Error processing document {filename}: {str(e)}")
 
 async def crawl_and_store_url(url: str, max_depth: int, session_id: str):
-    """Crawl a URL and store its content in the vector database"""
-    try:
-        # Crawl the URL to extract text
-        chunks = await crawl_url(url, max_depth)
-        
-        # Add chunks to vector store
-        await add_to_vector_store(chunks, session_id, source=url)
-        
-        logger.info(f"URL {url} crawled and stored successfully")
-    except Exception as e:
-        logger.error(f"Error crawling URL {url}: {str(e)}")
+    """Crawl a URL and store its content in the vector database
+    
+    Runs at bulk priority, so questions are served ahead of its fetches and embedding calls.
+    Each page is ingested as its own source, so a re-crawl only parses and embeds
+    pages whose content changed and removes pages the crawl no longer reaches.
+    """
+    with priority(BULK):
+        try:
+            # Crawl the URL, skipping the text of pages unchanged since they were last ingested
+            previous = await run_io(session_manifest.crawl_pages, session_id, url)
+            pages = await crawl_url(url, max_depth, previous)
+            
+            # Add the chunks of new or changed pages to vector store
+            for page in pages:
+                if page["chunks"] is None:
+                    continue
+                try:
+                    await add_to_vector_store(
+                        page["chunks"], session_id, source=page["url"], fingerprint=page["fingerprint"], crawl=url
+                    )
+                except Exception as e:
+                    logger.error(f"Error storing page {page['url']}: {str(e)}")
+            
+            # Remove pages that are no longer linked from the crawl
+            crawled = {page["url"] for page in pages}
+            for page_url in previous:
+                if page_url not in crawled:
+                    await add_to_vector_store([], session_id, source=page_url)
+                    await run_io(session_manifest.drop_source, session_id, page_url)
+            
+            logger.info(f"URL {url} crawled and stored successfully")
+        except Exception as e:
+            logger.error(f"Error crawling URL {url}: {str(e)}")
 
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
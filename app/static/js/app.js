@@ -115,7 +115,6 @@ function initEventListeners() {
     }
     
     // Improve mobile keyboard handling
-    const questionInput = document.getElementById('questionInput');
     if (questionInput && 'ontouchstart' in window) {
         questionInput.addEventListener('focus', function() {
             // Scroll to input on mobile when focused
@@ -0,0 +1,83 @@
+import os
+import asyncio
+import logging
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict
+from dotenv import load_dotenv
+from app.utils.priority import current_priority, BULK
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Get configuration from environment variables
+# Threads for blocking SDK, HTTP, SQLite and local-index calls
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", 16))
+# Separate threads for blocking calls made by bulk work, so ingestion can't occupy the I/O pool
+BULK_IO_EXECUTOR_WORKERS = int(os.getenv("BULK_IO_EXECUTOR_WORKERS", 4))
+# Workers for CPU-heavy document and HTML parsing
+PARSE_EXECUTOR_WORKERS = int(os.getenv("PARSE_EXECUTOR_WORKERS", 2))
+# "process" keeps parsing off the GIL entirely; "thread" avoids worker start-up cost
+PARSE_EXECUTOR_KIND = os.getenv("PARSE_EXECUTOR_KIND", "process").lower()
+
+_executors: Dict[str, Executor] = {}
+_lock = threading.Lock()
+
+def _create_executor(name: str) -> Executor:
+    if name == "io":
+        return ThreadPoolExecutor(max_workers=IO_EXECUTOR_WORKERS, thread_name_prefix="io")
+    if name == "bulk_io":
+        return ThreadPoolExecutor(max_workers=BULK_IO_EXECUTOR_WORKERS, thread_name_prefix="bulk-io")
+    if PARSE_EXECUTOR_KIND == "process":
+        # spawn, not fork: forked children would inherit gRPC channels and locks
+        return ProcessPoolExecutor(max_workers=PARSE_EXECUTOR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return ThreadPoolExecutor(max_workers=PARSE_EXECUTOR_WORKERS, thread_name_prefix="parse")
+
+def get_executor(name: str) -> Executor:
+    """Get one of the shared executors ("io", "bulk_io" or "parse"), creating it on first use"""
+    with _lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = _create_executor(name)
+            _executors[name] = executor
+            logger.info(f"Started {name} executor")
+        return executor
+
+async def run_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking I/O call (SDK, HTTP, disk) on the bounded I/O thread pool
+
+    Calls made at bulk priority run on the smaller bulk I/O pool instead.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_executor("bulk_io" if current_priority() == BULK else "io")
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+async def run_parse(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run CPU-heavy parsing on the bounded parse pool
+
+    With the process pool, func must be a module-level function and its
+    arguments and result must be picklable.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_executor("parse")
+    try:
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    except BrokenProcessPool:
+        # A crashed worker (e.g. a parser segfault) breaks the whole pool; replace it for later calls
+        with _lock:
+            if _executors.get("parse") is executor:
+                del _executors["parse"]
+        raise
+
+def shutdown_executors(wait: bool = True) -> None:
+    """Shut down the shared executors (they are recreated if used again)"""
+    with _lock:
+        executors = list(_executors.items())
+        _executors.clear()
+    for name, executor in executors:
+        executor.shutdown(wait=wait)
+        logger.info(f"Stopped {name} executor")
@@ -1,6 +1,7 @@
 import os
 import logging
 import uuid
+import hashlib
 from typing import Dict, Any, List, Optional
 import json
 from datetime import datetime
@@ -40,6 +41,32 @@ def truncate_text(text: str, max_length: int = 100) -> str:
         return text
     return text[:max_length] + "..."
 
+# Rough average for English text with Gemini and text-embedding tokenizers
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of model tokens in a text (about 4 characters per token)"""
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+def save_file(path: str, contents: bytes) -> None:
+    """Write bytes to a file (blocking; call through run_io from async code)"""
+    with open(path, "wb") as f:
+        f.write(contents)
+
+def file_fingerprint(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's bytes, read in blocks (blocking; call through run_io from async code)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def sse_event(event: str, data: Any) -> str:
+    """Format a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 def format_sources_for_display(sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Format source metadata for display in the UI"""
     formatted_sources = []
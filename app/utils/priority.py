@@ -0,0 +1,26 @@
+import contextvars
+from contextlib import contextmanager
+from typing import Iterator
+
+# Work done for a waiting user, and background work such as ingestion
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+# Tasks started from a coroutine inherit its priority
+_priority = contextvars.ContextVar("priority", default=INTERACTIVE)
+
+def current_priority() -> str:
+    """Priority class of the work running in the current context"""
+    return _priority.get()
+
+@contextmanager
+def priority(level: str) -> Iterator[None]:
+    """Run the enclosed work (and tasks it starts) at the given priority class"""
+    if level not in PRIORITIES:
+        raise ValueError(f"Unknown priority {level}")
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
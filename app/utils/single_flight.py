@@ -0,0 +1,74 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Shares one in-flight call between concurrent callers with the same key
+
+    The first caller for a key starts the call; callers arriving while it runs
+    wait for the same result (or exception). A caller that is cancelled only
+    stops waiting; the call itself is cancelled once every caller has gone.
+    Results are shared, so callers must not mutate them.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.executions = 0
+        self.abandoned = 0
+        flights[name] = self
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return fn()'s result, sharing the call with concurrent callers for key"""
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+            self.executions += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Nobody else is waiting for the result
+                flight.task.cancel()
+                self.abandoned += 1
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark a failure as retrieved when every caller was cancelled before it arrived
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return coalescing counters"""
+        coalesced = self.calls - self.executions
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": coalesced,
+            "coalescing_ratio": round(coalesced / self.calls, 3) if self.calls else 0.0,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._flights)
+        }
+
+# Every SingleFlight by name, for /metrics
+flights: Dict[str, SingleFlight] = {}
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    """Coalescing counters of every SingleFlight"""
+    return {name: flight.stats() for name, flight in flights.items()}
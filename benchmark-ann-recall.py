@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Recall-vs-latency report for local vector search with the IVF index against exact search
+
+Both are timed through SessionIndex.search, the path LocalVectorStore.query uses.
+"""
+
+import sys
+import time
+import argparse
+import numpy as np
+
+from app.api.ann_index import IVFIndex
+from app.api.local_vector_store import SessionIndex
+from benchmark_corpus import make_corpus, make_queries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=200000)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    print(f"📊 {args.count} vectors x {args.dimensions} dims, {args.queries} queries, top_k={args.top_k}")
+    vectors = make_corpus(args.count, args.dimensions, clusters=max(1, args.count // 500))
+    queries = make_queries(vectors, args.queries)
+    session = SessionIndex("benchmark")
+    session.add([str(i) for i in range(args.count)], vectors, [""] * args.count, [{}] * args.count)
+
+    def search_all():
+        """Time every query through the session's search, returning the found rows and ms/query"""
+        started = time.perf_counter()
+        found = [{row for row, _ in session.search(query, args.top_k)} for query in queries]
+        return found, (time.perf_counter() - started) * 1000 / args.queries
+
+    exact, exact_ms = search_all()
+
+    started = time.perf_counter()
+    session.ann = IVFIndex.build(session.vectors)
+    print(f"⏳ Built IVF index with {session.ann.nlist} lists in {time.perf_counter() - started:.1f}s")
+
+    print(f"{'search':>10} {'recall@k':>10} {'ms/query':>10} {'speedup':>10}")
+    print(f"{'exact':>10} {1.0:>10.3f} {exact_ms:>10.2f} {1.0:>10.1f}")
+    for nprobe in args.nprobe:
+        session.ann.nprobe = nprobe
+        found, ann_ms = search_all()
+        recall = np.mean([len(truth & rows) / args.top_k for truth, rows in zip(exact, found)])
+        print(f"{'nprobe=' + str(nprobe):>10} {recall:>10.3f} {ann_ms:>10.2f} {exact_ms / ann_ms:>10.1f}")
+
+if __name__ == "__main__":
+    sys.exit(main())
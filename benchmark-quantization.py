@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Memory-vs-recall report for quantized local vector storage
+"""
+
+import sys
+import time
+import argparse
+import numpy as np
+
+from app.api.quantization import ScalarQuantizer, ProductQuantizer
+from app.api.local_vector_store import top_k_indices
+from benchmark_corpus import make_corpus, make_queries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--pq-subvectors", type=int, nargs="+", default=[96, 192])
+    parser.add_argument("--rerank", type=int, default=8, help="Shortlist multiplier for exact re-ranking")
+    args = parser.parse_args()
+
+    print(f"📊 {args.count} vectors x {args.dimensions} dims, {args.queries} queries, top_k={args.top_k}")
+    vectors = make_corpus(args.count, args.dimensions, clusters=max(1, args.count // 500))
+    queries = make_queries(vectors, args.queries)
+    started = time.perf_counter()
+    exact = [set(top_k_indices(vectors @ query, args.top_k).tolist()) for query in queries]
+    exact_ms = (time.perf_counter() - started) * 1000 / args.queries
+
+    quantizers = [("int8", ScalarQuantizer.train(vectors))]
+    for subvectors in args.pq_subvectors:
+        started = time.perf_counter()
+        quantizers.append((f"pq{subvectors}", ProductQuantizer.train(vectors, subvectors)))
+        print(f"⏳ Trained pq{subvectors} in {time.perf_counter() - started:.1f}s")
+
+    print(f"{'storage':>10} {'bytes/vec':>10} {'saving':>8} {'recall@k':>10} {'+rerank':>10} {'ms/query':>10}")
+    float_bytes = args.dimensions * 4
+    print(f"{'float32':>10} {float_bytes:>10} {1.0:>7.0f}x {1.0:>10.3f} {'-':>10} {exact_ms:>10.2f}")
+    for name, quantizer in quantizers:
+        codes = quantizer.encode(vectors)
+        found, reranked = [], []
+        started = time.perf_counter()
+        for query in queries:
+            scores = quantizer.score(codes, query)
+            found.append(top_k_indices(scores, args.top_k))
+            shortlist = top_k_indices(scores, args.top_k * args.rerank)
+            exact_scores = vectors[shortlist] @ query
+            reranked.append(shortlist[top_k_indices(exact_scores, args.top_k)])
+        query_ms = (time.perf_counter() - started) * 1000 / args.queries
+
+        recall = np.mean([len(truth & set(rows.tolist())) / args.top_k for truth, rows in zip(exact, found)])
+        rerank_recall = np.mean([len(truth & set(rows.tolist())) / args.top_k for truth, rows in zip(exact, reranked)])
+        size = quantizer.bytes_per_vector()
+        print(f"{name:>10} {size:>10} {float_bytes / size:>7.0f}x {recall:>10.3f} {rerank_recall:>10.3f} {query_ms:>10.2f}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+"""
+Synthetic corpora shared by the benchmark scripts
+"""
+
+import numpy as np
+
+from app.api.local_vector_store import normalize_rows
+
+def make_corpus(count: int, dimensions: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Generate clustered unit vectors that resemble topic-grouped chunk embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(count, dimensions)).astype(np.float32)
+    return normalize_rows(vectors.astype(np.float32))
+
+def make_queries(vectors: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Generate unit queries near randomly chosen corpus vectors"""
+    rng = np.random.default_rng(seed)
+    noise = 0.3 * rng.normal(size=(count, vectors.shape[1])).astype(np.float32)
+    return normalize_rows(vectors[rng.choice(len(vectors), count)] + noise)
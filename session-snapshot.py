@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Export a session to a snapshot file, or rehydrate a session from one without re-embedding
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.api.vector_store import export_session, import_session, VECTOR_DB_TYPE
+from app.api.session_snapshot import write_snapshot, read_snapshot
+
+async def export_command(args) -> None:
+    started = time.perf_counter()
+    snapshot = await export_session(args.session_id)
+    if not snapshot.count:
+        print(f"❌ Session {args.session_id} has no documents")
+        sys.exit(1)
+    write_snapshot(snapshot, args.path)
+    print(f"✅ Exported {snapshot.count} chunks ({snapshot.dimensions} dims) to {args.path} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+async def import_command(args) -> None:
+    started = time.perf_counter()
+    snapshot = read_snapshot(args.path)
+    imported = await import_session(snapshot, args.session_id)
+    print(f"✅ Imported {imported} chunks into session {args.session_id or snapshot.session_id} "
+          f"({VECTOR_DB_TYPE}) in {time.perf_counter() - started:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Write a session's chunks and embeddings to a file")
+    export_parser.add_argument("session_id")
+    export_parser.add_argument("path", help="Snapshot file to write (.npz)")
+    export_parser.set_defaults(handler=export_command)
+
+    import_parser = commands.add_parser("import", help="Load a snapshot file into a session")
+    import_parser.add_argument("path", help="Snapshot file to read (.npz)")
+    import_parser.add_argument("--session-id", help="Target session (defaults to the exported session)")
+    import_parser.set_defaults(handler=import_command)
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(args.handler(args))
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+import numpy as np
+from app.api.ann_index import IVFIndex
+from app.api.local_vector_store import ANN_FILE, LocalVectorStore, SessionIndex, normalize_rows, top_k_indices
+
+def make_vectors(count, dimensions=32, clusters=20, seed=0):
+    """Create clustered unit vectors"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    vectors = centers[rng.integers(0, clusters, size=count)] + 0.5 * rng.normal(size=(count, dimensions))
+    return normalize_rows(vectors.astype(np.float32))
+
+def make_session(vectors):
+    """Create a session index holding vectors"""
+    session = SessionIndex("session")
+    session.add([str(i) for i in range(len(vectors))], vectors, [""] * len(vectors), [{}] * len(vectors))
+    return session
+
+def recall(session, queries, top_k):
+    """Average overlap between the session's search and exact top-k"""
+    hits = 0
+    for query in queries:
+        exact = set(top_k_indices(session.vectors @ query, top_k).tolist())
+        approximate = {row for row, _ in session.search(query, top_k)}
+        hits += len(exact & approximate)
+    return hits / (len(queries) * top_k)
+
+class TestIVFIndex(unittest.TestCase):
+    """Test cases for the IVF approximate nearest-neighbour index"""
+    
+    def setUp(self):
+        self.vectors = make_vectors(4000)
+        self.queries = self.vectors[:50]
+    
+    def test_recall_improves_with_nprobe(self):
+        """Test that scanning more clusters gives better recall"""
+        session = make_session(self.vectors)
+        session.ann = IVFIndex.build(self.vectors, nlist=40)
+        session.ann.nprobe = 1
+        low = recall(session, self.queries, 10)
+        session.ann.nprobe = 40
+        high = recall(session, self.queries, 10)
+        
+        self.assertGreaterEqual(high, low)
+        self.assertEqual(high, 1.0)
+    
+    def test_incremental_insert(self):
+        """Test that rows added after training are searchable"""
+        session = make_session(self.vectors[:3000])
+        session.ann = IVFIndex.build(self.vectors[:3000], nlist=30)
+        session.ann.nprobe = 30
+        session.add([str(i) for i in range(3000, 4000)], self.vectors[3000:], [""] * 1000, [{}] * 1000)
+        
+        self.assertEqual(session.ann.count, 4000)
+        [(row, score)] = session.search(self.vectors[3500], 1)
+        self.assertEqual(row, 3500)
+        self.assertAlmostEqual(score, 1.0, places=5)
+    
+    def test_save_and_load(self):
+        """Test that a loaded index returns the same results"""
+        original = make_session(self.vectors)
+        original.ann = IVFIndex.build(self.vectors, nlist=40)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "ivf.npz")
+            original.ann.save(path)
+            loaded = make_session(self.vectors)
+            loaded.ann = IVFIndex.load(path)
+        original.ann.nprobe = loaded.ann.nprobe = 4
+        
+        for query in self.queries[:10]:
+            self.assertEqual(loaded.search(query, 5), original.search(query, 5))
+    
+    def test_local_store_switches_to_ann(self):
+        """Test that large sessions are served by the ANN index"""
+        store = LocalVectorStore(path=None)
+        ids = [str(i) for i in range(len(self.vectors))]
+        
+        with patch("app.api.local_vector_store.LOCAL_ANN_MIN_VECTORS", 1000):
+            store.add("session", ids, self.vectors, [""] * len(ids), [{}] * len(ids))
+        
+        session = store._sessions["session"]
+        self.assertIsNotNone(session.ann)
+        results = store.query("session", self.vectors[42].tolist(), 3)
+        self.assertEqual(results[0]["id"], "42")
+        self.assertEqual(len(results), 3)
+    
+    def test_index_is_built_outside_the_store_lock(self):
+        """Test that queries and appends proceed while the ANN index is built, and late rows are indexed"""
+        store = LocalVectorStore(path=None)
+        ids = [str(i) for i in range(len(self.vectors))]
+        build = IVFIndex.build
+        during_build = []
+        
+        def slow_build(vectors):
+            def other_work():
+                during_build.append(store.query("session", self.vectors[7].tolist(), 1)[0]["id"])
+                store.add("session", ["late"], self.vectors[:1], ["late"], [{}])
+            
+            worker = threading.Thread(target=other_work)
+            worker.start()
+            worker.join(timeout=5)
+            during_build.append(worker.is_alive())
+            return build(vectors)
+        
+        with patch("app.api.local_vector_store.LOCAL_ANN_MIN_VECTORS", 1000), \
+                patch.object(IVFIndex, "build", side_effect=slow_build):
+            store.add("session", ids, self.vectors, [""] * len(ids), [{}] * len(ids))
+        
+        self.assertEqual(during_build, ["7", False])
+        session = store._sessions["session"]
+        self.assertEqual(session.ann.count, len(ids) + 1)
+        self.assertFalse(session.rebuilding)
+    
+    def test_loaded_session_is_indexed_in_the_background(self):
+        """Test that a session loaded without an ANN index is searched exactly until one is built off the lock"""
+        ids = [str(i) for i in range(len(self.vectors))]
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch("app.api.local_vector_store.LOCAL_ANN_MIN_VECTORS", 1000):
+            LocalVectorStore(path=temp_dir).add("session", ids, self.vectors, [""] * len(ids), [{}] * len(ids))
+            reopened = LocalVectorStore(path=temp_dir)
+            os.remove(os.path.join(reopened._session_dir("session"), ANN_FILE))
+            
+            release = threading.Event()
+            built = threading.Event()
+            build = IVFIndex.build
+            
+            def slow_build(vectors):
+                release.wait(timeout=5)
+                try:
+                    return build(vectors)
+                finally:
+                    built.set()
+            
+            with patch.object(IVFIndex, "build", side_effect=slow_build):
+                results = reopened.query("session", self.vectors[42].tolist(), 1)
+                session = reopened._sessions["session"]
+                self.assertEqual(results[0]["id"], "42")
+                self.assertIsNone(session.ann)
+                self.assertTrue(session.rebuilding)
+                release.set()
+                self.assertTrue(built.wait(timeout=5))
+            
+            for _ in range(100):
+                if not session.rebuilding:
+                    break
+                time.sleep(0.05)
+            self.assertFalse(session.rebuilding)
+            self.assertEqual(session.ann.count, len(ids))
+            self.assertTrue(os.path.exists(os.path.join(reopened._session_dir("session"), ANN_FILE)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+from app import main
+from app.api.answer_cache import SemanticAnswerCache, ExactAnswerCache
+from app.api.conversation_memory import ConversationMemory
+
+class TestSemanticAnswerCache(unittest.TestCase):
+    """Test cases for the semantic answer cache"""
+    
+    def test_similar_question_hits(self):
+        """Test that a near-identical question reuses the stored answer"""
+        cache = SemanticAnswerCache(threshold=0.95, enabled=True)
+        cache.store("session", "What is the refund policy?", [1.0, 0.0, 0.0], "30 days", [{"source": "faq.pdf"}])
+        
+        hit = cache.lookup("session", [0.99, 0.05, 0.0])
+        self.assertEqual(hit["answer"], "30 days")
+        self.assertEqual(hit["sources"], [{"source": "faq.pdf"}])
+        
+        self.assertIsNone(cache.lookup("session", [0.0, 1.0, 0.0]))
+        self.assertIsNone(cache.lookup("other-session", [1.0, 0.0, 0.0]))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 2)
+    
+    def test_invalidate_on_document_change(self):
+        """Test that changing a scope's documents drops its answers"""
+        cache = SemanticAnswerCache(enabled=True)
+        version = cache.version("session")
+        cache.store("session", "q", [1.0, 0.0], "old answer", [], version=version)
+        
+        cache.invalidate("session")
+        self.assertIsNone(cache.lookup("session", [1.0, 0.0]))
+        
+        # Answers computed before the change are not stored afterwards
+        cache.store("session", "q", [1.0, 0.0], "stale answer", [], version=version)
+        self.assertIsNone(cache.lookup("session", [1.0, 0.0]))
+    
+    def test_bounded_entries_and_scopes(self):
+        """Test that entries per scope and number of scopes are bounded"""
+        cache = SemanticAnswerCache(max_entries_per_scope=2, max_scopes=2, enabled=True)
+        cache.store("a", "q1", [1.0, 0.0, 0.0], "1", [])
+        cache.store("a", "q2", [0.0, 1.0, 0.0], "2", [])
+        cache.lookup("a", [1.0, 0.0, 0.0])
+        cache.store("a", "q3", [0.0, 0.0, 1.0], "3", [])
+        
+        self.assertEqual(cache.lookup("a", [1.0, 0.0, 0.0])["answer"], "1")
+        self.assertIsNone(cache.lookup("a", [0.0, 1.0, 0.0]))
+        
+        cache.store("b", "q", [1.0, 0.0, 0.0], "b", [])
+        cache.store("c", "q", [1.0, 0.0, 0.0], "c", [])
+        self.assertIsNone(cache.lookup("a", [1.0, 0.0, 0.0]))
+        self.assertEqual(cache.stats()["scopes"], 2)
+
+class TestExactAnswerCache(unittest.TestCase):
+    """Test cases for the exact answer cache"""
+    
+    def setUp(self):
+        self.chunks = [{"id": "a", "text": "one"}, {"id": "b", "text": "two"}]
+        self.history = [{"role": "user", "content": "hi"}]
+    
+    def test_key_covers_every_input(self):
+        """Test that only whitespace and case changes map to the same key"""
+        key = ExactAnswerCache.key("What is X?", self.chunks, "gemini", self.history)
+        
+        self.assertEqual(ExactAnswerCache.key("  what is   x? ", self.chunks, "gemini", self.history), key)
+        self.assertNotEqual(ExactAnswerCache.key("What is Y?", self.chunks, "gemini", self.history), key)
+        self.assertNotEqual(ExactAnswerCache.key("What is X?", self.chunks[::-1], "gemini", self.history), key)
+        self.assertNotEqual(ExactAnswerCache.key("What is X?", self.chunks, "other-model", self.history), key)
+        self.assertNotEqual(ExactAnswerCache.key("What is X?", self.chunks, "gemini", []), key)
+    
+    def test_entries_expire_and_are_evicted(self):
+        """Test the TTL and the LRU bound of the memory tier"""
+        cache = ExactAnswerCache(max_entries=2, ttl_seconds=0.05, path=None, enabled=True)
+        cache.put("k1", "answer", [])
+        self.assertEqual(cache.get("k1"), {"answer": "answer", "sources": []})
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("k1"))
+        
+        cache.ttl_seconds = 60
+        for key in ("k1", "k2", "k3"):
+            cache.put(key, key, [])
+        self.assertIsNone(cache.get("k1"))
+        self.assertEqual(cache.get("k3")["answer"], "k3")
+        self.assertEqual(cache.stats()["evictions"], 1)
+    
+    def test_disk_tier_is_shared(self):
+        """Test that another cache instance on the same file sees stored answers"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "answers.sqlite3")
+            ExactAnswerCache(path=path, enabled=True).put("key", "42", [{"source": "faq.pdf"}])
+            
+            other = ExactAnswerCache(path=path, enabled=True)
+            self.assertEqual(other.get("key"), {"answer": "42", "sources": [{"source": "faq.pdf"}]})
+            self.assertEqual(other.stats()["disk_hits"], 1)
+    
+    def test_expired_rows_are_pruned_periodically(self):
+        """Test that expired rows are deleted at most once per prune interval"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ExactAnswerCache(ttl_seconds=-1, path=os.path.join(temp_dir, "a.sqlite3"), enabled=True)
+            count = lambda: cache._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            cache.put("k1", "answer", [])
+            self.assertEqual(count(), 0)
+            # Within the interval expired rows are left for the next prune
+            cache.put("k2", "answer", [])
+            self.assertEqual(count(), 1)
+            
+            cache._last_prune -= cache.prune_interval
+            cache.put("k3", "answer", [])
+            self.assertEqual(count(), 0)
+
+class TestAnswerQuestionCaching(unittest.TestCase):
+    """Test cases for how answer_question uses the answer caches"""
+    
+    def test_follow_up_questions_bypass_semantic_cache(self):
+        """Test that a question asked with history is neither served from nor stored in the semantic cache"""
+        semantic_cache = SemanticAnswerCache(enabled=True)
+        generate = AsyncMock(return_value=("30 days", [], "model"))
+        chunks = [{"id": "c1", "text": "Refunds within 30 days", "metadata": {"source": "faq.pdf"}}]
+        
+        with patch.object(main, "generate_embeddings", AsyncMock(return_value=[1.0, 0.0])), \
+                patch.object(main, "query_vector_store", AsyncMock(return_value=chunks)), \
+                patch.object(main, "generate_answer", generate), \
+                patch.object(main, "semantic_answer_cache", semantic_cache), \
+                patch.object(main, "exact_answer_cache", ExactAnswerCache(path=None)), \
+                patch.object(main, "conversation_store", ConversationMemory(AsyncMock())):
+            asyncio.run(main.answer_question("What about that?", "s"))
+            asyncio.run(main.answer_question("What about that?", "s"))
+        
+        self.assertEqual(generate.await_count, 2)
+        self.assertEqual(semantic_cache.stats()["entries"], 1)
+        self.assertEqual(semantic_cache.stats()["hits"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
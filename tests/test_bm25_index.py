@@ -0,0 +1,77 @@
+import unittest
+import tempfile
+from app.api.bm25_index import BM25Index, tokenize, reciprocal_rank_fusion
+
+class TestBM25Index(unittest.TestCase):
+    """Test cases for the lexical index and rank fusion"""
+    
+    def test_tokenize_keeps_identifiers(self):
+        """Test that compound identifiers are indexed whole, in parts and joined"""
+        terms = tokenize("The error ERR-404 in v2.3")
+        self.assertIn("err-404", terms)
+        self.assertIn("err", terms)
+        self.assertIn("404", terms)
+        self.assertIn("err404", terms)
+        self.assertIn("v2.3", terms)
+        self.assertNotIn("the", terms)
+    
+    def test_exact_identifier_ranks_first(self):
+        """Test that a chunk containing an exact part number is the top match"""
+        index = BM25Index(path=None)
+        index.add(
+            "session",
+            ["1", "2", "3"],
+            [
+                "Replacement filters are listed in the maintenance guide.",
+                "Part number XJ-9921 is the high-capacity filter cartridge.",
+                "Filters should be replaced every six months."
+            ],
+            [{}, {}, {}]
+        )
+        
+        results = index.search("session", "which filter is XJ-9921", 2)
+        self.assertEqual(results[0]["id"], "2")
+        self.assertEqual(index.search("missing", "filter", 2), [])
+    
+    def test_persistence(self):
+        """Test that the index is rebuilt from its chunk log"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            BM25Index(path=temp_dir).add("session", ["1"], ["error code E1234"], [{"source": "log.txt"}])
+            
+            results = BM25Index(path=temp_dir).search("session", "E1234", 5)
+            self.assertEqual(results[0]["id"], "1")
+            self.assertEqual(results[0]["metadata"], {"source": "log.txt"})
+    
+    def test_remove(self):
+        """Test that removed chunks are no longer matched, also after a rebuild"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index = BM25Index(path=temp_dir)
+            index.add("session", ["1", "2"], ["error code E1234", "error code E5678"], [{}, {}])
+            index.remove("session", ["1"])
+            
+            for reopened in (index, BM25Index(path=temp_dir)):
+                self.assertEqual(reopened.search("session", "E1234", 5), [])
+                self.assertEqual(reopened.search("session", "E5678", 5)[0]["id"], "2")
+    
+    def test_reciprocal_rank_fusion(self):
+        """Test that results found by both retrievers are ranked first"""
+        vector = [{"id": "a", "text": "a"}, {"id": "b", "text": "b"}]
+        lexical = [{"id": "b", "text": "b"}, {"id": "c", "text": "c"}]
+        
+        fused = reciprocal_rank_fusion([vector, lexical])
+        self.assertEqual([result["id"] for result in fused], ["b", "a", "c"])
+        self.assertAlmostEqual(fused[0]["score"], 1 / 62 + 1 / 61)
+    
+    def test_fusion_fills_empty_fields(self):
+        """Test that a vector hit without text takes the lexical hit's text and scores are not mixed"""
+        vector = [{"id": "a", "text": "", "metadata": {}, "score": 0.83, "vector_score": 0.83}]
+        lexical = [{"id": "a", "text": "chunk a", "metadata": {"source": "a.txt"}, "score": 12.5}]
+        
+        [fused] = reciprocal_rank_fusion([vector, lexical])
+        self.assertEqual(fused["text"], "chunk a")
+        self.assertEqual(fused["metadata"], {"source": "a.txt"})
+        self.assertEqual(fused["vector_score"], 0.83)
+        self.assertAlmostEqual(fused["score"], 2 / 61)
+
+if __name__ == "__main__":
+    unittest.main()
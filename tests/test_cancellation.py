@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app import main
+from app.api import llm_service
+
+async def slow(seconds, cancelled=None):
+    try:
+        await asyncio.sleep(seconds)
+        return "finished"
+    except asyncio.CancelledError:
+        if cancelled is not None:
+            cancelled.append(True)
+        raise
+
+async def stalled_stream():
+    yield MagicMock(text="first")
+    await asyncio.sleep(10)
+    yield MagicMock(text="never")
+
+class TestCancellation(unittest.TestCase):
+    """Test cases for LLM timeouts and cancelling work for disconnected clients"""
+    
+    def setUp(self):
+        patcher = patch.object(main, "DISCONNECT_POLL_INTERVAL_SECONDS", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_work_is_cancelled_when_client_disconnects(self):
+        """Test that in-flight work is cancelled once the client has gone"""
+        request = MagicMock(is_disconnected=AsyncMock(side_effect=[False, False, True]))
+        cancelled = []
+        
+        with self.assertRaises(main.ClientDisconnected):
+            asyncio.run(main.run_until_disconnected(request, slow(10, cancelled)))
+        self.assertEqual(cancelled, [True])
+    
+    def test_result_is_returned_while_connected(self):
+        """Test that work finishing first returns its result"""
+        request = MagicMock(is_disconnected=AsyncMock(return_value=False))
+        self.assertEqual(asyncio.run(main.run_until_disconnected(request, slow(0.03))), "finished")
+    
+    def test_generation_times_out(self):
+        """Test that a slow Gemini call raises TimeoutError"""
+        model = MagicMock()
+        model.generate_content_async = lambda *args, **kwargs: slow(10)
+        
+        with patch.object(llm_service.model_registry, "get_generative_model", return_value=model), \
+                patch.object(llm_service, "LLM_TIMEOUT_SECONDS", 0.05):
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(llm_service.generate_with_gemini([{"role": "user", "content": "hi"}], []))
+    
+    def test_stalled_stream_times_out(self):
+        """Test that a stream that stops producing chunks raises TimeoutError"""
+        model = MagicMock()
+        model.generate_content_async = AsyncMock(return_value=stalled_stream())
+        received = []
+        
+        async def collect():
+            async for text in llm_service.stream_with_gemini([{"role": "user", "content": "hi"}]):
+                received.append(text)
+        
+        with patch.object(llm_service.model_registry, "get_generative_model", return_value=model), \
+                patch.object(llm_service, "LLM_TIMEOUT_SECONDS", 0.05):
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(collect())
+        self.assertEqual(received, ["first"])
+
+if __name__ == "__main__":
+    unittest.main()
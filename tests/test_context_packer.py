@@ -0,0 +1,59 @@
+import unittest
+from app.api.context_packer import truncate_to_tokens, pack_history, pack_context, pack_prompt
+from app.utils.helpers import estimate_tokens
+
+def sentences(count, start=0):
+    return " ".join(f"Sentence number {i} has a few words." for i in range(start, start + count))
+
+class TestContextPacker(unittest.TestCase):
+    """Test cases for token-budgeted prompt packing"""
+    
+    def test_truncate_to_tokens_cuts_at_sentence_end(self):
+        """Test that truncation keeps whole sentences within the budget"""
+        text = sentences(20)
+        truncated = truncate_to_tokens(text, 30)
+        
+        self.assertLessEqual(estimate_tokens(truncated), 30)
+        self.assertTrue(truncated.endswith("words."))
+        self.assertTrue(text.startswith(truncated))
+        self.assertEqual(truncate_to_tokens("short text.", 30), "short text.")
+        self.assertEqual(truncate_to_tokens("no sentence end in this text at all", 5), "no sentence end in")
+    
+    def test_pack_context_fills_best_first_and_truncates_last(self):
+        """Test that whole chunks are kept in order and the first overflowing one is cut"""
+        chunks = [{"id": str(i), "text": sentences(20, i * 20), "metadata": {}} for i in range(4)]
+        size = estimate_tokens(chunks[0]["text"]) + 2
+        
+        packed = pack_context(chunks, size * 2 + 100)
+        
+        self.assertEqual([chunk["id"] for chunk in packed], ["0", "1", "2"])
+        self.assertEqual(packed[1]["text"], chunks[1]["text"])
+        self.assertLess(len(packed[2]["text"]), len(chunks[2]["text"]))
+        self.assertTrue(packed[2]["text"].endswith("words."))
+        self.assertEqual(pack_context(chunks, size * 2 + 10), chunks[:2])
+    
+    def test_pack_history_keeps_recent_messages(self):
+        """Test that the newest messages that fit are kept in their original order"""
+        history = [{"role": "user" if i % 2 == 0 else "assistant", "content": sentences(5, i * 5)} for i in range(6)]
+        size = estimate_tokens(history[0]["content"]) + 2
+        
+        self.assertEqual(pack_history(history, size * 2 + 5), history[-2:])
+        self.assertEqual(pack_history(history, 0), [])
+    
+    def test_pack_prompt_stays_within_budget(self):
+        """Test that prompts stay under budget and unused history budget goes to context"""
+        chunks = [{"text": sentences(50, i * 50), "metadata": {}} for i in range(10)]
+        history = [{"role": "user", "content": sentences(30)}] * 20
+        
+        packed = pack_prompt("Answer from the context.", "What is sentence 7?", chunks, history, budget=2000)
+        usage = packed["usage"]
+        self.assertLessEqual(usage["total"], 2000)
+        self.assertLessEqual(usage["history"], 0.25 * 2000)
+        self.assertGreater(usage["context"], 1000)
+        
+        without_history = pack_prompt("Answer from the context.", "What is sentence 7?", chunks, [], budget=2000)
+        self.assertGreater(without_history["usage"]["context"], usage["context"])
+        self.assertLessEqual(without_history["usage"]["total"], 2000)
+
+if __name__ == "__main__":
+    unittest.main()
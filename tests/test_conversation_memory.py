@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+from app.api.conversation_memory import ConversationMemory, SUMMARY_ROLE
+from app.utils.helpers import estimate_tokens
+
+def long_answer(i):
+    return f"Answer {i}: " + "details " * 100
+
+async def settle(memory):
+    """Wait for background compactions to finish"""
+    while memory._tasks:
+        await asyncio.gather(*memory._tasks)
+
+class TestConversationMemory(unittest.TestCase):
+    """Test cases for rolling conversation-history compaction"""
+    
+    def test_older_turns_are_summarized(self):
+        """Test that passing the threshold folds all but the recent turns into the summary"""
+        summarize = AsyncMock(return_value=" the user asked about plans ")
+        memory = ConversationMemory(summarize, threshold_tokens=500, keep_recent=2)
+        
+        async def scenario():
+            for i in range(3):
+                memory.append("s", f"Question {i}?", long_answer(i))
+            await settle(memory)
+        
+        asyncio.run(scenario())
+        
+        history = memory.history("s")
+        self.assertEqual(history[0], {"role": SUMMARY_ROLE, "content": "the user asked about plans"})
+        self.assertEqual([message["content"] for message in history[1:]], ["Question 2?", long_answer(2)])
+        previous_summary, older = summarize.call_args.args
+        self.assertEqual((previous_summary, len(older)), ("", 4))
+        self.assertEqual(memory.stats()["messages_compacted"], 4)
+    
+    def test_turns_recorded_during_compaction_stay_verbatim(self):
+        """Test that compaction runs in the background and keeps turns added meanwhile"""
+        release = None
+        
+        async def summarize(previous_summary, messages):
+            await release.wait()
+            return "summary"
+        
+        memory = ConversationMemory(summarize, threshold_tokens=200, keep_recent=0)
+        
+        async def scenario():
+            nonlocal release
+            release = asyncio.Event()
+            memory.append("s", "First?", long_answer(1))
+            await asyncio.sleep(0)
+            memory.append("s", "Second?", "Short.")
+            release.set()
+            await settle(memory)
+        
+        asyncio.run(scenario())
+        self.assertEqual([message["content"] for message in memory.history("s")], ["summary", "Second?", "Short."])
+    
+    def test_failed_summary_keeps_history(self):
+        """Test that a failed summarization leaves the history untouched"""
+        memory = ConversationMemory(AsyncMock(side_effect=RuntimeError("quota")), threshold_tokens=100, keep_recent=0)
+        
+        async def scenario():
+            memory.append("s", "Question?", long_answer(0))
+            await settle(memory)
+        
+        asyncio.run(scenario())
+        self.assertEqual(len(memory.history("s")), 2)
+        self.assertEqual(memory.stats()["failed_compactions"], 1)
+    
+    def test_history_size_plateaus(self):
+        """Test that history stays bounded however long the conversation gets"""
+        memory = ConversationMemory(AsyncMock(return_value="summary " * 50), threshold_tokens=600, keep_recent=2)
+        sizes = []
+        
+        async def scenario():
+            for i in range(40):
+                memory.append("s", f"Question {i}?", long_answer(i))
+                await settle(memory)
+                sizes.append(sum(estimate_tokens(message["content"]) for message in memory.history("s")))
+        
+        asyncio.run(scenario())
+        self.assertLess(max(sizes[10:]), 700)
+
+if __name__ == "__main__":
+    unittest.main()
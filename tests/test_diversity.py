@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+from app.api.diversity import word_shingles, overlap_ratio, maximal_marginal_relevance, diversify
+
+def make_words(start, count):
+    return " ".join(f"w{i}" for i in range(start, start + count))
+
+class TestDiversity(unittest.TestCase):
+    """Test cases for MMR diversification and near-duplicate suppression"""
+
+    def test_overlap_ratio(self):
+        """Test that chunk-window overlap is partial and re-ingested text is near-total"""
+        chunk = word_shingles(make_words(0, 1000))
+        next_chunk = word_shingles(make_words(800, 1000))
+        self.assertAlmostEqual(overlap_ratio(chunk, next_chunk), 193 / 993, places=3)
+        self.assertEqual(overlap_ratio(chunk, word_shingles(make_words(0, 1000).upper())), 1.0)
+        self.assertEqual(overlap_ratio(chunk, set()), 0.0)
+
+    def test_mmr_prefers_diverse_candidates(self):
+        """Test that a near-duplicate of the top candidate loses to a different one"""
+        vectors = np.array([[1.0, 0.0], [0.9, 0.436], [0.0, 1.0]], dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        relevance = np.array([1.0, 0.9, 0.8])
+
+        self.assertEqual(maximal_marginal_relevance(relevance, vectors, 2, lambda_mult=0.7), [0, 2])
+        self.assertEqual(maximal_marginal_relevance(relevance, vectors, 2, lambda_mult=1.0), [0, 1])
+
+    def test_mmr_stops_on_redundant_candidates(self):
+        """Test that candidates above the similarity cap are never selected"""
+        vectors = np.ones((4, 2), dtype=np.float32) / np.sqrt(2)
+        self.assertEqual(maximal_marginal_relevance(np.array([1.0, 0.9, 0.8, 0.7]), vectors, 3), [0])
+
+    def test_diversify_drops_duplicate_text_and_keeps_unembedded(self):
+        """Test that duplicate texts are removed and candidates without embeddings survive"""
+        candidates = [
+            {"id": "a", "text": make_words(0, 100)},
+            {"id": "a-copy", "text": make_words(0, 100)},
+            {"id": "b", "text": make_words(500, 100)},
+            {"id": "c", "text": make_words(900, 100)},
+        ]
+        embeddings = [[1.0, 0.0], [1.0, 0.0], [0.0, 1.0], None]
+
+        results = diversify(candidates, embeddings, top_k=3)
+        self.assertEqual([result["id"] for result in results], ["a", "b", "c"])
+
+if __name__ == "__main__":
+    unittest.main()
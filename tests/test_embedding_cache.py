@@ -0,0 +1,57 @@
+import unittest
+import os
+import tempfile
+from app.api.embedding_cache import EmbeddingCache
+
+class TestEmbeddingCache(unittest.TestCase):
+    """Test cases for the embedding cache"""
+    
+    def test_memory_hits_and_misses(self):
+        """Test that stored embeddings are returned and misses are counted"""
+        cache = EmbeddingCache(path=None)
+        cache.put("hello", [0.5, 0.25])
+        
+        self.assertEqual(cache.get("hello"), [0.5, 0.25])
+        self.assertIsNone(cache.get("world"))
+        self.assertEqual(cache.stats()["memory_hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+    
+    def test_key_includes_model_and_dimensionality(self):
+        """Test that different models never share entries"""
+        first = EmbeddingCache(model="model-a", dimensionality=768, path=None)
+        second = EmbeddingCache(model="model-b", dimensionality=768, path=None)
+        third = EmbeddingCache(model="model-a", dimensionality=256, path=None)
+        
+        self.assertNotEqual(first.key("text"), second.key("text"))
+        self.assertNotEqual(first.key("text"), third.key("text"))
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        cache = EmbeddingCache(max_entries=2, path=None)
+        cache.put("a", [1.0])
+        cache.put("b", [2.0])
+        cache.get("a")
+        cache.put("c", [3.0])
+        
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), [1.0])
+        self.assertEqual(cache.stats()["evictions"], 1)
+    
+    def test_disk_tier_survives_restart(self):
+        """Test that embeddings persist across cache instances"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "cache.sqlite3")
+            cache = EmbeddingCache(path=path)
+            cache.put_many(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+            
+            reopened = EmbeddingCache(path=path)
+            self.assertEqual(reopened.get_many(["b", "a", "c"]), [[3.0, 4.0], [1.0, 2.0], None])
+            self.assertEqual(reopened.stats()["disk_hits"], 2)
+            self.assertEqual(reopened.stats()["misses"], 1)
+            
+            # Disk hits are promoted into the memory tier
+            reopened.get("a")
+            self.assertEqual(reopened.stats()["memory_hits"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+from app.utils import executors
+from app.utils.executors import run_io, get_executor, shutdown_executors
+from app.utils.priority import priority, BULK
+from app.api.document_processor import process_document
+from app.api.url_crawler import parse_page
+
+def blocking_sleep(seconds):
+    time.sleep(seconds)
+    return threading.current_thread().name
+
+class TestExecutors(unittest.TestCase):
+    """Test cases for the shared I/O and parse executors"""
+
+    def tearDown(self):
+        shutdown_executors()
+
+    def test_blocking_io_does_not_stall_the_event_loop(self):
+        """Test that the loop keeps serving other tasks while a blocking call runs"""
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            task = asyncio.create_task(ticker())
+            thread_name = await run_io(blocking_sleep, 0.3)
+            task.cancel()
+            return thread_name, ticks
+
+        thread_name, ticks = asyncio.run(scenario())
+        self.assertTrue(thread_name.startswith("io"))
+        self.assertGreater(ticks, 10)
+
+    def test_bulk_work_uses_its_own_pool(self):
+        """Test that blocking calls made at bulk priority run on the bulk I/O threads"""
+        async def scenario():
+            with priority(BULK):
+                return await run_io(blocking_sleep, 0)
+
+        self.assertTrue(asyncio.run(scenario()).startswith("bulk-io"))
+
+    def test_shutdown_recreates_executors(self):
+        """Test that executors are recreated after shutdown"""
+        first = get_executor("io")
+        shutdown_executors()
+        self.assertIsNot(get_executor("io"), first)
+
+    def test_documents_are_parsed_in_worker_processes(self):
+        """Test that document parsing round-trips through the process pool"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "notes.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("word " * 1500)
+
+            chunks = asyncio.run(process_document(path, "notes.txt"))
+
+        self.assertEqual(executors.PARSE_EXECUTOR_KIND, "process")
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[0]["metadata"], {"source": "notes.txt", "chunk_index": 0})
+
+    def test_parse_page_extracts_chunks_and_same_domain_links(self):
+        """Test that crawled pages yield text chunks and only same-domain links"""
+        html = (
+            "<html><head><title>Docs</title></head><body><p>" + "hello " * 50 + "</p>"
+            "<a href='/next'>next</a><a href='https://other.com/x'>x</a><a href='#top'>top</a></body></html>"
+        )
+        chunks, links = parse_page(html, "https://example.com/start", "example.com", True)
+
+        self.assertEqual(links, ["https://example.com/next"])
+        self.assertEqual(chunks[0]["metadata"]["title"], "Docs")
+        self.assertIn("hello", chunks[0]["text"])
+        self.assertEqual(parse_page(html, "https://example.com/start", "example.com", False)[1], [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,6 +9,7 @@ from app.utils.helpers import (
     is_valid_file_type,
     is_valid_url,
     truncate_text,
+    estimate_tokens,
     format_sources_for_display,
     save_upload_metadata,
     load_upload_metadata
@@ -67,6 +68,12 @@ class TestHelpers(unittest.TestCase):
         # Test with text longer than max length
         self.assertEqual(truncate_text("Hello World", 5), "Hello...")
     
+    def test_estimate_tokens(self):
+        """Test token estimation"""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("Hi"), 1)
+        self.assertEqual(estimate_tokens("x" * 400), 100)
+    
     def test_format_sources_for_display(self):
         """Test formatting sources for display"""
         sources = [
@@ -0,0 +1,115 @@
+import os
+import unittest
+import tempfile
+import numpy as np
+from app.api.local_vector_store import LocalVectorStore, top_k_indices
+
+def make_chunks(count, dimensions=8, seed=0):
+    """Create random chunks for a session"""
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(count, dimensions)).astype(np.float32)
+    ids = [f"chunk-{i}" for i in range(count)]
+    texts = [f"text {i}" for i in range(count)]
+    metadatas = [{"source": "test.pdf", "chunk_index": i} for i in range(count)]
+    return ids, embeddings, texts, metadatas
+
+class TestLocalVectorStore(unittest.TestCase):
+    """Test cases for the in-process vector store"""
+    
+    def test_top_k_indices(self):
+        """Test that top-k indexes come back best first"""
+        scores = np.array([0.1, 0.9, 0.5, 0.7])
+        self.assertEqual(top_k_indices(scores, 2).tolist(), [1, 3])
+        self.assertEqual(top_k_indices(scores, 10).tolist(), [1, 3, 2, 0])
+    
+    def test_query_matches_exact_cosine(self):
+        """Test that query results match brute-force cosine similarity"""
+        store = LocalVectorStore(path=None)
+        ids, embeddings, texts, metadatas = make_chunks(200)
+        store.add("session", ids[:120], embeddings[:120], texts[:120], metadatas[:120])
+        store.add("session", ids[120:], embeddings[120:], texts[120:], metadatas[120:])
+        
+        query = embeddings[17] + 0.01
+        results = store.query("session", query.tolist(), 5)
+        
+        normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+        self.assertEqual([result["id"] for result in results], [ids[i] for i in expected])
+        self.assertEqual(results[0]["text"], "text 17")
+        self.assertEqual(results[0]["metadata"]["chunk_index"], 17)
+    
+    def test_sessions_are_isolated(self):
+        """Test that a session only sees its own chunks"""
+        store = LocalVectorStore(path=None)
+        ids, embeddings, texts, metadatas = make_chunks(4)
+        store.add("a", ids[:2], embeddings[:2], texts[:2], metadatas[:2])
+        store.add("b", ids[2:], embeddings[2:], texts[2:], metadatas[2:])
+        
+        results = store.query("a", embeddings[3].tolist(), 10)
+        self.assertEqual(sorted(result["id"] for result in results), ["chunk-0", "chunk-1"])
+        self.assertEqual(store.query("missing", embeddings[0].tolist(), 5), [])
+    
+    def test_query_can_return_stored_vectors(self):
+        """Test that include_vectors attaches each result's unit vector"""
+        store = LocalVectorStore(path=None)
+        ids, embeddings, texts, metadatas = make_chunks(10)
+        store.add("session", ids, embeddings, texts, metadatas)
+        
+        results = store.query("session", embeddings[2].tolist(), 3, include_vectors=True)
+        expected = embeddings[2] / np.linalg.norm(embeddings[2])
+        np.testing.assert_allclose(results[0]["embedding"], expected, rtol=1e-5)
+        self.assertNotIn("embedding", store.query("session", embeddings[2].tolist(), 3)[0])
+    
+    def test_persistence(self):
+        """Test that appended chunks are reloaded by a new store"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = LocalVectorStore(path=temp_dir)
+            ids, embeddings, texts, metadatas = make_chunks(10)
+            store.add("projects/p/sessions/1", ids[:6], embeddings[:6], texts[:6], metadatas[:6])
+            store.add("projects/p/sessions/1", ids[6:], embeddings[6:], texts[6:], metadatas[6:])
+            
+            reopened = LocalVectorStore(path=temp_dir)
+            self.assertEqual(reopened.count("projects/p/sessions/1"), 10)
+            results = reopened.query("projects/p/sessions/1", embeddings[8].tolist(), 1)
+            self.assertEqual(results[0]["id"], "chunk-8")
+
+    def test_delete_chunks(self):
+        """Test that deleted chunks stop matching, also after a restart"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = LocalVectorStore(path=temp_dir)
+            ids, embeddings, texts, metadatas = make_chunks(10)
+            store.add("session", ids, embeddings, texts, metadatas)
+            
+            self.assertEqual(store.delete("session", ["chunk-3", "chunk-7", "missing"]), 2)
+            
+            for reopened in (store, LocalVectorStore(path=temp_dir)):
+                self.assertEqual(reopened.count("session"), 8)
+                results = reopened.query("session", embeddings[3].tolist(), 10)
+                self.assertNotIn("chunk-3", [result["id"] for result in results])
+                self.assertEqual(reopened.query("session", embeddings[4].tolist(), 1)[0]["text"], "text 4")
+    
+    def test_torn_write_is_repaired_before_appending(self):
+        """Test that files left out of step by a crash are cut back, so later appends line up"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = LocalVectorStore(path=temp_dir)
+            ids, embeddings, texts, metadatas = make_chunks(10)
+            store.add("session", ids[:5], embeddings[:5], texts[:5], metadatas[:5])
+            
+            # Crash after writing the sixth vector and half of its chunk line
+            directory = store._session_dir("session")
+            with open(os.path.join(directory, "vectors.f32"), "ab") as f:
+                f.write(embeddings[5].tobytes())
+            with open(os.path.join(directory, "chunks.jsonl"), "a", encoding="utf-8") as f:
+                f.write('{"id": "chunk-5", "te')
+            
+            reopened = LocalVectorStore(path=temp_dir)
+            self.assertEqual(reopened.count("session"), 5)
+            reopened.add("session", ids[5:], embeddings[5:], texts[5:], metadatas[5:])
+            
+            restarted = LocalVectorStore(path=temp_dir)
+            self.assertEqual(restarted.count("session"), 10)
+            for i in (2, 5, 9):
+                self.assertEqual(restarted.query("session", embeddings[i].tolist(), 1)[0]["id"], ids[i])
+    
+if __name__ == "__main__":
+    unittest.main()
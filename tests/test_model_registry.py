@@ -0,0 +1,98 @@
+import unittest
+import asyncio
+import threading
+from unittest.mock import MagicMock, patch
+from app.api.model_registry import ModelRegistry
+
+class TestModelRegistry(unittest.TestCase):
+    """Test cases for the shared model registry"""
+    
+    def test_handles_are_resolved_once(self):
+        """Test that a handle is reused until it expires"""
+        registry = ModelRegistry(ttl_seconds=60)
+        factory = MagicMock(side_effect=lambda: object())
+        
+        first = registry._get("handle", factory)
+        second = registry._get("handle", factory)
+        
+        self.assertIs(first, second)
+        self.assertEqual(factory.call_count, 1)
+    
+    def test_expired_handles_are_refreshed(self):
+        """Test that a handle older than the TTL is resolved again"""
+        registry = ModelRegistry(ttl_seconds=0)
+        factory = MagicMock(side_effect=lambda: object())
+        
+        first = registry._get("handle", factory)
+        second = registry._get("handle", factory)
+        
+        self.assertIsNot(first, second)
+        self.assertEqual(factory.call_count, 2)
+    
+    def test_invalidate(self):
+        """Test that invalidated handles are resolved again"""
+        registry = ModelRegistry(ttl_seconds=60)
+        factory = MagicMock(side_effect=lambda: object())
+        
+        first = registry._get("handle", factory)
+        registry.invalidate("handle")
+        second = registry._get("handle", factory)
+        
+        self.assertIsNot(first, second)
+    
+    def test_resolution_does_not_hold_the_lock(self):
+        """Test that a slow resolution doesn't block reads or resolution of other handles"""
+        registry = ModelRegistry(ttl_seconds=60)
+        registry._get("cached", lambda: "cached handle")
+        started, release = threading.Event(), threading.Event()
+        
+        def slow_factory():
+            started.set()
+            release.wait(5)
+            return "slow handle"
+        
+        worker = threading.Thread(target=registry._get, args=("slow", slow_factory))
+        worker.start()
+        started.wait(5)
+        try:
+            self.assertEqual(registry._get("cached", MagicMock()), "cached handle")
+            self.assertEqual(registry._get("other", lambda: "other handle"), "other handle")
+        finally:
+            release.set()
+            worker.join(5)
+        self.assertEqual(registry._get("slow", MagicMock()), "slow handle")
+    
+    def test_async_accessors_resolve_off_the_event_loop(self):
+        """Test that concurrent coroutines share one resolution, run in a worker thread"""
+        registry = ModelRegistry(ttl_seconds=60)
+        threads = []
+        
+        def from_pretrained(name):
+            threads.append(threading.current_thread())
+            return object()
+        
+        async def run():
+            return await asyncio.gather(*(registry.get_embedding_model_async() for _ in range(5)))
+        
+        with patch("app.api.model_registry.TextEmbeddingModel.from_pretrained", side_effect=from_pretrained):
+            handles = asyncio.run(run())
+            again = asyncio.run(registry.get_embedding_model_async())
+        
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+        self.assertTrue(all(handle is handles[0] for handle in handles + [again]))
+    
+    def test_warmup_tolerates_failures(self):
+        """Test that warmup logs failures instead of raising"""
+        registry = ModelRegistry(ttl_seconds=60)
+        
+        with patch("app.api.model_registry.TextEmbeddingModel.from_pretrained", side_effect=RuntimeError("offline")), \
+                patch("app.api.model_registry.GenerativeModel") as generative_model:
+            asyncio.run(registry.warmup())
+        
+        generative_model.assert_called_once()
+        self.assertIn("generative_model:", " ".join(registry._handles.keys()))
+        self.assertNotIn("embedding_model", registry._handles)
+
+if __name__ == "__main__":
+    unittest.main()
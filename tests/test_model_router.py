@@ -0,0 +1,113 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+from app.api import llm_service
+from app.api.llm_service import ModelRouter, score_lead, FAST_TIER, STRONG_TIER
+
+def chunk(text, source="a.txt", score=None):
+    result = {"text": text, "metadata": {"source": source}}
+    if score is not None:
+        result["score"] = result["vector_score"] = score
+    return result
+
+class TestModelRouter(unittest.TestCase):
+    """Test cases for routing questions between model tiers"""
+
+    def setUp(self):
+        self.router = ModelRouter(
+            {FAST_TIER: "fast-model", STRONG_TIER: "strong-model"},
+            long_question_tokens=40,
+            large_context_tokens=1000,
+            min_score_lead=0.1
+        )
+        patcher = patch.object(llm_service, "model_router", self.router)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_simple_lookup_goes_to_fast_tier(self):
+        """Test that a short question with a clearly best chunk uses the fast tier"""
+        chunks = [chunk("The office opens at 9.", "a.txt", 0.9), chunk("Parking is free.", "b.txt", 0.5)]
+        self.assertEqual(self.router.choose("When does the office open?", chunks)[0], FAST_TIER)
+
+    def test_long_question_goes_to_strong_tier(self):
+        """Test that long questions use the strong tier"""
+        self.assertEqual(self.router.choose("why " * 100, [chunk("text")])[0], STRONG_TIER)
+
+    def test_large_context_goes_to_strong_tier(self):
+        """Test that a large context uses the strong tier"""
+        chunks = [chunk("word " * 1000), chunk("word " * 1000)]
+        self.assertEqual(self.router.choose("Summarize", chunks)[0], STRONG_TIER)
+
+    def test_flat_scores_across_sources_go_to_strong_tier(self):
+        """Test that evidence spread evenly over several documents uses the strong tier"""
+        chunks = [chunk("one", "a.txt", 0.81), chunk("two", "b.txt", 0.8)]
+        self.assertEqual(self.router.choose("Compare the plans", chunks)[0], STRONG_TIER)
+        # The same spread within one document is still a lookup
+        same_source = [chunk("one", "a.txt", 0.81), chunk("two", "a.txt", 0.8)]
+        self.assertEqual(self.router.choose("Compare the plans", same_source)[0], FAST_TIER)
+
+    def test_lead_ignores_fused_scores(self):
+        """Test that chunks at neighbouring ranks in both hybrid lists are judged by vector similarity"""
+        chunks = [
+            {**chunk("one", "a.txt", 0.9), "score": 2 / 61},
+            {**chunk("two", "b.txt", 0.5), "score": 2 / 62},
+            # Found by BM25 only: no vector score
+            {"text": "three", "metadata": {"source": "c.txt"}, "score": 1 / 63}
+        ]
+        self.assertAlmostEqual(score_lead(chunks), 0.4 / 0.9)
+        self.assertEqual(self.router.choose("Which plan is cheapest?", chunks)[0], FAST_TIER)
+        self.assertIsNone(score_lead([chunk("one", score=1.0)]))
+
+    def test_single_model_disables_routing(self):
+        """Test that identical tier models always route fast without fallback"""
+        router = ModelRouter({FAST_TIER: "model", STRONG_TIER: "model"})
+        self.assertEqual(router.choose("why " * 100, [])[0], FAST_TIER)
+        self.assertIsNone(router.fallback_for(FAST_TIER))
+
+    def test_falls_back_to_other_tier_on_timeout(self):
+        """Test that a timed-out fast call is retried on the strong tier and both are recorded"""
+        generate = AsyncMock(side_effect=[asyncio.TimeoutError(), ("answer", [])])
+        with patch.object(llm_service, "generate_with_gemini", generate):
+            result = asyncio.run(llm_service.generate_routed([], [], FAST_TIER))
+
+        self.assertEqual(result, ("answer", [], "strong-model"))
+        self.assertEqual(generate.await_args_list[1].args[2], "strong-model")
+        tiers = self.router.stats()["tiers"]
+        self.assertEqual(tiers[FAST_TIER]["timeouts"], 1)
+        self.assertEqual(tiers[STRONG_TIER]["ok"], 1)
+        self.assertEqual(tiers[STRONG_TIER]["fallback_calls"], 1)
+        self.assertIsNotNone(tiers[STRONG_TIER]["p95_latency_ms"])
+
+    def test_routing_is_counted_only_when_a_model_is_called(self):
+        """Test that choosing a tier (e.g. for a cache lookup) does not count as routing"""
+        self.router.route("When does the office open?", [])
+        self.assertEqual(self.router.stats()["tiers"][FAST_TIER]["routed"], 0)
+
+        with patch.object(llm_service, "generate_with_gemini", AsyncMock(return_value=("answer", []))):
+            asyncio.run(llm_service.generate_routed([], [], FAST_TIER))
+        self.assertEqual(self.router.stats()["tiers"][FAST_TIER]["routed"], 1)
+
+    def test_stream_falls_back_only_before_first_token(self):
+        """Test that a stream failing before any text switches tiers, but not after"""
+        def streams(fail_after_text):
+            async def stream(messages, model_name):
+                if model_name == "fast-model":
+                    if fail_after_text:
+                        yield "partial"
+                    raise RuntimeError("unavailable")
+                yield "from strong"
+            return stream
+
+        async def collect():
+            return [pair async for pair in llm_service.stream_routed([], FAST_TIER)]
+
+        with patch.object(llm_service, "stream_with_gemini", streams(False)):
+            self.assertEqual(asyncio.run(collect()), [("strong-model", "from strong")])
+
+        with patch.object(llm_service, "stream_with_gemini", streams(True)):
+            with self.assertRaises(RuntimeError):
+                asyncio.run(collect())
+        self.assertEqual(self.router.stats()["tiers"][FAST_TIER]["errors"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from app.api import outbound_governor as governor_module
+from app.api.outbound_governor import (
+    AdaptiveLimiter, CircuitBreaker, OutboundGovernor, OutboundUnavailable, retry_hint
+)
+from app.utils.priority import priority, current_priority, INTERACTIVE, BULK
+
+class ApiError(Exception):
+    """Stand-in for a google.api_core error with an HTTP status"""
+
+    def __init__(self, code, details=None):
+        super().__init__(f"status {code}")
+        self.code = code
+        self.details = details or []
+
+class TestOutboundGovernor(unittest.TestCase):
+    """Test cases for outbound concurrency limits, retries and circuit breaking"""
+
+    def setUp(self):
+        self.governor = OutboundGovernor({"embedding": 4}, max_retries=3, base_delay=0.001, max_delay=5.0)
+        patcher = patch.object(governor_module.asyncio, "sleep", AsyncMock())
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_quota_errors_are_retried(self):
+        """Test that a 429 is retried until the call succeeds"""
+        fn = AsyncMock(side_effect=[ApiError(429), ApiError(503), "ok"])
+        self.assertEqual(asyncio.run(self.governor.call("embedding", fn)), "ok")
+        self.assertEqual(fn.await_count, 3)
+        self.assertEqual(self.governor.stats()["embedding"]["retries"], 2)
+
+    def test_retry_hint_is_honoured(self):
+        """Test that the wait before a retry is at least the service's retry hint"""
+        hint = SimpleNamespace(retry_delay=SimpleNamespace(seconds=2, nanos=500000000))
+        fn = AsyncMock(side_effect=[ApiError(429, [hint]), "ok"])
+        asyncio.run(self.governor.call("embedding", fn))
+        self.assertGreaterEqual(self.sleep.await_args[0][0], 2.5)
+
+    def test_retry_after_header(self):
+        """Test reading a Retry-After header from an HTTP error"""
+        error = ApiError(429)
+        error.response = SimpleNamespace(headers={"Retry-After": "7"})
+        self.assertEqual(retry_hint(error), 7.0)
+        self.assertIsNone(retry_hint(ApiError(429)))
+
+    def test_client_errors_are_not_retried(self):
+        """Test that errors other than quota and server errors are raised straight away"""
+        fn = AsyncMock(side_effect=ApiError(400))
+        with self.assertRaises(ApiError):
+            asyncio.run(self.governor.call("embedding", fn))
+        self.assertEqual(fn.await_count, 1)
+        self.assertEqual(self.governor.stats()["embedding"]["circuit"], "closed")
+
+    def test_exhausted_retries_raise_unavailable(self):
+        """Test that persistent quota errors surface as OutboundUnavailable"""
+        fn = AsyncMock(side_effect=ApiError(429))
+        with self.assertRaises(OutboundUnavailable) as raised:
+            asyncio.run(self.governor.call("embedding", fn))
+        self.assertEqual(fn.await_count, 4)
+        self.assertEqual(raised.exception.service, "embedding")
+
+    def test_open_circuit_fails_fast(self):
+        """Test that an open circuit rejects calls without making them"""
+        governor = OutboundGovernor({"llm": 4}, max_retries=0)
+        with patch.object(governor_module.time, "monotonic", return_value=1000.0):
+            for _ in range(governor_module.CIRCUIT_FAILURE_THRESHOLD):
+                with self.assertRaises(OutboundUnavailable):
+                    asyncio.run(governor.call("llm", AsyncMock(side_effect=ApiError(503))))
+
+            fn = AsyncMock(return_value="ok")
+            with self.assertRaises(OutboundUnavailable):
+                asyncio.run(governor.call("llm", fn))
+        fn.assert_not_awaited()
+        self.assertEqual(governor.stats()["llm"]["circuit"], "open")
+        self.assertEqual(governor.stats()["llm"]["rejected"], 1)
+
+    def test_circuit_closes_after_successful_probe(self):
+        """Test that the first call after the open period probes and closes the circuit"""
+        breaker = CircuitBreaker(failure_threshold=1, open_seconds=30)
+        with patch.object(governor_module.time, "monotonic", return_value=100.0):
+            breaker.record_failure()
+            self.assertIsNotNone(breaker.before_call())
+        with patch.object(governor_module.time, "monotonic", return_value=131.0):
+            self.assertIsNone(breaker.before_call())
+            # Only one probe at a time
+            self.assertIsNotNone(breaker.before_call())
+            breaker.record_success()
+            self.assertIsNone(breaker.before_call())
+        self.assertEqual(breaker.state, "closed")
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    """Test cases for the AIMD concurrency limit"""
+
+    def test_concurrency_is_capped(self):
+        """Test that no more than the limit of calls run at once"""
+        limiter = AdaptiveLimiter(max_limit=8)
+        running = []
+        peak = []
+
+        async def call():
+            await limiter.acquire()
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+            limiter.release(0.0, 0.01, False)
+
+        async def run():
+            await asyncio.gather(*[call() for _ in range(20)])
+
+        asyncio.run(run())
+        self.assertLessEqual(max(peak), int(limiter.max_limit))
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_limit_halves_once_per_congestion_event(self):
+        """Test multiplicative decrease, ignoring calls that started before the last decrease"""
+        limiter = AdaptiveLimiter(max_limit=16)
+        self.assertEqual(limiter.limit, 8)
+        limiter.running[INTERACTIVE] = 2
+        limiter.release(started=limiter._last_decrease, latency=0.1, congested=True)
+        limiter.release(started=0.0, latency=0.1, congested=True)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_limit_grows_while_saturated(self):
+        """Test additive increase when calls succeed with the limit in use"""
+        limiter = AdaptiveLimiter(max_limit=16)
+        limiter.running[INTERACTIVE] = 8
+        limiter.release(started=0.0, latency=0.1, congested=False)
+        self.assertAlmostEqual(limiter.limit, 8.125)
+
+    def test_slow_calls_count_as_congestion(self):
+        """Test that latency well above typical decreases the limit"""
+        limiter = AdaptiveLimiter(max_limit=16, latency_tolerance=3.0)
+        limiter.running[INTERACTIVE] = 2
+        limiter.release(started=0.0, latency=0.1, congested=False)
+        limiter.release(started=1.0, latency=1.0, congested=False)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_cancelled_waiter_does_not_leak_slots(self):
+        """Test that a caller cancelled while queued leaves the limiter consistent"""
+        limiter = AdaptiveLimiter(max_limit=2, min_limit=1)
+
+        async def run():
+            await limiter.acquire()
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            limiter.release(0.0, 0.01, False)
+
+        asyncio.run(run())
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.queued, 0)
+
+class TestPriorityScheduling(unittest.TestCase):
+    """Test cases for serving interactive calls ahead of bulk work"""
+
+    def grant_order(self, limiter, queued):
+        """Hold every slot, queue (level, name) waiters, then free slots one at a time"""
+        order = []
+
+        async def waiter(level, name):
+            await limiter.acquire(level)
+            order.append(name)
+
+        async def run():
+            held = int(limiter.limit)
+            for _ in range(held):
+                await limiter.acquire(INTERACTIVE)
+            tasks = []
+            for level, name in queued:
+                tasks.append(asyncio.ensure_future(waiter(level, name)))
+                await asyncio.sleep(0)
+            for _ in range(len(queued)):
+                limiter.release(0.0, 0.01, False, INTERACTIVE if limiter.running[INTERACTIVE] else BULK)
+                await asyncio.sleep(0)
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        return order
+
+    def test_interactive_goes_first(self):
+        """Test that queued interactive calls get freed slots before earlier bulk calls"""
+        limiter = AdaptiveLimiter(max_limit=2, bulk_max_wait=60)
+        order = self.grant_order(limiter, [(BULK, "bulk"), (INTERACTIVE, "question")])
+        self.assertEqual(order, ["question", "bulk"])
+
+    def test_bulk_is_capped(self):
+        """Test that bulk work only gets its share of the limit"""
+        limiter = AdaptiveLimiter(max_limit=16, bulk_share=0.25)
+
+        async def run():
+            for _ in range(2):
+                await limiter.acquire(BULK)
+            third = asyncio.ensure_future(limiter.acquire(BULK))
+            await asyncio.sleep(0)
+            # A question still starts straight away
+            await asyncio.wait_for(limiter.acquire(INTERACTIVE), 0.1)
+            started = third.done()
+            third.cancel()
+            return started
+
+        self.assertFalse(asyncio.run(run()))
+        self.assertEqual(limiter.cap(BULK), 2)
+
+    def test_starved_bulk_goes_ahead(self):
+        """Test that bulk work queued past bulk_max_wait is served before newer questions"""
+        limiter = AdaptiveLimiter(max_limit=2, bulk_max_wait=0)
+        order = self.grant_order(limiter, [(BULK, "bulk"), (INTERACTIVE, "question")])
+        self.assertEqual(order, ["bulk", "question"])
+        self.assertEqual(limiter.starvation_grants, 1)
+
+    def test_priority_context(self):
+        """Test that the priority class applies to the enclosed work and tasks it starts"""
+        async def level():
+            return current_priority()
+
+        async def run():
+            with priority(BULK):
+                inner = await asyncio.ensure_future(level())
+            return inner, current_priority()
+
+        self.assertEqual(asyncio.run(run()), (BULK, INTERACTIVE))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import unittest
+import tempfile
+from unittest.mock import patch
+import numpy as np
+from app.api.quantization import ScalarQuantizer, ProductQuantizer, quantizer_from_arrays
+from app.api.local_vector_store import LocalVectorStore, normalize_rows, QUANTIZER_FILE
+
+def make_vectors(count, dimensions=64, clusters=16, seed=0):
+    """Create clustered unit vectors"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    vectors = centers[rng.integers(0, clusters, size=count)] + 0.5 * rng.normal(size=(count, dimensions))
+    return normalize_rows(vectors.astype(np.float32))
+
+def recall(store, session_id, vectors, queries, top_k=10):
+    """Fraction of the exact top_k found by the store"""
+    found = 0
+    for query in queries:
+        exact = set(np.argsort(-(vectors @ query))[:top_k].tolist())
+        results = store.query(session_id, query.tolist(), top_k)
+        found += len(exact & {int(result["id"]) for result in results})
+    return found / (top_k * len(queries))
+
+class TestQuantizers(unittest.TestCase):
+    """Test cases for the int8 and product quantizers"""
+
+    def setUp(self):
+        self.vectors = make_vectors(2000)
+        self.query = self.vectors[3]
+
+    def test_int8_scores_match_float(self):
+        """Test that asymmetric int8 scores are close to exact scores"""
+        quantizer = ScalarQuantizer.train(self.vectors)
+        codes = quantizer.encode(self.vectors)
+
+        self.assertEqual(codes.dtype, np.int8)
+        self.assertEqual(quantizer.bytes_per_vector(), 64)
+        np.testing.assert_allclose(quantizer.score(codes, self.query), self.vectors @ self.query, atol=0.02)
+        np.testing.assert_allclose(quantizer.decode(codes), self.vectors, atol=0.01)
+
+    def test_pq_scores_match_decoded_vectors(self):
+        """Test that PQ lookup-table scores equal scores against decoded vectors"""
+        quantizer = ProductQuantizer.train(self.vectors, subvectors=16)
+        codes = quantizer.encode(self.vectors)
+
+        self.assertEqual(codes.shape, (2000, 16))
+        self.assertEqual(quantizer.bytes_per_vector(), 16)
+        np.testing.assert_allclose(
+            quantizer.score(codes, self.query), quantizer.decode(codes) @ self.query, atol=1e-4
+        )
+
+    def test_pq_subvectors_divide_dimensions(self):
+        """Test that the subvector count is reduced to a divisor of the dimensions"""
+        quantizer = ProductQuantizer.train(self.vectors[:100], subvectors=30)
+        self.assertEqual(quantizer.subvectors, 16)
+
+    def test_round_trip_arrays(self):
+        """Test that quantizers can be rebuilt from their saved arrays"""
+        for quantizer in (ScalarQuantizer.train(self.vectors), ProductQuantizer.train(self.vectors, subvectors=8)):
+            rebuilt = quantizer_from_arrays(quantizer.to_arrays())
+            np.testing.assert_array_equal(rebuilt.encode(self.vectors), quantizer.encode(self.vectors))
+
+@patch("app.api.local_vector_store.LOCAL_QUANTIZATION_MIN_VECTORS", 500)
+class TestQuantizedLocalVectorStore(unittest.TestCase):
+    """Test cases for quantized sessions in the local vector store"""
+
+    def setUp(self):
+        self.vectors = make_vectors(3000)
+        rng = np.random.default_rng(1)
+        self.queries = normalize_rows(self.vectors[:50] + 0.2 * rng.normal(size=(50, 64)).astype(np.float32))
+        self.ids = [str(i) for i in range(3000)]
+        self.texts = [f"text {i}" for i in range(3000)]
+        self.metadatas = [{"chunk_index": i} for i in range(3000)]
+
+    def fill(self, store):
+        for start in range(0, 3000, 400):
+            end = start + 400
+            store.add("s", self.ids[start:end], self.vectors[start:end],
+                      self.texts[start:end], self.metadatas[start:end])
+
+    def test_int8_reduces_memory_and_keeps_recall(self):
+        """Test that int8 sessions use a quarter of the memory with little recall loss"""
+        store = LocalVectorStore(path=None, quantization="int8")
+        self.fill(store)
+
+        self.assertEqual(store.memory_bytes(), 3000 * 64)
+        self.assertGreater(recall(store, "s", self.vectors, self.queries), 0.9)
+
+    def test_pq_with_rerank_recovers_recall(self):
+        """Test that exact re-ranking from disk lifts PQ recall"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = LocalVectorStore(path=temp_dir, quantization="pq")
+            with patch("app.api.quantization.LOCAL_PQ_SUBVECTORS", 16):
+                self.fill(store)
+            index = store._sessions["s"]
+            self.assertEqual(index.quantizer.subvectors, 16)
+            self.assertEqual(store.memory_bytes(), 3000 * 16)
+
+            reranked = recall(store, "s", self.vectors, self.queries)
+            index.float_rows = None
+            approximate = recall(store, "s", self.vectors, self.queries)
+            self.assertGreater(reranked, 0.9)
+            self.assertGreater(reranked, approximate)
+
+    def test_quantizer_is_reloaded(self):
+        """Test that a reopened store reuses the saved quantizer"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = LocalVectorStore(path=temp_dir, quantization="int8")
+            self.fill(store)
+            self.assertTrue(os.path.exists(os.path.join(store._session_dir("s"), QUANTIZER_FILE)))
+            expected = [result["id"] for result in store.query("s", self.queries[0].tolist(), 5)]
+
+            reopened = LocalVectorStore(path=temp_dir, quantization="int8")
+            results = reopened.query("s", self.queries[0].tolist(), 5)
+            self.assertEqual([result["id"] for result in results], expected)
+            np.testing.assert_array_equal(
+                reopened._sessions["s"].quantizer.low, store._sessions["s"].quantizer.low
+            )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+from app.api.query_batcher import MicroBatcher
+
+class RecordingBatchFunction:
+    """Batch function that records each batch and returns len(item) per item"""
+
+    def __init__(self, delay=0.02, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("quota exceeded")
+        return [len(item) for item in items]
+
+class TestMicroBatcher(unittest.TestCase):
+    """Test cases for the query embedding micro-batcher"""
+
+    def test_idle_item_is_dispatched_immediately(self):
+        """Test that a lone item doesn't wait for the batch window"""
+        batch_fn = RecordingBatchFunction(delay=0)
+        batcher = MicroBatcher(batch_fn, max_wait_ms=1000, max_size=8)
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            result = await batcher.submit("abc")
+            return result, loop.time() - started
+
+        result, elapsed = asyncio.run(scenario())
+        self.assertEqual(result, 3)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(batch_fn.batches, [["abc"]])
+
+    def test_concurrent_items_share_batches(self):
+        """Test that items arriving while a batch is in flight are sent together"""
+        batch_fn = RecordingBatchFunction()
+        batcher = MicroBatcher(batch_fn, max_wait_ms=50, max_size=4)
+        items = ["a" * n for n in range(1, 10)]
+
+        async def scenario():
+            return await asyncio.gather(*(batcher.submit(item) for item in items))
+
+        results = asyncio.run(scenario())
+        self.assertEqual(results, list(range(1, 10)))
+        self.assertEqual([len(batch) for batch in batch_fn.batches], [1, 4, 4])
+        stats = batcher.stats()
+        self.assertEqual((stats["batches"], stats["items"], stats["full_batches"]), (3, 9, 2))
+
+    def test_duplicates_are_sent_once(self):
+        """Test that identical queued items share one slot in the batch"""
+        batch_fn = RecordingBatchFunction()
+        batcher = MicroBatcher(batch_fn, max_wait_ms=10, max_size=8)
+
+        async def scenario():
+            return await asyncio.gather(*(batcher.submit(item) for item in ["x", "yy", "yy", "yy"]))
+
+        self.assertEqual(asyncio.run(scenario()), [1, 2, 2, 2])
+        self.assertEqual(batch_fn.batches, [["x"], ["yy"]])
+
+    def test_errors_reach_every_waiter(self):
+        """Test that a failed batch raises in each waiting caller"""
+        batcher = MicroBatcher(RecordingBatchFunction(fail=True), max_wait_ms=10, max_size=8)
+
+        async def scenario():
+            return await asyncio.gather(*(batcher.submit(item) for item in ["a", "b"]), return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+if __name__ == "__main__":
+    unittest.main()
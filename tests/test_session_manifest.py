@@ -0,0 +1,72 @@
+import unittest
+import os
+import tempfile
+import time
+from app.api.session_manifest import SessionManifest
+
+class TestSessionManifest(unittest.TestCase):
+    """Test cases for the session to chunk-id manifest"""
+    
+    def test_record_and_list_chunks(self):
+        """Test that chunk ids are tracked per session and source"""
+        manifest = SessionManifest(path=None)
+        manifest.record_chunks("a", "doc.pdf", ["1", "2"])
+        manifest.record_chunks("a", "https://example.com", ["3"])
+        manifest.record_chunks("b", "doc.pdf", ["4"])
+        
+        self.assertEqual(manifest.chunk_ids("a"), ["1", "2", "3"])
+        self.assertEqual(manifest.sources("a"), ["doc.pdf", "https://example.com"])
+        self.assertEqual(manifest.chunk_ids("missing"), [])
+        
+        manifest.drop("a")
+        self.assertEqual(manifest.chunk_ids("a"), [])
+        self.assertEqual(manifest.chunk_ids("b"), ["4"])
+    
+    def test_expired_sessions(self):
+        """Test that idle sessions are reported as expired"""
+        manifest = SessionManifest(path=None)
+        manifest.record_chunks("old", "doc.pdf", ["1"])
+        manifest.touch("new")
+        manifest._sessions["old"]["last_active"] = time.time() - 1000
+        
+        self.assertEqual(manifest.expired_sessions(ttl_seconds=500), ["old"])
+        self.assertEqual(manifest.expired_sessions(ttl_seconds=0), [])
+    
+    def test_persistence(self):
+        """Test that the manifest survives a restart"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "manifest.json")
+            SessionManifest(path=path).record_chunks("a", "doc.pdf", ["1", "2"])
+            
+            self.assertEqual(SessionManifest(path=path).chunk_ids("a"), ["1", "2"])
+
+    def test_replace_source(self):
+        """Test that a re-ingest replaces the source's chunk map and fingerprint"""
+        manifest = SessionManifest(path=None)
+        manifest.record_chunks("a", "doc.pdf", ["1", "2"], ["h1", "h2"])
+        manifest.replace_source("a", "doc.pdf", "fp", {"h1": ["1"], "h3": ["3"]})
+        
+        self.assertEqual(manifest.source_chunks("a", "doc.pdf"), {"h1": ["1"], "h3": ["3"]})
+        self.assertEqual(manifest.source_fingerprint("a", "doc.pdf"), "fp")
+        self.assertEqual(manifest.chunk_ids("a"), ["1", "3"])
+        self.assertIsNone(manifest.source_fingerprint("a", "other.pdf"))
+        self.assertEqual(manifest.source_chunks("missing", "doc.pdf"), {})
+    
+    def test_crawl_pages(self):
+        """Test that page sources are listed by the crawl that found them and can be dropped"""
+        manifest = SessionManifest(path=None)
+        manifest.replace_source("a", "https://example.com", "fp1", {"h1": ["1"]}, crawl="https://example.com")
+        manifest.replace_source("a", "https://example.com/next", "fp2", {"h2": ["2"]}, crawl="https://example.com")
+        manifest.replace_source("a", "doc.pdf", "fp3", {"h3": ["3"]})
+        
+        self.assertEqual(
+            manifest.crawl_pages("a", "https://example.com"),
+            {"https://example.com": "fp1", "https://example.com/next": "fp2"}
+        )
+        manifest.drop_source("a", "https://example.com/next")
+        self.assertEqual(manifest.crawl_pages("a", "https://example.com"), {"https://example.com": "fp1"})
+        self.assertEqual(manifest.chunk_ids("a"), ["1", "3"])
+        self.assertEqual(manifest.crawl_pages("missing", "https://example.com"), {})
+    
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from app.api import vector_store
+from app.api.session_snapshot import SessionSnapshot, write_snapshot, read_snapshot
+from app.api.local_vector_store import LocalVectorStore
+from app.api.session_manifest import SessionManifest
+from app.api.bm25_index import BM25Index
+
+def make_snapshot(count=5, dimensions=4, session_id="source-session"):
+    rng = np.random.default_rng(0)
+    ids = [f"chunk-{i}" for i in range(count)]
+    return SessionSnapshot(
+        session_id,
+        vector_store.EMBEDDING_MODEL,
+        ids,
+        rng.normal(size=(count, dimensions)).astype(np.float32),
+        [f"text {i} – ünïcode" for i in range(count)],
+        [{"source": "doc.txt", "chunk_index": i, "session_id": session_id} for i in range(count)],
+        {"doc.txt": {"fingerprint": "fp", "chunks": {f"h{i}": [ids[i]] for i in range(count)}}}
+    )
+
+class TestSessionSnapshot(unittest.TestCase):
+    """Test cases for session snapshot files and their import into the vector store"""
+    
+    def test_round_trip_memory_maps_embeddings(self):
+        """Test that a written snapshot reads back unchanged with memory-mapped embeddings"""
+        snapshot = make_snapshot()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "session.npz")
+            write_snapshot(snapshot, path)
+            loaded = read_snapshot(path)
+            
+            self.assertIsInstance(loaded.embeddings, np.memmap)
+            np.testing.assert_array_equal(loaded.embeddings, snapshot.embeddings)
+            self.assertEqual((loaded.ids, loaded.texts, loaded.metadatas), (snapshot.ids, snapshot.texts, snapshot.metadatas))
+            self.assertEqual((loaded.session_id, loaded.model, loaded.sources), ("source-session", snapshot.model, snapshot.sources))
+            del loaded
+    
+    def test_rejects_other_files(self):
+        """Test that files that aren't snapshots raise ValueError"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "notes.npz")
+            with open(path, "wb") as f:
+                f.write(b"not a snapshot")
+            with self.assertRaises(ValueError):
+                read_snapshot(path)
+    
+    def test_export_and_import_into_another_session(self):
+        """Test that a session is rehydrated elsewhere without embedding anything"""
+        store = LocalVectorStore(path=None)
+        manifest = SessionManifest(path=None)
+        with patch.object(vector_store, "VECTOR_DB_TYPE", "local"), \
+                patch.object(vector_store, "local_vector_store", store), \
+                patch.object(vector_store, "session_manifest", manifest), \
+                patch.object(vector_store, "bm25_index", BM25Index(path=None)), \
+                patch.object(vector_store, "generate_embeddings_batch") as embed:
+            imported = asyncio.run(vector_store.import_session(make_snapshot(), "copy"))
+            exported = asyncio.run(vector_store.export_session("copy"))
+        
+        embed.assert_not_called()
+        self.assertEqual(imported, 5)
+        self.assertEqual(exported.texts, make_snapshot().texts)
+        self.assertNotIn("chunk-0", exported.ids)
+        self.assertTrue(all(metadata["session_id"] == "copy" for metadata in exported.metadatas))
+        self.assertEqual(sorted(manifest.chunk_ids("copy")), sorted(exported.ids))
+        self.assertEqual(manifest.source_fingerprint("copy", "doc.txt"), "fp")
+        self.assertEqual(store.query("copy", make_snapshot().embeddings[3].tolist(), 1)[0]["text"], exported.texts[3])
+    
+    def test_import_rejects_other_embedding_model(self):
+        """Test that snapshots embedded with another model are refused"""
+        snapshot = make_snapshot()
+        snapshot.model = "some-other-model"
+        with self.assertRaises(ValueError):
+            asyncio.run(vector_store.import_session(snapshot))
+
+if __name__ == "__main__":
+    unittest.main()
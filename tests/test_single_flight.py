@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+from app.utils.single_flight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for sharing identical in-flight calls"""
+
+    def setUp(self):
+        self.flight = SingleFlight("test")
+        self.started = 0
+        self.cancelled = 0
+
+    async def work(self, value, seconds=0.05):
+        self.started += 1
+        try:
+            await asyncio.sleep(seconds)
+            return value
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+    def test_concurrent_calls_run_once(self):
+        """Test that concurrent callers with the same key share one execution"""
+        async def run():
+            return await asyncio.gather(*[self.flight.do("q", lambda: self.work("answer")) for _ in range(5)])
+
+        self.assertEqual(asyncio.run(run()), ["answer"] * 5)
+        self.assertEqual(self.started, 1)
+
+        stats = self.flight.stats()
+        self.assertEqual(stats["calls"], 5)
+        self.assertEqual(stats["executions"], 1)
+        self.assertEqual(stats["coalescing_ratio"], 0.8)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_different_keys_and_later_calls_run_separately(self):
+        """Test that only calls overlapping in time with the same key are shared"""
+        async def run():
+            await asyncio.gather(self.flight.do("a", lambda: self.work(1)), self.flight.do("b", lambda: self.work(2)))
+            await self.flight.do("a", lambda: self.work(1))
+
+        asyncio.run(run())
+        self.assertEqual(self.started, 3)
+
+    def test_cancelled_caller_does_not_cancel_others(self):
+        """Test that one caller going away leaves the shared call running for the rest"""
+        async def run():
+            first = asyncio.ensure_future(self.flight.do("q", lambda: self.work("answer")))
+            second = asyncio.ensure_future(self.flight.do("q", lambda: self.work("answer")))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second, first.cancelled()
+
+        self.assertEqual(asyncio.run(run()), ("answer", True))
+        self.assertEqual(self.cancelled, 0)
+
+    def test_call_is_cancelled_when_every_caller_leaves(self):
+        """Test that the shared call stops once nobody is waiting for it"""
+        async def run():
+            callers = [asyncio.ensure_future(self.flight.do("q", lambda: self.work("answer", 10))) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            for caller in callers:
+                caller.cancel()
+            await asyncio.gather(*callers, return_exceptions=True)
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual(self.cancelled, 1)
+        self.assertEqual(self.flight.stats()["abandoned"], 1)
+        self.assertEqual(self.flight.stats()["in_flight"], 0)
+
+    def test_exceptions_are_shared(self):
+        """Test that every caller sees the failure of the shared call"""
+        async def fail():
+            self.started += 1
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        async def run():
+            return await asyncio.gather(*[self.flight.do("q", fail) for _ in range(3)], return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(self.started, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import json
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+from app import main
+from app.api import llm_service
+from app.api.conversation_memory import ConversationMemory
+from app.api.answer_cache import ExactAnswerCache
+
+class FakeResponse:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("Response has no text parts")
+        return self._text
+
+async def fake_stream(texts):
+    for text in texts:
+        yield FakeResponse(text)
+
+def parse_events(body):
+    """Split an SSE body into (event, data) pairs"""
+    events = []
+    for raw in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in raw.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+class TestStreaming(unittest.TestCase):
+    """Test cases for streamed answers"""
+    
+    def test_stream_with_gemini_skips_chunks_without_text(self):
+        """Test that streamed chunk texts are yielded in order"""
+        model = MagicMock()
+        model.generate_content_async = AsyncMock(return_value=fake_stream(["Hel", "lo", None]))
+        
+        async def collect():
+            return [text async for text in llm_service.stream_with_gemini([{"role": "user", "content": "hi"}])]
+        
+        with patch.object(llm_service.model_registry, "get_generative_model", return_value=model):
+            self.assertEqual(asyncio.run(collect()), ["Hel", "lo"])
+        self.assertTrue(model.generate_content_async.call_args.kwargs["stream"])
+    
+    def test_ask_stream_sends_sources_tokens_then_done(self):
+        """Test the event order of /ask/stream and that history is recorded on completion"""
+        chunks = [{"text": "Paris is the capital", "metadata": {"source": "facts.txt"}}]
+        
+        async def answer(messages, tier):
+            for text in ["It is ", "Paris."]:
+                yield "model", text
+        
+        with patch.object(main, "generate_embeddings", AsyncMock(return_value=[1.0, 0.0])), \
+                patch.object(main, "query_vector_store", AsyncMock(return_value=chunks)), \
+                patch.object(main, "stream_routed", answer), \
+                patch.object(main, "semantic_answer_cache", MagicMock(lookup=MagicMock(return_value=None))), \
+                patch.object(main, "exact_answer_cache", ExactAnswerCache(path=None)), \
+                patch.object(main, "conversation_store", ConversationMemory(AsyncMock())) as conversation_store:
+            response = TestClient(main.app).post("/ask/stream", data={"question": "Capital?", "session_id": "s"})
+            history = conversation_store.history("s")
+        
+        events = parse_events(response.text)
+        self.assertEqual(response.headers["content-type"].split(";")[0], "text/event-stream")
+        self.assertEqual([event for event, _ in events], ["sources", "token", "token", "done"])
+        self.assertEqual(events[0][1][0]["source"], "facts.txt")
+        self.assertEqual(events[-1][1], {"answer": "It is Paris."})
+        self.assertEqual(history[-1], {"role": "assistant", "content": "It is Paris."})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import asyncio
+import hashlib
+import unittest
+from unittest.mock import MagicMock, patch
+from app.api.url_crawler import crawl_url
+from app.utils.executors import shutdown_executors
+
+PAGES = {
+    "https://example.com": "<html><body><p>home page</p><a href='/next'>next</a></body></html>",
+    "https://example.com/next": "<html><body><p>next page</p></body></html>"
+}
+
+def fetch(url, **kwargs):
+    response = MagicMock()
+    response.headers = {"Content-Type": "text/html"}
+    response.text = PAGES[url]
+    response.content = PAGES[url].encode("utf-8")
+    return response
+
+def fingerprint(url):
+    return hashlib.sha256(PAGES[url].encode("utf-8")).hexdigest()
+
+class TestUrlCrawler(unittest.TestCase):
+    """Test cases for crawling pages with their fingerprints"""
+
+    def tearDown(self):
+        shutdown_executors()
+
+    def test_unchanged_pages_are_not_chunked(self):
+        """Test that pages matching their known fingerprint are still followed but yield no chunks"""
+        with patch("app.api.url_crawler.requests.get", side_effect=fetch):
+            first = asyncio.run(crawl_url("https://example.com", 1))
+            known = {"https://example.com": fingerprint("https://example.com")}
+            again = asyncio.run(crawl_url("https://example.com", 1, known))
+
+        self.assertEqual([page["url"] for page in first], list(PAGES))
+        self.assertEqual([page["fingerprint"] for page in first], [fingerprint(url) for url in PAGES])
+        self.assertIn("home page", first[0]["chunks"][0]["text"])
+
+        self.assertEqual([page["url"] for page in again], list(PAGES))
+        self.assertIsNone(again[0]["chunks"])
+        self.assertIn("next page", again[1]["chunks"][0]["text"])
+
+if __name__ == "__main__":
+    unittest.main()
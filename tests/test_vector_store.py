@@ -0,0 +1,330 @@
+import unittest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.api import vector_store
+from app.api.vector_store import (
+    plan_embedding_batches,
+    generate_embeddings_batch,
+    plan_store_batches,
+    store_batch,
+    adaptive_overfetch
+)
+from app.api.embedding_cache import EmbeddingCache
+from app.api.outbound_governor import OutboundGovernor
+from app.api.local_vector_store import LocalVectorStore
+from app.api.session_manifest import SessionManifest
+
+class ApiError(Exception):
+    """Stand-in for a google.api_core error with an HTTP status"""
+    
+    def __init__(self, code):
+        super().__init__(f"status {code}")
+        self.code = code
+
+def make_embedding_model(fail_on=None):
+    """Create a fake embedding model that embeds each text as [len(text)]"""
+    model = MagicMock()
+    
+    def get_embeddings(texts):
+        if fail_on and any(fail_on in text for text in texts):
+            raise ApiError(400)
+        return [MagicMock(values=[float(len(text))]) for text in texts]
+    
+    model.get_embeddings_async = AsyncMock(side_effect=get_embeddings)
+    return model
+
+class TestEmbeddingBatches(unittest.TestCase):
+    """Test cases for batched embedding generation"""
+    
+    def setUp(self):
+        # Use a fresh in-memory cache so tests don't see each other's embeddings
+        self.cache = EmbeddingCache(path=None)
+        patcher = patch.object(vector_store, "embedding_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_plan_embedding_batches_by_count(self):
+        """Test that batches are bounded by item count"""
+        batches = plan_embedding_batches(["a"] * 5, max_items=2, max_tokens=1000)
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+    
+    def test_plan_embedding_batches_by_tokens(self):
+        """Test that batches are bounded by estimated tokens"""
+        texts = ["x" * 40, "x" * 40, "x" * 400, "x" * 4]
+        batches = plan_embedding_batches(texts, max_items=10, max_tokens=25)
+        self.assertEqual(batches, [[0, 1], [2], [3]])
+    
+    def test_generate_embeddings_batch_keeps_order(self):
+        """Test that embeddings come back aligned with the input texts"""
+        model = make_embedding_model()
+        texts = ["a" * n for n in range(1, 8)]
+        
+        with patch.object(vector_store.model_registry, "get_embedding_model", return_value=model), \
+                patch.object(vector_store, "EMBEDDING_BATCH_SIZE", 2):
+            embeddings, errors = asyncio.run(generate_embeddings_batch(texts, max_concurrency=3))
+        
+        self.assertEqual(errors, {})
+        self.assertEqual(embeddings, [[float(n)] for n in range(1, 8)])
+        self.assertEqual(model.get_embeddings_async.call_count, 4)
+    
+    def test_generate_embeddings_batch_reports_failed_chunks(self):
+        """Test that a failing chunk is isolated and reported by index"""
+        model = make_embedding_model(fail_on="bad")
+        texts = ["one", "two", "bad", "four"]
+        
+        with patch.object(vector_store.model_registry, "get_embedding_model", return_value=model):
+            embeddings, errors = asyncio.run(generate_embeddings_batch(texts))
+        
+        self.assertEqual(list(errors.keys()), [2])
+        self.assertIsNone(embeddings[2])
+        self.assertEqual(embeddings[3], [4.0])
+    
+    def test_generate_embeddings_batch_fails_fast_on_other_errors(self):
+        """Test that a batch failing for reasons other than its input is not split"""
+        model = MagicMock()
+        model.get_embeddings_async = AsyncMock(side_effect=ApiError(403))
+        texts = ["one", "two", "three", "four"]
+        
+        with patch.object(vector_store.model_registry, "get_embedding_model", return_value=model):
+            embeddings, errors = asyncio.run(generate_embeddings_batch(texts))
+        
+        self.assertEqual(sorted(errors.keys()), [0, 1, 2, 3])
+        self.assertEqual(model.get_embeddings_async.await_count, 1)
+
+    def test_generate_embeddings_batch_uses_cache(self):
+        """Test that cached and duplicate texts are not embedded again"""
+        model = make_embedding_model()
+        self.cache.put("cached", [42.0])
+        
+        with patch.object(vector_store.model_registry, "get_embedding_model", return_value=model):
+            embeddings, errors = asyncio.run(generate_embeddings_batch(["cached", "new", "new"]))
+        
+        self.assertEqual(embeddings, [[42.0], [3.0], [3.0]])
+        model.get_embeddings_async.assert_called_once_with(["new"])
+        self.assertEqual(self.cache.get("new"), [3.0])
+    
+    def test_only_stale_handle_errors_invalidate_the_model(self):
+        """Test that the cached model is dropped on a 404 but kept on other failures"""
+        for code, invalidated in [(404, True), (400, False)]:
+            model = MagicMock()
+            model.get_embeddings_async = AsyncMock(side_effect=ApiError(code))
+            
+            with patch.object(vector_store.model_registry, "get_embedding_model", return_value=model), \
+                    patch.object(vector_store.model_registry, "invalidate") as invalidate:
+                asyncio.run(generate_embeddings_batch([f"text {code}"]))
+            
+            self.assertEqual(invalidate.called, invalidated)
+
+def make_items(count, session_id="session", text="text"):
+    """Create vector items ready for store_batch"""
+    return [
+        {"id": f"chunk-{i}", "text": text, "embedding": [1.0, float(i)], "metadata": {"session_id": session_id}}
+        for i in range(count)
+    ]
+
+class TestStoreBatches(unittest.TestCase):
+    """Test cases for bulk vector writes"""
+    
+    def test_plan_store_batches_flushes_partial_batch(self):
+        """Test that batches are bounded by count and the remainder is kept"""
+        batches = plan_store_batches(make_items(7), max_items=3)
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+    
+    def test_plan_store_batches_by_size(self):
+        """Test that batches are bounded by estimated payload size"""
+        items = make_items(4, text="x" * 1000)
+        batches = plan_store_batches(items, max_items=100, max_bytes=2500)
+        self.assertEqual([len(batch) for batch in batches], [2, 2])
+    
+    def test_store_batch_retries_failed_batch(self):
+        """Test that a transiently failing batch write is retried and items are written once per batch"""
+        calls = []
+        
+        async def flaky_writer(batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise ApiError(503)
+        
+        with patch.object(vector_store, "VECTOR_DB_TYPE", "local"), \
+                patch.object(vector_store, "store_batch_in_local", flaky_writer), \
+                patch.object(vector_store, "outbound_governor", OutboundGovernor(base_delay=0)), \
+                patch.dict(vector_store.STORE_BATCH_MAX_ITEMS, {"local": 4}):
+            asyncio.run(store_batch(make_items(10)))
+        
+        self.assertEqual(calls, [4, 4, 4, 2])
+    
+    def test_store_batch_does_not_retry_rejected_batch(self):
+        """Test that a write rejected as invalid fails without retrying"""
+        writer = AsyncMock(side_effect=ApiError(400))
+        
+        with patch.object(vector_store, "VECTOR_DB_TYPE", "local"), \
+                patch.object(vector_store, "store_batch_in_local", writer), \
+                patch.object(vector_store, "outbound_governor", OutboundGovernor(base_delay=0)):
+            with self.assertRaises(ApiError):
+                asyncio.run(store_batch(make_items(3)))
+        
+        self.assertEqual(writer.await_count, 1)
+
+class TestSessionDeletion(unittest.TestCase):
+    """Test cases for deleting a session's vectors"""
+    
+    def setUp(self):
+        self.store = LocalVectorStore(path=None)
+        self.manifest = SessionManifest(path=None)
+        for target, value in [
+            ("local_vector_store", self.store),
+            ("session_manifest", self.manifest),
+            ("embedding_cache", EmbeddingCache(path=None)),
+            ("VECTOR_DB_TYPE", "local")
+        ]:
+            patcher = patch.object(vector_store, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_add_records_manifest_and_delete_removes_vectors(self):
+        """Test that ingested chunks are tracked and removed with the session"""
+        model = make_embedding_model()
+        chunks = [{"text": f"chunk {i}", "metadata": {"source": "doc.txt"}} for i in range(3)]
+        
+        with patch.object(vector_store.model_registry, "get_embedding_model", return_value=model):
+            asyncio.run(vector_store.add_to_vector_store(chunks, "session", source="doc.txt"))
+        
+        self.assertEqual(len(self.manifest.chunk_ids("session")), 3)
+        self.assertEqual(self.store.count("session"), 3)
+        
+        removed = asyncio.run(vector_store.delete_vectors_for_session("session"))
+        
+        self.assertEqual(removed, 3)
+        self.assertEqual(self.store.count("session"), 0)
+        self.assertEqual(self.manifest.chunk_ids("session"), [])
+    
+    def test_reingest_only_writes_changed_chunks(self):
+        """Test that a re-ingest embeds new chunks, keeps unchanged ones and drops stale ones"""
+        model = make_embedding_model()
+        
+        def chunks(texts):
+            return [{"text": text, "metadata": {"source": "doc.txt"}} for text in texts]
+        
+        with patch.object(vector_store.model_registry, "get_embedding_model", return_value=model), \
+                patch.object(vector_store, "bm25_index", MagicMock()):
+            asyncio.run(vector_store.add_to_vector_store(chunks(["a", "bb", "bb"]), "session", "doc.txt", "fp1"))
+            kept_ids = set(self.manifest.source_chunks("session", "doc.txt")[vector_store.chunk_hash(chunks(["bb"])[0])])
+            model.get_embeddings_async.reset_mock()
+            
+            stats = asyncio.run(vector_store.add_to_vector_store(chunks(["bb", "bb", "cccc"]), "session", "doc.txt", "fp2"))
+        
+        self.assertEqual(stats, {"added": 1, "unchanged": 2, "removed": 1})
+        self.assertEqual(model.get_embeddings_async.call_args.args[0], ["cccc"])
+        self.assertEqual(self.store.count("session"), 3)
+        self.assertTrue(kept_ids <= set(self.manifest.chunk_ids("session")))
+        self.assertEqual(self.manifest.source_fingerprint("session", "doc.txt"), "fp2")
+    
+    def test_vertex_deletes_in_batches(self):
+        """Test that Vertex datapoints are removed in batches of DELETE_BATCH_SIZE"""
+        index = MagicMock()
+        self.manifest.record_chunks("session", "doc.pdf", [str(i) for i in range(5)])
+        
+        with patch.object(vector_store, "VECTOR_DB_TYPE", "vertex_ai"), \
+                patch.object(vector_store, "DELETE_BATCH_SIZE", 2), \
+                patch.object(vector_store.model_registry, "get_index", return_value=index):
+            removed = asyncio.run(vector_store.delete_vectors_for_session("session"))
+        
+        self.assertEqual(removed, 5)
+        batches = [call.kwargs["datapoint_ids"] for call in index.remove_datapoints.call_args_list]
+        self.assertEqual(batches, [["0", "1"], ["2", "3"], ["4"]])
+
+class TestQueryDiversification(unittest.TestCase):
+    """Test cases for MMR and duplicate suppression in query_vector_store"""
+    
+    def setUp(self):
+        for target, value in [
+            ("local_vector_store", LocalVectorStore(path=None)),
+            ("session_manifest", SessionManifest(path=None)),
+            ("embedding_cache", EmbeddingCache(path=None)),
+            ("VECTOR_DB_TYPE", "local"),
+            ("HYBRID_SEARCH_ENABLED", False)
+        ]:
+            patcher = patch.object(vector_store, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        # Embed each text by its topic word, so texts on one topic are near-identical
+        topics = {"alpha": [1.0, 0.0, 0.0], "beta": [0.6, 0.8, 0.0], "gamma": [0.6, 0.0, 0.8]}
+        self.model = MagicMock()
+        self.model.get_embeddings_async = AsyncMock(
+            side_effect=lambda texts: [MagicMock(values=topics[text.split()[0]]) for text in texts]
+        )
+    
+    def test_duplicates_are_dropped_from_context(self):
+        """Test that repeated chunks are suppressed and other topics fill the context"""
+        chunks = [
+            {"text": "alpha " + " ".join(f"w{i}" for i in range(50)), "metadata": {"source": "a.txt"}},
+            {"text": "alpha " + " ".join(f"w{i}" for i in range(50)), "metadata": {"source": "a-copy.txt"}},
+            {"text": "alpha " + " ".join(f"x{i}" for i in range(50)), "metadata": {"source": "a2.txt"}},
+            {"text": "beta " + " ".join(f"y{i}" for i in range(50)), "metadata": {"source": "b.txt"}},
+            {"text": "gamma " + " ".join(f"z{i}" for i in range(50)), "metadata": {"source": "c.txt"}},
+        ]
+        
+        with patch.object(vector_store.model_registry, "get_embedding_model", return_value=self.model):
+            asyncio.run(vector_store.add_to_vector_store(chunks, "session", source="docs"))
+            # Redundancy is measured on the stored vectors, not by embedding the chunks again
+            with patch.object(vector_store, "generate_embeddings_batch") as embed_batch:
+                results = asyncio.run(vector_store.query_vector_store("alpha question", "session", top_k=3))
+        
+        embed_batch.assert_not_called()
+        sources = [result["metadata"]["source"] for result in results]
+        self.assertIn(sources[0], ("a.txt", "a-copy.txt", "a2.txt"))
+        self.assertEqual(sorted(sources[1:]), ["b.txt", "c.txt"])
+        self.assertTrue(all("embedding" not in result for result in results))
+
+class TestAdaptiveOverfetch(unittest.TestCase):
+    """Test cases for session filtering on backends without restricts"""
+    
+    def make_fetch(self, sessions):
+        """Create a fetch function over results ranked in the given session order"""
+        requested = []
+        
+        async def fetch(num_candidates):
+            requested.append(num_candidates)
+            return [
+                {"id": str(i), "metadata": {"session_id": session}}
+                for i, session in enumerate(sessions[:num_candidates])
+            ]
+        
+        return fetch, requested
+    
+    def test_widens_until_top_k_found(self):
+        """Test that the search widens until the session has top_k results"""
+        sessions = ["other"] * 50 + ["mine"] * 10
+        fetch, requested = self.make_fetch(sessions)
+        
+        results = asyncio.run(adaptive_overfetch(fetch, "mine", 5, initial_factor=2, max_candidates=1000))
+        
+        self.assertEqual([result["id"] for result in results], ["50", "51", "52", "53", "54"])
+        self.assertEqual(requested, [10, 40, 160])
+    
+    def test_stops_when_index_exhausted(self):
+        """Test that a small index isn't queried again once every candidate was returned"""
+        fetch, requested = self.make_fetch(["other", "mine", "other"])
+        
+        results = asyncio.run(adaptive_overfetch(fetch, "mine", 5, initial_factor=4))
+        
+        self.assertEqual(len(results), 1)
+        self.assertEqual(requested, [20])
+    
+    def test_vertex_query_uses_session_restricts(self):
+        """Test that Vertex queries push the session filter into find_neighbors"""
+        endpoint = MagicMock()
+        endpoint.find_neighbors.return_value = [[MagicMock(id="chunk-1", distance=0.9, metadata={"session_id": "mine"})]]
+        
+        with patch.object(vector_store.model_registry, "get_index_endpoint", return_value=endpoint), \
+                patch.dict("os.environ", {"VECTOR_INDEX_NAME": "index"}):
+            results = asyncio.run(vector_store.query_vertex_ai([0.1, 0.2], "mine", 5))
+        
+        self.assertEqual(results[0]["id"], "chunk-1")
+        kwargs = endpoint.find_neighbors.call_args.kwargs
+        self.assertEqual(kwargs["num_neighbors"], 5)
+        self.assertEqual(kwargs["filter"][0].allow_tokens, ["mine"])
+
+if __name__ == "__main__":
+    unittest.main()